@@ -0,0 +1,25 @@
+"""Index solves.challenge_id
+
+Revision ID: 20251020
+Revises: 20250917
+Create Date: 2025-10-20 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20251020'
+down_revision = '20250917'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Dynamic scoring counts and re-values solves per challenge on every solve.
+    op.create_index(op.f('ix_solves_challenge_id'), 'solves', ['challenge_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_solves_challenge_id'), table_name='solves')
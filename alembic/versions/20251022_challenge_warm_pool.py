@@ -0,0 +1,26 @@
+"""Add warm pool watermarks to challenges
+
+Revision ID: 20251022
+Revises: 20251021
+Create Date: 2025-10-22 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20251022'
+down_revision = '20251021'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('challenges', sa.Column('warm_pool_low', sa.Integer(), nullable=True))
+    op.add_column('challenges', sa.Column('warm_pool_high', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('challenges', 'warm_pool_high')
+    op.drop_column('challenges', 'warm_pool_low')
@@ -0,0 +1,25 @@
+"""Index dynamic_challenge_instances.expires_at
+
+Revision ID: 20251023
+Revises: 20251022
+Create Date: 2025-10-23 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20251023'
+down_revision = '20251022'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # The instance reaper scans for expired rows in expires_at order.
+    op.create_index(op.f('ix_dynamic_challenge_instances_expires_at'), 'dynamic_challenge_instances', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_dynamic_challenge_instances_expires_at'), table_name='dynamic_challenge_instances')
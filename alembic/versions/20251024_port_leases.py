@@ -0,0 +1,29 @@
+"""Add port_leases table
+
+Revision ID: 20251024
+Revises: 20251023
+Create Date: 2025-10-24 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20251024'
+down_revision = '20251023'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('port_leases',
+    sa.Column('host', sa.String(), nullable=False),
+    sa.Column('port', sa.Integer(), nullable=False),
+    sa.Column('leased_at', sa.DateTime(timezone=False), nullable=False),
+    sa.PrimaryKeyConstraint('host', 'port')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('port_leases')
@@ -0,0 +1,43 @@
+"""Add instance_jobs table
+
+Revision ID: 20251025
+Revises: 20251024
+Create Date: 2025-10-25 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20251025'
+down_revision = '20251024'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('instance_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('challenge_id', sa.Integer(), nullable=False),
+    sa.Column('instance_id', sa.Integer(), nullable=True),
+    sa.Column('action', sa.String(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=False), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=False), nullable=False),
+    sa.ForeignKeyConstraint(['challenge_id'], ['challenges.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_instance_jobs_id'), 'instance_jobs', ['id'], unique=False)
+    op.create_index(op.f('ix_instance_jobs_user_id'), 'instance_jobs', ['user_id'], unique=False)
+    op.create_index(op.f('ix_instance_jobs_status'), 'instance_jobs', ['status'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_instance_jobs_status'), table_name='instance_jobs')
+    op.drop_index(op.f('ix_instance_jobs_user_id'), table_name='instance_jobs')
+    op.drop_index(op.f('ix_instance_jobs_id'), table_name='instance_jobs')
+    op.drop_table('instance_jobs')
@@ -0,0 +1,25 @@
+"""Index notifications by (user_id, id)
+
+Revision ID: 20251026
+Revises: 20251025
+Create Date: 2025-10-26 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20251026'
+down_revision = '20251025'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Notification streams resume with "user_id = ? AND id > ?".
+    op.create_index('ix_notifications_user_id_id', 'notifications', ['user_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_notifications_user_id_id', table_name='notifications')
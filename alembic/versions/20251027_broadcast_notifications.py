@@ -0,0 +1,42 @@
+"""Add broadcast_notifications and broadcast_reads tables
+
+Revision ID: 20251027
+Revises: 20251026
+Create Date: 2025-10-27 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20251027'
+down_revision = '20251026'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('broadcast_notifications',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(), nullable=False),
+    sa.Column('body', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_broadcast_notifications_id'), 'broadcast_notifications', ['id'], unique=False)
+    op.create_index(op.f('ix_broadcast_notifications_created_at'), 'broadcast_notifications', ['created_at'], unique=False)
+    op.create_table('broadcast_reads',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('broadcast_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['broadcast_id'], ['broadcast_notifications.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'broadcast_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('broadcast_reads')
+    op.drop_index(op.f('ix_broadcast_notifications_created_at'), table_name='broadcast_notifications')
+    op.drop_index(op.f('ix_broadcast_notifications_id'), table_name='broadcast_notifications')
+    op.drop_table('broadcast_notifications')
@@ -0,0 +1,29 @@
+"""Index audit_logs and users for keyset pagination
+
+Revision ID: 20251028
+Revises: 20251027
+Create Date: 2025-10-28 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20251028'
+down_revision = '20251027'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Audit log pages continue with "(timestamp, id) < (?, ?)" newest first,
+    # pending users with "is_active = false AND id > ?". Notifications page on
+    # ix_notifications_user_id_id, teams and broadcasts on their primary keys.
+    op.create_index('ix_audit_logs_timestamp_id', 'audit_logs', ['timestamp', 'id'], unique=False)
+    op.create_index('ix_users_is_active_id', 'users', ['is_active', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_is_active_id', table_name='users')
+    op.drop_index('ix_audit_logs_timestamp_id', table_name='audit_logs')
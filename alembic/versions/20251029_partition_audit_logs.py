@@ -0,0 +1,93 @@
+"""Partition audit_logs by day (PostgreSQL only)
+
+Revision ID: 20251029
+Revises: 20251028
+Create Date: 2025-10-29 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20251029'
+down_revision = '20251028'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        # Other databases keep a plain table; retention deletes rows instead.
+        return
+    # The partition key has to be part of the primary key, hence (id, timestamp).
+    op.execute('''
+        CREATE TABLE audit_logs_partitioned (
+            id integer NOT NULL DEFAULT nextval('audit_logs_id_seq'),
+            user_id integer REFERENCES users (id),
+            action varchar NOT NULL,
+            details json,
+            "timestamp" timestamp with time zone NOT NULL DEFAULT now(),
+            PRIMARY KEY (id, "timestamp")
+        ) PARTITION BY RANGE ("timestamp")
+    ''')
+    op.execute('CREATE TABLE audit_logs_default PARTITION OF audit_logs_partitioned DEFAULT')
+    # One partition per UTC day from the oldest row to a week ahead; the names
+    # must match app.audit_archive.partition_name.
+    op.execute('''
+        DO $$
+        DECLARE
+            day date;
+        BEGIN
+            FOR day IN
+                SELECT generate_series(
+                    COALESCE((SELECT min("timestamp") AT TIME ZONE 'UTC' FROM audit_logs), now() AT TIME ZONE 'UTC')::date,
+                    (now() AT TIME ZONE 'UTC')::date + 7,
+                    interval '1 day'
+                )::date
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF audit_logs_partitioned FOR VALUES FROM (%L) TO (%L)',
+                    'audit_logs_p' || to_char(day, 'YYYYMMDD'),
+                    day::text || ' 00:00:00+00',
+                    (day + 1)::text || ' 00:00:00+00'
+                );
+            END LOOP;
+        END $$
+    ''')
+    op.execute('''
+        INSERT INTO audit_logs_partitioned (id, user_id, action, details, "timestamp")
+        SELECT id, user_id, action, details, COALESCE("timestamp", now()) FROM audit_logs
+    ''')
+    op.execute('ALTER SEQUENCE audit_logs_id_seq OWNED BY NONE')
+    op.drop_table('audit_logs')
+    op.rename_table('audit_logs_partitioned', 'audit_logs')
+    op.execute('ALTER SEQUENCE audit_logs_id_seq OWNED BY audit_logs.id')
+    op.execute('ALTER TABLE audit_logs RENAME CONSTRAINT audit_logs_partitioned_pkey TO audit_logs_pkey')
+    op.create_index(op.f('ix_audit_logs_id'), 'audit_logs', ['id'], unique=False)
+    op.create_index(op.f('ix_audit_logs_action'), 'audit_logs', ['action'], unique=False)
+    op.create_index('ix_audit_logs_timestamp_id', 'audit_logs', ['timestamp', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('''
+        CREATE TABLE audit_logs_plain (
+            id integer NOT NULL DEFAULT nextval('audit_logs_id_seq') PRIMARY KEY,
+            user_id integer REFERENCES users (id),
+            action varchar NOT NULL,
+            details json,
+            "timestamp" timestamp with time zone DEFAULT now()
+        )
+    ''')
+    op.execute('INSERT INTO audit_logs_plain SELECT id, user_id, action, details, "timestamp" FROM audit_logs')
+    op.execute('ALTER SEQUENCE audit_logs_id_seq OWNED BY NONE')
+    # Dropping the parent drops every partition with it.
+    op.drop_table('audit_logs')
+    op.rename_table('audit_logs_plain', 'audit_logs')
+    op.execute('ALTER SEQUENCE audit_logs_id_seq OWNED BY audit_logs.id')
+    op.execute('ALTER TABLE audit_logs RENAME CONSTRAINT audit_logs_plain_pkey TO audit_logs_pkey')
+    op.create_index(op.f('ix_audit_logs_id'), 'audit_logs', ['id'], unique=False)
+    op.create_index(op.f('ix_audit_logs_action'), 'audit_logs', ['action'], unique=False)
+    op.create_index('ix_audit_logs_timestamp_id', 'audit_logs', ['timestamp', 'id'], unique=False)
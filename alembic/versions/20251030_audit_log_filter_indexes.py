@@ -0,0 +1,31 @@
+"""Index audit_logs for filtered queries
+
+Revision ID: 20251030
+Revises: 20251029
+Create Date: 2025-10-30 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20251030'
+down_revision = '20251029'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_audit_logs_user_id_timestamp', 'audit_logs', ['user_id', 'timestamp'], unique=False)
+    op.create_index('ix_audit_logs_action_timestamp', 'audit_logs', ['action', 'timestamp'], unique=False)
+    if op.get_bind().dialect.name == 'postgresql':
+        # Serves "details::jsonb @> '{...}'", e.g. the challenge_id filter.
+        op.execute('CREATE INDEX ix_audit_logs_details_gin ON audit_logs USING gin ((details::jsonb) jsonb_path_ops)')
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_audit_logs_details_gin', table_name='audit_logs')
+    op.drop_index('ix_audit_logs_action_timestamp', table_name='audit_logs')
+    op.drop_index('ix_audit_logs_user_id_timestamp', table_name='audit_logs')
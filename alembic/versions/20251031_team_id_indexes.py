@@ -0,0 +1,27 @@
+"""Index users.team_id and solves.team_id
+
+Revision ID: 20251031
+Revises: 20251030
+Create Date: 2025-10-31 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20251031'
+down_revision = '20251030'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Team members and solves are loaded with "team_id IN (...)" and counted per team.
+    op.create_index(op.f('ix_users_team_id'), 'users', ['team_id'], unique=False)
+    op.create_index(op.f('ix_solves_team_id'), 'solves', ['team_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_solves_team_id'), table_name='solves')
+    op.drop_index(op.f('ix_users_team_id'), table_name='users')
@@ -0,0 +1,26 @@
+"""Keep the admin-set value of challenges apart from the dynamic one
+
+Revision ID: 20251101
+Revises: 20251031
+Create Date: 2025-11-01 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20251101'
+down_revision = '20251031'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('challenges', sa.Column('static_points', sa.Integer(), nullable=True))
+    # Challenges already decayed by dynamic scoring keep their current value.
+    op.execute("UPDATE challenges SET static_points = points")
+
+
+def downgrade() -> None:
+    op.drop_column('challenges', 'static_points')
@@ -0,0 +1,195 @@
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import exc, insert
+
+from . import models
+from .config import settings
+from .database import SessionLocal
+
+# The database could not be reached: the rows themselves are fine, so they are kept for the next flush.
+TRANSIENT_ERRORS = (exc.OperationalError, exc.InterfaceError, exc.TimeoutError)
+
+
+class AuditLogWriter:
+    """
+    Write-behind sink for audit log rows.
+
+    Entries are buffered in memory and written as multi-row INSERTs by a
+    background thread whenever the buffer reaches `batch_size` entries or
+    `flush_interval` seconds pass, whichever comes first. If the buffer grows
+    past `max_buffer`, the caller flushes inline, which applies backpressure.
+
+    A chunk that fails for any reason other than the database being
+    unreachable is split in two until the bad rows are alone; each is retried
+    on the next `max_retries` flushes and then appended to `dead_letter_path`.
+    While the database is unreachable the oldest entries beyond `max_buffer`
+    are dropped and counted, so the buffer stays bounded.
+    """
+
+    def __init__(self, session_factory=SessionLocal, batch_size: int = 500, flush_interval: float = 1.0, max_buffer: int = 20000,
+                 max_retries: int = 3, dead_letter_path: str = "audit-dead-letter.ndjson"):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.max_retries = max_retries
+        self.dead_letter_path = dead_letter_path
+        self._buffer: List[dict] = []
+        # (failed attempts, entry) for rows that failed on their own.
+        self._retries: List[tuple] = []
+        self._available = True
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"entries_written": 0, "flushes": 0, "flush_errors": 0, "last_flush_seconds": 0.0, "max_flush_seconds": 0.0, "total_flush_seconds": 0.0,
+                       "entries_dropped": 0, "entries_dead_lettered": 0}
+
+    def record(self, action: str, user_id: Optional[int] = None, details: Optional[dict] = None):
+        """
+        Queues an audit log entry. The timestamp is taken now, not at flush time.
+        """
+        entry = {"user_id": user_id, "action": action, "details": details, "timestamp": datetime.now(timezone.utc)}
+        with self._lock:
+            self._buffer.append(entry)
+            depth = len(self._buffer)
+            if depth > self.max_buffer and not self._available:
+                # Flushing inline would only wait for the database to time out again.
+                self._drop_overflow()
+        if self._thread is None:
+            self.start()
+        if depth >= self.max_buffer and self._available:
+            self.flush()
+        elif depth >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """
+        Writes everything currently buffered. Returns the number of rows written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            retries, self._retries = self._retries, []
+            # (rows, failed attempts) still to write.
+            pending = deque([([entry], attempts) for attempts, entry in retries])
+            pending.extend((batch[i:i + self.batch_size], 0) for i in range(0, len(batch), self.batch_size))
+            written = 0
+            while pending:
+                rows, attempts = pending.popleft()
+                try:
+                    self._write(rows)
+                except TRANSIENT_ERRORS as e:
+                    self._stats["flush_errors"] += 1
+                    pending.appendleft((rows, attempts))
+                    self._requeue(pending, e)
+                    break
+                except Exception as e:
+                    self._stats["flush_errors"] += 1
+                    if len(rows) > 1:
+                        middle = len(rows) // 2
+                        pending.appendleft((rows[middle:], attempts))
+                        pending.appendleft((rows[:middle], attempts))
+                    elif attempts + 1 < self.max_retries:
+                        self._retries.append((attempts + 1, rows[0]))
+                    else:
+                        self._dead_letter(rows[0], e)
+                    continue
+                written += len(rows)
+            else:
+                self._available = True
+            return written
+
+    def _requeue(self, pending: deque, error: Exception):
+        """Puts the unwritten entries back at the head of the buffer, in order."""
+        self._available = False
+        entries = []
+        for rows, attempts in pending:
+            if attempts:
+                self._retries.append((attempts, rows[0]))
+            else:
+                entries.extend(rows)
+        with self._lock:
+            self._buffer[:0] = entries
+            self._drop_overflow()
+        print(f"ERROR: Failed to flush {len(entries) + len(self._retries)} audit log entries: {error}")
+
+    def _drop_overflow(self):
+        """Drops the oldest entries beyond `max_buffer`. Call with `_lock` held."""
+        overflow = len(self._buffer) - self.max_buffer
+        if overflow > 0:
+            del self._buffer[:overflow]
+            self._stats["entries_dropped"] += overflow
+            print(f"WARNING: Audit log buffer full, dropped the {overflow} oldest entries")
+
+    def _dead_letter(self, entry: dict, error: Exception):
+        self._stats["entries_dead_lettered"] += 1
+        line = json.dumps({**entry, "error": str(error)}, default=str)
+        try:
+            with open(self.dead_letter_path, "a") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            print(f"ERROR: Could not write to {self.dead_letter_path}: {e}")
+        print(f"ERROR: Gave up on audit log entry after {self.max_retries} attempts: {line}")
+
+    def _write(self, rows: List[dict]):
+        start = time.perf_counter()
+        db = self.session_factory()
+        try:
+            db.execute(insert(models.AuditLog), rows)
+            db.commit()
+        finally:
+            db.close()
+        elapsed = time.perf_counter() - start
+        self._stats["entries_written"] += len(rows)
+        self._stats["flushes"] += 1
+        self._stats["last_flush_seconds"] = elapsed
+        self._stats["total_flush_seconds"] += elapsed
+        self._stats["max_flush_seconds"] = max(self._stats["max_flush_seconds"], elapsed)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+            self._thread.start()
+
+    def shutdown(self):
+        """
+        Stops the background thread and drains whatever is still buffered.
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            depth = len(self._buffer)
+        return {"buffer_depth": depth, "retry_depth": len(self._retries), **self._stats}
+
+
+audit_writer: Optional[AuditLogWriter] = None
+if settings.AUDIT_LOG_MODE == "buffered":
+    audit_writer = AuditLogWriter(
+        batch_size=settings.AUDIT_LOG_BATCH_SIZE,
+        flush_interval=settings.AUDIT_LOG_FLUSH_INTERVAL,
+        max_buffer=settings.AUDIT_LOG_MAX_BUFFER,
+        max_retries=settings.AUDIT_LOG_MAX_RETRIES,
+        dead_letter_path=settings.AUDIT_LOG_DEAD_LETTER_FILE,
+    )
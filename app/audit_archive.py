@@ -0,0 +1,273 @@
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import threading
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from typing import Iterator, List, Optional
+
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.orm import Session
+
+from . import crud, models, schemas
+from .config import settings
+from .database import SessionLocal
+
+# One partition per UTC day, named after the day it holds. Must match the
+# naming in migration 20251029.
+PARTITION_PREFIX = "audit_logs_p"
+_PARTITION_NAME = re.compile(rf"^{PARTITION_PREFIX}(\d{{8}})$")
+
+
+def partition_name(day: date) -> str:
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+
+def _partition_day(name: str) -> Optional[date]:
+    match = _PARTITION_NAME.match(name)
+    return datetime.strptime(match.group(1), "%Y%m%d").date() if match else None
+
+
+EXPORT_COLUMNS = ("id", "timestamp", "user_id", "action", "details")
+
+
+def audit_row(row) -> dict:
+    return {"id": row.id, "timestamp": row.timestamp.isoformat() if row.timestamp else None, "user_id": row.user_id, "action": row.action, "details": row.details}
+
+
+def export_audit_logs(filters: Optional[schemas.AuditLogFilter] = None, fmt: str = "ndjson", batch_size: int = 1000) -> Iterator[str]:
+    """
+    Yields the matching audit logs, oldest first, as NDJSON or CSV. Rows are
+    read through a server-side cursor `batch_size` at a time, so memory use
+    doesn't depend on how many rows match. Uses its own session because the
+    response outlives the request's.
+    """
+    db = SessionLocal()
+    try:
+        query = (
+            select(*(getattr(models.AuditLog, column) for column in EXPORT_COLUMNS))
+            .where(*crud.audit_log_conditions(db, filters))
+            .order_by(models.AuditLog.timestamp, models.AuditLog.id)
+        )
+        result = db.execute(query, execution_options={"yield_per": batch_size})
+        if fmt == "csv":
+            yield ",".join(EXPORT_COLUMNS) + "\r\n"
+        for rows in result.partitions():
+            if fmt == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                for row in rows:
+                    record = audit_row(row)
+                    record["details"] = json.dumps(record["details"])
+                    writer.writerow(record[column] for column in EXPORT_COLUMNS)
+                yield buffer.getvalue()
+            else:
+                yield "".join(json.dumps(audit_row(row)) + "\n" for row in rows)
+    finally:
+        db.close()
+
+
+class AuditLogArchiver:
+    """
+    Retention for audit_logs.
+
+    On PostgreSQL audit_logs is range-partitioned by day. Days older than
+    `retention_days` are detached, written to `archive_dir` as gzipped NDJSON
+    (one file per day) and dropped, so the live table only ever holds recent
+    partitions and removing old rows costs no vacuum. A day that has been
+    detached but not archived yet (e.g. the process died) is picked up on the
+    next run. Unpartitioned databases (SQLite, or PostgreSQL before the
+    migration) get the same files, with the rows deleted in batches instead.
+    """
+
+    def __init__(self, archive_dir: str, retention_days: int = 30, session_factory=SessionLocal, batch_size: int = 5000):
+        self.archive_dir = archive_dir
+        self.retention_days = retention_days
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+
+    def is_partitioned(self, db: Session) -> bool:
+        if db.get_bind().dialect.name != "postgresql":
+            return False
+        return db.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass('audit_logs')")).scalar() == "p"
+
+    def ensure_partitions(self, db: Session, days_ahead: int = 7) -> int:
+        """
+        Creates the partitions for today and the next `days_ahead` days.
+        Rows for days without a partition land in audit_logs_default; if a day
+        already has rows there, they are moved into its new partition. A day
+        that fails is logged and skipped, so the others are still created.
+        """
+        if not self.is_partitioned(db):
+            return 0
+        created = 0
+        today = datetime.now(timezone.utc).date()
+        for offset in range(days_ahead + 1):
+            day = today + timedelta(days=offset)
+            exists = db.execute(text("SELECT to_regclass(:name)"), {"name": partition_name(day)}).scalar()
+            if exists:
+                continue
+            try:
+                self._create_partition(db, day)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                print(f"WARNING: Could not create audit log partition {partition_name(day)}: {e}")
+                continue
+            created += 1
+        return created
+
+    def _create_partition(self, db: Session, day: date):
+        name = partition_name(day)
+        bounds = f"FROM ('{day.isoformat()} 00:00:00+00') TO ('{(day + timedelta(days=1)).isoformat()} 00:00:00+00')"
+        in_day = f"\"timestamp\" >= '{day.isoformat()} 00:00:00+00' AND \"timestamp\" < '{(day + timedelta(days=1)).isoformat()} 00:00:00+00'"
+        # Blocks inserts into the default partition until commit, so none of the day's rows land there in between.
+        db.execute(text("LOCK TABLE audit_logs_default IN SHARE ROW EXCLUSIVE MODE"))
+        if not db.execute(text(f"SELECT EXISTS (SELECT 1 FROM audit_logs_default WHERE {in_day})")).scalar():
+            db.execute(text(f"CREATE TABLE {name} PARTITION OF audit_logs FOR VALUES {bounds}"))
+            return
+        # CREATE ... PARTITION OF fails while the default partition holds rows for the range.
+        db.execute(text(f"CREATE TABLE {name} (LIKE audit_logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+        moved = db.execute(text(
+            f"WITH moved AS (DELETE FROM audit_logs_default WHERE {in_day} RETURNING id, user_id, action, details, \"timestamp\") "
+            f"INSERT INTO {name} (id, user_id, action, details, \"timestamp\") SELECT * FROM moved"
+        )).rowcount
+        db.execute(text(f"ALTER TABLE audit_logs ATTACH PARTITION {name} FOR VALUES {bounds}"))
+        print(f"INFO: Moved {moved} audit log rows from audit_logs_default to {name}")
+
+    def _archive_path(self, label: str) -> str:
+        return os.path.join(self.archive_dir, f"audit_logs_{label}.ndjson.gz")
+
+    def _write_archive(self, path: str, rows) -> int:
+        # Written to a temporary name first so a crash never leaves a truncated archive behind.
+        os.makedirs(self.archive_dir, exist_ok=True)
+        count = 0
+        with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(audit_row(row)) + "\n")
+                count += 1
+        os.replace(path + ".tmp", path)
+        return count
+
+    def _old_partitions(self, db: Session, cutoff: date) -> List[str]:
+        # Attached or not: a detached day that was never archived is finished here.
+        names = db.execute(text("SELECT relname FROM pg_class WHERE relkind = 'r' AND starts_with(relname, :prefix)"), {"prefix": PARTITION_PREFIX}).scalars()
+        days = ((name, _partition_day(name)) for name in names)
+        return sorted(name for name, day in days if day is not None and day < cutoff)
+
+    def _archive_partitions(self, db: Session, cutoff: date) -> dict:
+        attached = set(db.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = 'audit_logs'::regclass"
+        )).scalars())
+        archived = {"partitions": 0, "rows": 0, "files": []}
+        for name in self._old_partitions(db, cutoff):
+            if name in attached:
+                db.execute(text(f"ALTER TABLE audit_logs DETACH PARTITION {name}"))
+                db.commit()
+            path = self._archive_path(f"{_partition_day(name):%Y%m%d}")
+            rows = db.execute(
+                text(f'SELECT id, user_id, action, details, "timestamp" FROM {name} ORDER BY "timestamp", id'),
+                execution_options={"yield_per": self.batch_size},
+            )
+            archived["rows"] += self._write_archive(path, rows)
+            db.execute(text(f"DROP TABLE {name}"))
+            db.commit()
+            archived["partitions"] += 1
+            archived["files"].append(path)
+        # Rows for days that had no partition yet are in audit_logs_default; the
+        # old days' partitions are gone by now, so that is where these come from.
+        leftover = self._archive_rows(db, cutoff)
+        archived["rows"] += leftover["rows"]
+        archived["files"].extend(leftover["files"])
+        return archived
+
+    def _archive_rows(self, db: Session, cutoff: date) -> dict:
+        boundary = datetime.combine(cutoff, dt_time.min, tzinfo=timezone.utc)
+        last_id = db.execute(select(func.max(models.AuditLog.id)).where(models.AuditLog.timestamp < boundary)).scalar()
+        if last_id is None:
+            return {"partitions": 0, "rows": 0, "files": []}
+        old = (models.AuditLog.timestamp < boundary, models.AuditLog.id <= last_id)
+        path = self._archive_path(f"before_{cutoff:%Y%m%d}_{datetime.utcnow():%Y%m%d%H%M%S}")
+        rows = db.execute(
+            select(models.AuditLog.id, models.AuditLog.user_id, models.AuditLog.action, models.AuditLog.details, models.AuditLog.timestamp)
+            .where(*old).order_by(models.AuditLog.id),
+            execution_options={"yield_per": self.batch_size},
+        )
+        count = self._write_archive(path, rows)
+        while True:
+            batch = select(models.AuditLog.id).where(*old).limit(self.batch_size)
+            deleted = db.execute(delete(models.AuditLog).where(models.AuditLog.id.in_(batch))).rowcount
+            db.commit()
+            if deleted < self.batch_size:
+                break
+        return {"partitions": 0, "rows": count, "files": [path]}
+
+    def run(self, retention_days: Optional[int] = None) -> dict:
+        """
+        Archives and removes audit log rows from days older than the retention
+        period. Returns {"partitions", "rows", "files"}.
+        """
+        retention_days = self.retention_days if retention_days is None else retention_days
+        cutoff = datetime.now(timezone.utc).date() - timedelta(days=retention_days)
+        db = self.session_factory()
+        try:
+            if self.is_partitioned(db):
+                self.ensure_partitions(db)
+                return self._archive_partitions(db, cutoff)
+            return self._archive_rows(db, cutoff)
+        finally:
+            db.close()
+
+
+archiver = AuditLogArchiver(settings.AUDIT_ARCHIVE_DIR, retention_days=settings.AUDIT_RETENTION_DAYS)
+
+
+def prepare_audit_partitions():
+    db = SessionLocal()
+    try:
+        created = archiver.ensure_partitions(db, days_ahead=settings.AUDIT_PARTITION_DAYS_AHEAD)
+    except Exception as e:
+        # Rows still land in the default partition; retention just can't drop them by day.
+        db.rollback()
+        print(f"WARNING: Could not create audit log partitions: {e}")
+        return
+    finally:
+        db.close()
+    if created:
+        print(f"INFO: Created {created} audit log partitions")
+
+
+class PartitionScheduler:
+    """
+    Creates the upcoming days' audit log partitions on startup and then every
+    `interval` seconds, on a thread of its own, so a long-running deployment
+    never falls back to the default partition. `python -m app.cli
+    ensure-audit-partitions` does the same from cron when the interval is 0.
+    """
+
+    def __init__(self, interval: float = 3600):
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            prepare_audit_partitions()
+
+    def start(self):
+        prepare_audit_partitions()
+        if self._thread is None and self.interval > 0:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="audit-partitions", daemon=True)
+            self._thread.start()
+
+    def shutdown(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+partition_scheduler = PartitionScheduler(interval=settings.AUDIT_PARTITION_CHECK_SECONDS)
@@ -1,29 +1,43 @@
 from datetime import timedelta
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from jose import JWTError, jwt
 
-from . import crud, models, security
+from . import crud, models, schemas, security
 from .config import settings
 from .database import get_db
+from .hashing import password_hasher
+from .user_cache import user_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def authenticate_user(db: Session, username: str, password: str) -> models.User | bool:
+async def authenticate_user(db: Session, username: str, password: str) -> models.User | bool:
     """
-    Authenticates a user by username and password.
+    Authenticates a user by username and password. The bcrypt check runs in
+    the hashing pool and may raise HashingBusy; the query runs in the threadpool.
     """
-    user = crud.get_user_by_username(db, username=username)
-    if not user:
+    user = await run_in_threadpool(crud.get_user_by_username, db, username=username)
+    if not user or not user.hashed_password:
         return False
-    if not security.verify_password(password, user.hashed_password):
+    if not await password_hasher.verify(password, user.hashed_password):
         return False
     return user
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> models.User:
+def create_user_access_token(user: models.User) -> str:
     """
-    Decodes the JWT token to get the current user.
+    Issues a JWT carrying the user's id and token version alongside the username.
+    """
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    return security.create_access_token(
+        data={"sub": user.username, "uid": user.id, "ver": user.token_version or 0}, expires_delta=access_token_expires
+    )
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> schemas.CurrentUser:
+    """
+    Decodes the JWT token to get the current user. Users are resolved from the
+    per-worker user cache when possible, so most requests need no query.
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -33,17 +47,33 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         username: str = payload.get("sub")
+        user_id: int = payload.get("uid")
+        token_version: int = payload.get("ver", 0)
         if username is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    
-    user = crud.get_user_by_username(db, username=username)
-    if user is None:
+
+    if user_id is None:
+        # Tokens issued before ids were added to the claims.
+        db_user = crud.get_user_by_username(db, username=username)
+        if db_user is None:
+            raise credentials_exception
+        return schemas.CurrentUser.model_validate(db_user)
+
+    user = user_cache.get(user_id)
+    if user is None or user.token_version < token_version:
+        db_user = crud.get_user(db, user_id=user_id)
+        if db_user is None:
+            raise credentials_exception
+        user = schemas.CurrentUser.model_validate(db_user)
+        user_cache.put(user)
+    if user.token_version != token_version:
+        # The token was revoked by bumping the user's token version.
         raise credentials_exception
     return user
 
-def get_current_active_user(current_user: models.User = Depends(get_current_user)) -> models.User:
+def get_current_active_user(current_user: schemas.CurrentUser = Depends(get_current_user)) -> schemas.CurrentUser:
     """
     Dependency to get the current active user.
     """
@@ -51,7 +81,7 @@ def get_current_active_user(current_user: models.User = Depends(get_current_user
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
-def get_current_admin_user(current_user: models.User = Depends(get_current_active_user)) -> models.User:
+def get_current_admin_user(current_user: schemas.CurrentUser = Depends(get_current_active_user)) -> schemas.CurrentUser:
     """
     Dependency to get the current active user who is also an admin.
     """
@@ -61,3 +91,13 @@ def get_current_admin_user(current_user: models.User = Depends(get_current_activ
             detail="The user does not have administrative privileges."
         )
     return current_user
+
+def get_current_db_user(current_user: schemas.CurrentUser = Depends(get_current_active_user), db: Session = Depends(get_db)) -> models.User:
+    """
+    Dependency for routes that need the full ORM user (to modify it or serialize
+    its relationships) rather than the cached principal.
+    """
+    user = crud.get_user(db, user_id=current_user.id)
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
+    return user
@@ -0,0 +1,254 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+import redis
+import redis.asyncio
+
+from .config import settings
+
+INVALIDATION_CHANNEL = "ctf:invalidate"
+VERSION_KEY = "ctf:version:{topic}"
+
+_redis_client: Optional[redis.Redis] = None
+_async_redis_client: Optional[redis.asyncio.Redis] = None
+
+def get_redis() -> redis.Redis:
+    """
+    Returns the process-wide Redis client, creating it on first use.
+    """
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(settings.REDIS_URL, socket_timeout=2, socket_connect_timeout=2)
+    return _redis_client
+
+def get_async_redis() -> redis.asyncio.Redis:
+    """
+    Returns the asyncio Redis client for code running on the event loop.
+    """
+    global _async_redis_client
+    if _async_redis_client is None:
+        _async_redis_client = redis.asyncio.Redis.from_url(settings.REDIS_URL, socket_connect_timeout=2)
+    return _async_redis_client
+
+
+class InvalidationBus:
+    """
+    Cross-worker cache invalidation over Redis pub/sub.
+
+    Each topic has a global version counter in Redis. Publishing a topic bumps
+    the counter, runs the local handlers immediately and broadcasts the new
+    version so every other uvicorn worker runs its handlers too. If Redis is
+    unreachable, publishing degrades to local-only invalidation and cached
+    values fall back to expiring after CACHE_TTL_SECONDS.
+    """
+
+    def __init__(self):
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._handlers: Dict[str, List[Callable[[int], None]]] = defaultdict(list)
+        self._prefix_handlers: List[tuple] = []
+        self._local_versions: Dict[str, int] = defaultdict(int)
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.connected = False
+
+    def subscribe(self, topic: str, handler: Callable[[int], None]):
+        self._handlers[topic].append(handler)
+
+    def subscribe_prefix(self, prefix: str, handler: Callable[[str, int], None]):
+        """
+        Subscribes to every topic starting with `prefix`, e.g. per-user topics.
+        The handler receives the full topic and its version.
+        """
+        self._prefix_handlers.append((prefix, handler))
+
+    def current_version(self, topic: str) -> int:
+        try:
+            value = get_redis().get(VERSION_KEY.format(topic=topic))
+            return int(value) if value else 0
+        except redis.RedisError:
+            return self._local_versions[topic]
+
+    def publish(self, topic: str) -> int:
+        """
+        Bumps the version of `topic` and notifies every worker. Returns the new version.
+        """
+        try:
+            client = get_redis()
+            version = client.incr(VERSION_KEY.format(topic=topic))
+            client.publish(INVALIDATION_CHANNEL, json.dumps({"topic": topic, "version": version, "origin": self.origin}))
+        except redis.RedisError as e:
+            print(f"WARNING: Could not broadcast invalidation of '{topic}': {e}")
+            version = self._local_versions[topic] + 1
+        self._dispatch(topic, version)
+        return version
+
+    def bump(self, *topics: str):
+        """
+        Bumps the versions of topics that only serve as validators (e.g. in
+        ETags) and have no handlers, so nothing is broadcast.
+        """
+        if not topics:
+            return
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for topic in topics:
+                pipe.incr(VERSION_KEY.format(topic=topic))
+            pipe.execute()
+        except redis.RedisError as e:
+            print(f"WARNING: Could not bump version of {', '.join(topics)}: {e}")
+
+    def versions(self, *topics: str) -> Optional[tuple]:
+        """
+        The global versions of `topics`, read in one round trip, for building
+        validators. None if Redis is unreachable: local versions differ
+        between workers and can't validate anything.
+        """
+        try:
+            values = get_redis().mget([VERSION_KEY.format(topic=topic) for topic in topics])
+        except redis.RedisError:
+            return None
+        return tuple(int(v) if v else 0 for v in values)
+
+    def _dispatch(self, topic: str, version: int):
+        self._local_versions[topic] = max(self._local_versions[topic], version)
+        for handler in self._handlers.get(topic, []):
+            handler(version)
+        for prefix, handler in self._prefix_handlers:
+            if topic.startswith(prefix):
+                handler(topic, version)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Messages may have been missed while disconnected, so start clean.
+                for topic in list(self._handlers):
+                    if topic != "reconnect":
+                        self._dispatch(topic, self.current_version(topic))
+                self._dispatch("reconnect", 0)
+                self.connected = True
+                while not self._stopping.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is None:
+                        continue
+                    payload = json.loads(message["data"])
+                    if payload.get("origin") != self.origin:
+                        self._dispatch(payload["topic"], int(payload["version"]))
+                pubsub.close()
+            except redis.RedisError as e:
+                self.connected = False
+                print(f"WARNING: Invalidation listener disconnected: {e}")
+                self._stopping.wait(5)
+
+    def start(self):
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="cache-invalidation", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.connected = False
+
+
+invalidation_bus = InvalidationBus()
+
+
+class VersionedCache:
+    """
+    Holds a single lazily loaded value that is dropped whenever its topic is
+    invalidated on the bus. `version` is the topic's global version at the time
+    the value was loaded, so it can be used as a validator (e.g. in ETags).
+
+    The loader runs outside the lock: with DB_ASYNC it runs in a greenlet on
+    the event loop thread, where waiting on a thread lock held by another
+    request on the same loop would deadlock the worker. Concurrent cold reads
+    may therefore load twice; the lock only guards storing the result.
+    """
+
+    def __init__(self, topic: str, bus: InvalidationBus = invalidation_bus, ttl: Optional[float] = None):
+        self.topic = topic
+        self.bus = bus
+        self.ttl = settings.CACHE_TTL_SECONDS if ttl is None else ttl
+        self.version = 0
+        self._value: Any = None
+        self._loaded_at = 0.0
+        self._generation = 0
+        self._lock = threading.Lock()
+        bus.subscribe(topic, self.invalidate)
+
+    def get(self, loader: Callable[[], Any]) -> Any:
+        value = self._value
+        if value is not None and (self.bus.connected or time.monotonic() - self._loaded_at < self.ttl):
+            return value
+        generation = self._generation
+        version = self.bus.current_version(self.topic)
+        loaded = loader()
+        with self._lock:
+            # Don't keep a value that was invalidated while it was being loaded.
+            if generation == self._generation:
+                self._value = loaded
+                self._loaded_at = time.monotonic()
+                self.version = version
+        return loaded
+
+    def invalidate(self, version: Optional[int] = None):
+        with self._lock:
+            self._generation += 1
+            self._value = None
+            if version is not None:
+                self.version = version
+
+
+def make_etag(versions: Optional[tuple], scope: str = "") -> Optional[str]:
+    """
+    Strong ETag from `versions`. `scope` keeps validators of per-user
+    representations from matching another user's.
+    """
+    return f'"{scope}{".".join(map(str, versions))}"' if versions is not None else None
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """
+    Whether an If-None-Match header matches `etag` (weak comparison, as
+    RFC 9110 requires for If-None-Match).
+    """
+    if not if_none_match or not etag:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+
+class KeyedCache:
+    """
+    Holds the value loaded for the most recent key only, e.g. a tuple of
+    versions. Every worker keys on the same global versions, so there is
+    nothing to invalidate: a new key simply replaces the old value. There is
+    no lock, for the same reason as in VersionedCache: concurrent misses
+    both load and the last one stored wins.
+    """
+
+    def __init__(self):
+        self._entry: tuple = (None, None)
+
+    def get(self, key, loader: Callable[[], Any]) -> Any:
+        if key is None:
+            return loader()
+        cached_key, value = self._entry
+        if cached_key == key:
+            return value
+        value = loader()
+        self._entry = (key, value)
+        return value
+
+    def clear(self):
+        self._entry = (None, None)
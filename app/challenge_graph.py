@@ -0,0 +1,104 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from . import models
+
+
+class DependencyCycleError(ValueError):
+    """
+    Raised when challenge dependencies would form a cycle.
+    """
+
+    def __init__(self, challenge_ids: Iterable[int]):
+        self.challenge_ids = sorted(challenge_ids)
+        super().__init__(f"Challenge dependencies form a cycle between challenges {self.challenge_ids}.")
+
+
+def _kahn(dependencies: Dict[int, Set[int]]) -> Tuple[List[int], Set[int]]:
+    """
+    Returns the challenge ids that can be ordered, each after its
+    dependencies, and the ids that are part of, or blocked behind, a cycle.
+    """
+    nodes = set(dependencies)
+    for deps in dependencies.values():
+        nodes.update(deps)
+    pending = {node: len(dependencies.get(node, ())) for node in nodes}
+    dependents = defaultdict(list)
+    for node, deps in dependencies.items():
+        for dep in deps:
+            dependents[dep].append(node)
+
+    ready = sorted(node for node, count in pending.items() if count == 0)
+    order = []
+    while ready:
+        node = ready.pop()
+        order.append(node)
+        for dependent in dependents[node]:
+            pending[dependent] -= 1
+            if pending[dependent] == 0:
+                ready.append(dependent)
+    return order, {node for node, count in pending.items() if count > 0}
+
+
+def topological_order(dependencies: Dict[int, Set[int]]) -> List[int]:
+    """
+    Orders challenge ids so every challenge comes after its dependencies (Kahn's algorithm).
+
+    Raises DependencyCycleError naming the challenges that are part of, or
+    blocked behind, a cycle.
+    """
+    order, blocked = _kahn(dependencies)
+    if blocked:
+        raise DependencyCycleError(blocked)
+    return order
+
+
+class ChallengeGraph:
+    """
+    Compiled form of the challenge_dependencies DAG.
+
+    Every challenge gets a bit position, and each challenge's dependencies are
+    folded into a single integer mask. A user's solved set is converted into a
+    mask once per request, after which checking whether a challenge is locked
+    is a single AND.
+
+    Admin writes reject cycles, but rows written before that check may still
+    contain one. Challenges in, or behind, a cycle are then logged and stay
+    locked for everyone: their masks include a bit no solved mask ever sets.
+    """
+
+    def __init__(self, dependencies: Dict[int, Set[int]]):
+        self.order, self.blocked = _kahn(dependencies)
+        self.bits = {challenge_id: 1 << i for i, challenge_id in enumerate(self.order)}
+        locked_bit = 1 << len(self.order)
+        if self.blocked:
+            print(f"WARNING: Challenge dependencies form a cycle; challenges {sorted(self.blocked)} stay locked")
+        self.dependency_masks = {}
+        for challenge_id, deps in dependencies.items():
+            mask = locked_bit if challenge_id in self.blocked else 0
+            for dep in deps:
+                mask |= self.bits.get(dep, locked_bit)
+            self.dependency_masks[challenge_id] = mask
+
+    def solved_mask(self, solved_ids: Iterable[int]) -> int:
+        mask = 0
+        for challenge_id in solved_ids:
+            mask |= self.bits.get(challenge_id, 0)
+        return mask
+
+    def is_locked(self, challenge_id: int, solved_mask: int) -> bool:
+        return bool(self.dependency_masks.get(challenge_id, 0) & ~solved_mask)
+
+
+def load_dependencies(db: Session) -> Dict[int, Set[int]]:
+    dependencies = {challenge_id: set() for (challenge_id,) in db.query(models.Challenge.id)}
+    deps = models.challenge_dependencies
+    for challenge_id, dependency_id in db.query(deps.c.challenge_id, deps.c.dependency_id):
+        dependencies[challenge_id].add(dependency_id)
+    return dependencies
+
+
+def build_graph(db: Session) -> ChallengeGraph:
+    return ChallengeGraph(load_dependencies(db))
@@ -0,0 +1,84 @@
+"""
+Maintenance commands.
+
+Usage: python -m app.cli <command>
+"""
+import argparse
+
+from . import crud, leaderboard, score_history, scoring
+from .audit_archive import archiver
+from .config import settings
+from .database import SessionLocal
+from .reaper import reaper
+
+
+def rebuild_leaderboard(args):
+    db = SessionLocal()
+    try:
+        counts = leaderboard.rebuild(db)
+    finally:
+        db.close()
+    print(f"Rebuilt leaderboard: {counts['teams']} teams, {counts['users']} users.")
+
+
+def backfill_score_history(args):
+    db = SessionLocal()
+    try:
+        processed = score_history.backfill(db)
+    finally:
+        db.close()
+    print(f"Backfilled score history from {processed} solves.")
+
+
+def rescore(args):
+    db = SessionLocal()
+    try:
+        counts = scoring.rescore(db, crud.get_settings(db).scoring_mode)
+    finally:
+        db.close()
+    print(f"Rescored {counts['challenges']} dynamic challenges and {counts['users']} users.")
+
+
+def reap_instances(args):
+    result = reaper.run_once()
+    if result.get("skipped"):
+        print("Another worker is reaping instances; nothing to do.")
+        return
+    print(f"Reaped {result['reaped']} expired instances in {result['seconds']:.2f}s ({result['stop_errors']} failed to stop).")
+
+
+def archive_audit_logs(args):
+    result = archiver.run(retention_days=args.days)
+    for path in result["files"]:
+        print(f"Wrote {path}")
+    print(f"Archived {result['rows']} audit log rows ({result['partitions']} partitions dropped).")
+
+
+def ensure_audit_partitions(args):
+    db = SessionLocal()
+    try:
+        created = archiver.ensure_partitions(db, days_ahead=args.days)
+    finally:
+        db.close()
+    print(f"Created {created} audit log partitions.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("rebuild-leaderboard", help="Recompute the leaderboard from the solves table.").set_defaults(func=rebuild_leaderboard)
+    commands.add_parser("backfill-score-history", help="Rebuild score-over-time series from the solves table.").set_defaults(func=backfill_score_history)
+    commands.add_parser("rescore", help="Recompute challenge values and user scores.").set_defaults(func=rescore)
+    commands.add_parser("reap-instances", help="Stop and delete expired dynamic challenge instances.").set_defaults(func=reap_instances)
+    partitions = commands.add_parser("ensure-audit-partitions", help="Create the audit log partitions for the coming days (PostgreSQL).")
+    partitions.add_argument("--days", type=int, default=settings.AUDIT_PARTITION_DAYS_AHEAD, help="days ahead instead of AUDIT_PARTITION_DAYS_AHEAD")
+    partitions.set_defaults(func=ensure_audit_partitions)
+    archive = commands.add_parser("archive-audit-logs", help="Move audit logs past the retention period to compressed NDJSON files.")
+    archive.add_argument("--days", type=int, default=None, help="keep this many days instead of AUDIT_RETENTION_DAYS")
+    archive.set_defaults(func=archive_audit_logs)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
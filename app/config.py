@@ -6,6 +6,9 @@ class Settings(BaseSettings):
     SECRET_KEY: str = os.environ.get("SECRET_KEY", "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7")
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Resolved users are cached per worker so authentication skips the database
+    USER_CACHE_SIZE: int = int(os.environ.get("USER_CACHE_SIZE", 10000))
+    USER_CACHE_TTL: float = float(os.environ.get("USER_CACHE_TTL", 60))
 
     # Email settings
     MAIL_USERNAME: str = os.environ.get("MAIL_USERNAME", "username")
@@ -15,6 +18,82 @@ class Settings(BaseSettings):
     MAIL_SERVER: str = os.environ.get("MAIL_SERVER", "smtp.example.com")
     MAIL_STARTTLS: bool = os.environ.get("MAIL_STARTTLS", "True").lower() in ("true", "1", "t")
     MAIL_SSL_TLS: bool = os.environ.get("MAIL_SSL_TLS", "False").lower() in ("true", "1", "t")
+    # Build verification emails but don't send them (load tests, local development)
+    MAIL_SUPPRESS_SEND: bool = os.environ.get("MAIL_SUPPRESS_SEND", "False").lower() in ("true", "1", "t")
+    # Mass email: persistent SMTP connections, recipients per SMTP transaction, retries per batch
+    MAIL_POOL_SIZE: int = int(os.environ.get("MAIL_POOL_SIZE", 4))
+    MAIL_BATCH_SIZE: int = int(os.environ.get("MAIL_BATCH_SIZE", 50))
+    MAIL_MAX_RETRIES: int = int(os.environ.get("MAIL_MAX_RETRIES", 3))
+    MAIL_TIMEOUT: float = float(os.environ.get("MAIL_TIMEOUT", 30))
+
+    # Database connection pool (ignored for SQLite)
+    DB_POOL_SIZE: int = int(os.environ.get("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW: int = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+    DB_POOL_TIMEOUT: float = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+    DB_POOL_RECYCLE: int = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+    DB_POOL_PRE_PING: bool = os.environ.get("DB_POOL_PRE_PING", "True").lower() in ("true", "1", "t")
+    # Serve ported routes through an asyncpg AsyncSession instead of the threadpool
+    DB_ASYNC: bool = os.environ.get("DB_ASYNC", "False").lower() in ("true", "1", "t")
+
+    # Redis is used for rate limiting, caching and cross-worker invalidation
+    REDIS_URL: str = os.environ.get("REDIS_URL", "redis://localhost:6379")
+    # Upper bound on how stale a cached value can get if an invalidation message is missed
+    CACHE_TTL_SECONDS: float = float(os.environ.get("CACHE_TTL_SECONDS", 30))
+
+    # bcrypt runs in a process pool per app worker: -1 splits the cores between the
+    # WEB_CONCURRENCY app workers (uvicorn and gunicorn read it too; with `--workers N`
+    # set it to N or set HASHING_WORKERS), 0 hashes inline.
+    # Beyond HASHING_MAX_PENDING queued jobs (0 = 16 per worker) requests get a 503.
+    HASHING_WORKERS: int = int(os.environ.get("HASHING_WORKERS", -1))
+    WEB_CONCURRENCY: int = int(os.environ.get("WEB_CONCURRENCY", 1))
+    HASHING_MAX_PENDING: int = int(os.environ.get("HASHING_MAX_PENDING", 0))
+
+    # Audit log writer: "buffered" batches rows in memory and flushes them in the
+    # background, "sync" writes each row in the caller's transaction (use for tests).
+    # Rows that belong to a larger transaction (e.g. a correct flag submission) are
+    # always written in it. Rows that keep failing end up in AUDIT_LOG_DEAD_LETTER_FILE
+    AUDIT_LOG_MODE: str = os.environ.get("AUDIT_LOG_MODE", "buffered")
+    AUDIT_LOG_BATCH_SIZE: int = int(os.environ.get("AUDIT_LOG_BATCH_SIZE", 500))
+    AUDIT_LOG_FLUSH_INTERVAL: float = float(os.environ.get("AUDIT_LOG_FLUSH_INTERVAL", 1.0))
+    AUDIT_LOG_MAX_BUFFER: int = int(os.environ.get("AUDIT_LOG_MAX_BUFFER", 20000))
+    AUDIT_LOG_MAX_RETRIES: int = int(os.environ.get("AUDIT_LOG_MAX_RETRIES", 3))
+    AUDIT_LOG_DEAD_LETTER_FILE: str = os.environ.get("AUDIT_LOG_DEAD_LETTER_FILE", "audit-dead-letter.ndjson")
+    # On PostgreSQL audit_logs has one partition per day, created AUDIT_PARTITION_DAYS_AHEAD in advance.
+    # `python -m app.cli archive-audit-logs` moves days older than AUDIT_RETENTION_DAYS to gzipped NDJSON files
+    AUDIT_PARTITION_DAYS_AHEAD: int = int(os.environ.get("AUDIT_PARTITION_DAYS_AHEAD", 7))
+    # Each worker checks for missing partitions this often (0 = only on startup and from `python -m app.cli ensure-audit-partitions`)
+    AUDIT_PARTITION_CHECK_SECONDS: float = float(os.environ.get("AUDIT_PARTITION_CHECK_SECONDS", 3600))
+    AUDIT_RETENTION_DAYS: int = int(os.environ.get("AUDIT_RETENTION_DAYS", 30))
+    AUDIT_ARCHIVE_DIR: str = os.environ.get("AUDIT_ARCHIVE_DIR", "audit-archive")
+
+    # Dynamic challenge containers: "mock" logs only, "fake" is an in-process stand-in
+    CONTAINER_BACKEND: str = os.environ.get("CONTAINER_BACKEND", "mock")
+    # Addresses handed to containers, as "host:start-end" ranges separated by commas
+    CONTAINER_PORT_RANGES: str = os.environ.get("CONTAINER_PORT_RANGES", "127.0.0.1:10000-20000")
+    # Unused port leases younger than this survive startup reconciliation (starting containers; warm pools renew theirs on every heartbeat)
+    PORT_LEASE_GRACE_SECONDS: float = float(os.environ.get("PORT_LEASE_GRACE_SECONDS", 3600))
+    WARM_POOL_REFILL_WORKERS: int = int(os.environ.get("WARM_POOL_REFILL_WORKERS", 4))
+    # Instance start/stop jobs run on this many threads per worker; jobs stuck for
+    # INSTANCE_JOB_TIMEOUT_SECONDS are failed at startup and on each reaper pass, finished jobs are kept for INSTANCE_JOB_RETENTION_SECONDS
+    INSTANCE_JOB_WORKERS: int = int(os.environ.get("INSTANCE_JOB_WORKERS", 16))
+    INSTANCE_JOB_TIMEOUT_SECONDS: float = float(os.environ.get("INSTANCE_JOB_TIMEOUT_SECONDS", 300))
+    INSTANCE_JOB_RETENTION_SECONDS: float = float(os.environ.get("INSTANCE_JOB_RETENTION_SECONDS", 86400))
+    # Expired instances are stopped and deleted every REAPER_INTERVAL_SECONDS (0 disables the reaper)
+    REAPER_INTERVAL_SECONDS: float = float(os.environ.get("REAPER_INTERVAL_SECONDS", 60))
+    REAPER_BATCH_SIZE: int = int(os.environ.get("REAPER_BATCH_SIZE", 200))
+    REAPER_PARALLELISM: int = int(os.environ.get("REAPER_PARALLELISM", 8))
+
+    # Per-request SQL profiling (off by default, and free when off): requests slower than SLOW_REQUEST_SECONDS
+    # or running more than SLOW_REQUEST_STATEMENTS statements are logged with their queries, and admins can
+    # send X-Debug-Profile: 1 to get a sampling CPU profile, kept PROFILE_TTL_SECONDS at /admin/debug/profiles/{id}
+    REQUEST_PROFILING: bool = os.environ.get("REQUEST_PROFILING", "False").lower() in ("true", "1", "t")
+    SLOW_REQUEST_SECONDS: float = float(os.environ.get("SLOW_REQUEST_SECONDS", 1.0))
+    SLOW_REQUEST_STATEMENTS: int = int(os.environ.get("SLOW_REQUEST_STATEMENTS", 50))
+    PROFILE_SAMPLE_INTERVAL: float = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", 0.005))
+    PROFILE_TTL_SECONDS: int = int(os.environ.get("PROFILE_TTL_SECONDS", 3600))
+
+    # Bearer token Prometheus must send to scrape /metrics; empty leaves it open (restrict it at the proxy)
+    METRICS_TOKEN: str = os.environ.get("METRICS_TOKEN", "")
 
     # OAuth settings for Google
     GOOGLE_CLIENT_ID: str = os.environ.get("GOOGLE_CLIENT_ID", "")
@@ -1,8 +1,18 @@
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func
-from typing import List, Optional
-from . import models, schemas, security
-from datetime import datetime, timedelta
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import cast, func, exists, select, tuple_
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.exc import IntegrityError
+from typing import List, Optional, Tuple
+from . import leaderboard, models, schemas, scoring, security
+from .challenge_graph import ChallengeGraph, build_graph, load_dependencies, topological_order
+from .audit import audit_writer
+from .cache import KeyedCache, VersionedCache, invalidation_bus
+from .notification_hub import publish_broadcast, publish_notification
+from .pagination import decode_cursor
+from .user_cache import invalidate_user
+from datetime import datetime, timedelta, timezone
+import heapq
+import itertools
 import secrets
 
 # ==================================
@@ -32,17 +42,61 @@ def delete_instance(db: Session, instance_id: int):
         db.delete(db_instance)
         db.commit()
 
+def create_instance_job(db: Session, user_id: int, challenge_id: int, action: str, instance_id: Optional[int] = None) -> models.InstanceJob:
+    now = datetime.utcnow()
+    db_job = models.InstanceJob(user_id=user_id, challenge_id=challenge_id, instance_id=instance_id, action=action, status="pending", created_at=now, updated_at=now)
+    db.add(db_job)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+def get_instance_job(db: Session, job_id: int) -> Optional[models.InstanceJob]:
+    return db.query(models.InstanceJob).filter(models.InstanceJob.id == job_id).first()
+
+def get_open_instance_job(db: Session, user_id: int, challenge_id: int, action: str) -> Optional[models.InstanceJob]:
+    return db.query(models.InstanceJob).filter(
+        models.InstanceJob.user_id == user_id,
+        models.InstanceJob.challenge_id == challenge_id,
+        models.InstanceJob.action == action,
+        models.InstanceJob.status.in_(("pending", "running"))
+    ).first()
+
 # ==================================
 # Audit Log CRUD Functions
 # ==================================
 
-def create_audit_log(db: Session, action: str, user_id: Optional[int] = None, details: Optional[dict] = None):
-    db_log = models.AuditLog(user_id=user_id, action=action, details=details)
+def create_audit_log(db: Session, action: str, user_id: Optional[int] = None, details: Optional[dict] = None, commit: bool = True):
+    # commit=False callers need the row in their own transaction, so it never goes through the writer.
+    if audit_writer is not None and commit:
+        audit_writer.record(action, user_id=user_id, details=details)
+        return
+    # Same timestamp source as the audit writer, so cursors compare like with like.
+    db_log = models.AuditLog(user_id=user_id, action=action, details=details, timestamp=datetime.now(timezone.utc))
     db.add(db_log)
-    db.commit()
+    if commit:
+        db.commit()
 
-def get_audit_logs(db: Session, skip: int = 0, limit: int = 100) -> List[models.AuditLog]:
-    return db.query(models.AuditLog).order_by(models.AuditLog.timestamp.desc()).offset(skip).limit(limit).all()
+def audit_log_conditions(db: Session, filters: Optional[schemas.AuditLogFilter]) -> list:
+    if filters is None: return []
+    conditions = []
+    if filters.action is not None: conditions.append(models.AuditLog.action == filters.action)
+    if filters.user_id is not None: conditions.append(models.AuditLog.user_id == filters.user_id)
+    if filters.since is not None: conditions.append(models.AuditLog.timestamp >= filters.since)
+    if filters.until is not None: conditions.append(models.AuditLog.timestamp < filters.until)
+    if filters.challenge_id is not None:
+        if db.get_bind().dialect.name == "postgresql":
+            # Containment is what the GIN index on details::jsonb can answer.
+            conditions.append(cast(models.AuditLog.details, JSONB).contains({"challenge_id": filters.challenge_id}))
+        else:
+            conditions.append(models.AuditLog.details["challenge_id"].as_integer() == filters.challenge_id)
+    return conditions
+def get_audit_logs(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, filters: Optional[schemas.AuditLogFilter] = None) -> List[models.AuditLog]:
+    query = db.query(models.AuditLog).filter(*audit_log_conditions(db, filters)).order_by(models.AuditLog.timestamp.desc(), models.AuditLog.id.desc())
+    after = decode_cursor(cursor, t=datetime.fromisoformat, id=int)
+    if after:
+        return query.filter(tuple_(models.AuditLog.timestamp, models.AuditLog.id) < (after["t"], after["id"])).limit(limit).all()
+    return query.offset(skip).limit(limit).all()
+def audit_logs_cursor(logs: List[models.AuditLog]) -> dict: return {"t": logs[-1].timestamp.isoformat(), "id": logs[-1].id}
 
 # ==================================
 # Settings CRUD Functions
@@ -57,12 +111,25 @@ def get_settings(db: Session) -> models.CTFSetting:
         db.refresh(db_settings)
     return db_settings
 
+settings_cache = VersionedCache("settings")
+
+def get_cached_settings(db: Session) -> schemas.CTFSetting:
+    """
+    Returns a detached snapshot of the CTF settings. The database is only hit
+    after update_settings invalidates the cache on every worker.
+    """
+    return settings_cache.get(lambda: schemas.CTFSetting.model_validate(get_settings(db)))
+
 def update_settings(db: Session, settings_data: schemas.CTFSettingUpdate) -> models.CTFSetting:
     db_settings = get_settings(db)
-    for key, value in settings_data.dict(exclude_unset=True).items():
+    changes = {key: value for key, value in settings_data.dict(exclude_unset=True).items() if getattr(db_settings, key) != value}
+    for key, value in changes.items():
         setattr(db_settings, key, value)
     db.commit()
     db.refresh(db_settings)
+    invalidation_bus.publish("settings")
+    if "scoring_mode" in changes:
+        scoring.rescore(db, db_settings.scoring_mode)
     return db_settings
 
 # ==================================
@@ -72,6 +139,18 @@ def update_settings(db: Session, settings_data: schemas.CTFSettingUpdate) -> mod
 def get_user(db: Session, user_id: int) -> Optional[models.User]:
     return db.query(models.User).filter(models.User.id == user_id).first()
 
+# Loader options for everything schemas.User and schemas.Team serialize, so a
+# response costs one query per relationship instead of one per row.
+def _solve_loads(relationship): return selectinload(relationship).options(selectinload(models.Solve.user), selectinload(models.Solve.team))
+def _user_loads(): return (_solve_loads(models.User.solves), selectinload(models.User.badges).selectinload(models.UserBadge.badge))
+def _team_loads(): return (selectinload(models.Team.members), _solve_loads(models.Team.solves))
+
+def get_user_profile(db: Session, user_id: int) -> Optional[models.User]:
+    """
+    The user with everything schemas.User includes loaded up front.
+    """
+    return db.query(models.User).options(*_user_loads()).filter(models.User.id == user_id).first()
+
 def get_all_users(db: Session) -> List[models.User]:
     """Retrieves all users from the database."""
     return db.query(models.User).all()
@@ -85,11 +164,14 @@ def get_user_by_username(db: Session, username: str):
 def get_user_by_verification_token(db: Session, token: str):
     return db.query(models.User).filter(models.User.verification_token == token).first()
 
-def get_pending_users(db: Session, skip: int = 0, limit: int = 100) -> List[models.User]:
-    return db.query(models.User).filter(models.User.is_active == False).offset(skip).limit(limit).all()
+def get_pending_users(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None) -> List[models.User]:
+    query = db.query(models.User).options(*_user_loads()).filter(models.User.is_active == False).order_by(models.User.id)
+    after = decode_cursor(cursor, id=int)
+    if after:
+        return query.filter(models.User.id > after["id"]).limit(limit).all()
+    return query.offset(skip).limit(limit).all()
 
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = security.get_password_hash(user.password)
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: str):
     verification_token = security.generate_verification_token()
     db_user = models.User(
         username=user.username,
@@ -128,20 +210,57 @@ def approve_user(db: Session, user: models.User) -> models.User:
     user.verification_token = None
     db.commit()
     db.refresh(user)
+    invalidate_user(user.id)
+    return user
+
+def revoke_user_tokens(db: Session, user: models.User) -> models.User:
+    """
+    Invalidates every access token issued to the user so far.
+    """
+    user.token_version = (user.token_version or 0) + 1
+    db.commit()
+    db.refresh(user)
+    invalidate_user(user.id)
     return user
 
 # ==================================
 # Team CRUD Functions
 # ==================================
 
-def get_team(db: Session, team_id: int): return db.query(models.Team).filter(models.Team.id == team_id).first()
+def get_team(db: Session, team_id: int): return db.query(models.Team).options(*_team_loads()).filter(models.Team.id == team_id).first()
 def get_team_by_name(db: Session, name: str): return db.query(models.Team).filter(models.Team.name == name).first()
-def get_teams(db: Session, skip: int = 0, limit: int = 100): return db.query(models.Team).offset(skip).limit(limit).all()
+def get_team_by_id(db: Session, team_id: int): return db.query(models.Team).filter(models.Team.id == team_id).first()
+def get_teams(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    query = db.query(models.Team).options(*_team_loads()).order_by(models.Team.id)
+    after = decode_cursor(cursor, id=int)
+    if after:
+        return query.filter(models.Team.id > after["id"]).limit(limit).all()
+    return query.offset(skip).limit(limit).all()
+def get_team_summaries(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    """
+    Teams with member, solve and score totals in a single query. The totals
+    are correlated subqueries, so only the teams on the page are counted.
+    """
+    members = select(func.count(models.User.id)).where(models.User.team_id == models.Team.id).scalar_subquery()
+    score = select(func.coalesce(func.sum(models.User.score), 0)).where(models.User.team_id == models.Team.id).scalar_subquery()
+    solves = select(func.count(models.Solve.id)).where(models.Solve.team_id == models.Team.id).scalar_subquery()
+    query = db.query(models.Team.id, models.Team.name, members.label("member_count"), score.label("score"), solves.label("solve_count")).order_by(models.Team.id)
+    after = decode_cursor(cursor, id=int)
+    if after:
+        return query.filter(models.Team.id > after["id"]).limit(limit).all()
+    return query.offset(skip).limit(limit).all()
+def id_cursor(rows: list) -> dict: return {"id": rows[-1].id}
 def create_team(db: Session, team: schemas.TeamCreate, user: models.User):
     db_team = models.Team(name=team.name); db.add(db_team); db.commit(); db.refresh(db_team)
-    user.team_id = db_team.id; db.commit(); db.refresh(user); return db_team
-def add_user_to_team(db: Session, user: models.User, team: models.Team): user.team_id = team.id; db.commit(); db.refresh(user); return user
-def remove_user_from_team(db: Session, user: models.User): user.team_id = None; db.commit(); db.refresh(user); return user
+    user.team_id = db_team.id; db.commit(); db.refresh(user); invalidate_user(user.id)
+    leaderboard.move_user(user.id, None, db_team.id, team_name=db_team.name); bump_solver_topics(db, user.id); return db_team
+def add_user_to_team(db: Session, user: models.User, team: models.Team):
+    user.team_id = team.id; db.commit(); db.refresh(user); invalidate_user(user.id)
+    leaderboard.move_user(user.id, None, team.id, team_name=team.name); bump_solver_topics(db, user.id); return user
+def remove_user_from_team(db: Session, user: models.User):
+    old_team_id = user.team_id
+    user.team_id = None; db.commit(); db.refresh(user); invalidate_user(user.id)
+    leaderboard.move_user(user.id, old_team_id, None); bump_solver_topics(db, user.id); return user
 
 # ==================================
 # Challenge & Solve CRUD Functions
@@ -150,20 +269,237 @@ def remove_user_from_team(db: Session, user: models.User): user.team_id = None;
 def has_user_solved_challenge(db: Session, user_id: int, challenge_id: int) -> bool: return db.query(models.Solve).filter(models.Solve.user_id == user_id, models.Solve.challenge_id == challenge_id).first() is not None
 def get_solve_count_for_challenge(db: Session, challenge_id: int) -> int: return db.query(models.Solve).filter(models.Solve.challenge_id == challenge_id).count()
 def get_user_solved_challenge_ids(db: Session, user_id: int) -> set: return {s.challenge_id for s in db.query(models.Solve.challenge_id).filter(models.Solve.user_id == user_id).all()}
+challenge_graph_cache = VersionedCache("challenges")
+
+def get_challenge_graph(db: Session) -> ChallengeGraph:
+    """
+    Returns the compiled dependency graph. It is rebuilt only after a challenge
+    or its dependencies change.
+    """
+    return challenge_graph_cache.get(lambda: build_graph(db))
+
+# Validators for the challenge endpoints, besides "challenges" (admin edits) and
+# scoring.CHALLENGE_POINTS_TOPIC: a user solving something, a challenge being solved.
+def solved_topic(user_id: int) -> str: return f"solved:{user_id}"
+def challenge_solves_topic(challenge_id: int) -> str: return f"challenge-solves:{challenge_id}"
+def challenge_list_versions(user_id: int) -> Optional[tuple]: return invalidation_bus.versions("challenges", scoring.CHALLENGE_POINTS_TOPIC, solved_topic(user_id))
+def challenge_detail_versions(user_id: int, challenge_id: int) -> Optional[tuple]: return invalidation_bus.versions("challenges", scoring.CHALLENGE_POINTS_TOPIC, solved_topic(user_id), challenge_solves_topic(challenge_id))
+def bump_solver_topics(db: Session, user_id: int):
+    """
+    A challenge's detail lists its solvers with their score and team, so the
+    details of everything a user solved go stale when either changes.
+    """
+    invalidation_bus.bump(*(challenge_solves_topic(challenge_id) for challenge_id in get_user_solved_challenge_ids(db, user_id)))
+challenge_catalog_cache = KeyedCache()
+# Versions restart from zero if Redis loses its data.
+invalidation_bus.subscribe("reconnect", lambda version: challenge_catalog_cache.clear())
+
+def _load_challenge_catalog(db: Session) -> list:
+    rows = db.query(models.Challenge.id, models.Challenge.name, models.Challenge.points).filter(models.Challenge.is_visible == True).order_by(models.Challenge.id).all()
+    # Each entry is serialized up to the per-user "is_locked" value.
+    return [(row.id, schemas.ChallengeList(id=row.id, name=row.name, points=row.points).model_dump_json(exclude={"is_locked"})[:-1].encode() + b',"is_locked":') for row in rows]
+
+def get_challenge_list_body(db: Session, user_id: int, catalog_version: Optional[tuple]) -> bytes:
+    """
+    The serialized challenge list for a user. The catalog is serialized once
+    per `catalog_version` and shared by all users; only the lock flags are
+    filled in per request.
+    """
+    catalog = challenge_catalog_cache.get(catalog_version, lambda: _load_challenge_catalog(db))
+    graph = get_challenge_graph(db)
+    solved_mask = graph.solved_mask(get_user_solved_challenge_ids(db, user_id))
+    return b"[" + b",".join(entry + (b"true}" if graph.is_locked(challenge_id, solved_mask) else b"false}") for challenge_id, entry in catalog) + b"]"
+
 def get_visible_challenges(db: Session, user_id: int) -> List[models.Challenge]:
-    challenges = db.query(models.Challenge).options(joinedload(models.Challenge.dependencies)).filter(models.Challenge.is_visible == True).all()
-    solved_ids = get_user_solved_challenge_ids(db, user_id)
-    for c in challenges: c.is_locked = not {d.id for d in c.dependencies}.issubset(solved_ids)
+    challenges = db.query(models.Challenge).filter(models.Challenge.is_visible == True).all()
+    graph = get_challenge_graph(db)
+    solved_mask = graph.solved_mask(get_user_solved_challenge_ids(db, user_id))
+    for c in challenges: c.is_locked = graph.is_locked(c.id, solved_mask)
     return challenges
 def get_challenge(db: Session, challenge_id: int, user_id: int) -> Optional[models.Challenge]:
-    challenge = db.query(models.Challenge).options(joinedload(models.Challenge.dependencies)).filter(models.Challenge.id == challenge_id).first()
+    challenge = db.query(models.Challenge).filter(models.Challenge.id == challenge_id).first()
     if not challenge: return None
-    solved_ids = get_user_solved_challenge_ids(db, user_id)
-    challenge.is_locked = not {d.id for d in challenge.dependencies}.issubset(solved_ids)
+    graph = get_challenge_graph(db)
+    challenge.is_locked = graph.is_locked(challenge.id, graph.solved_mask(get_user_solved_challenge_ids(db, user_id)))
     return challenge
 def create_solve(db: Session, user: models.User, challenge: models.Challenge) -> models.Solve:
     db_solve = models.Solve(user_id=user.id, challenge_id=challenge.id, team_id=user.team_id); db.add(db_solve); db.commit(); db.refresh(db_solve); return db_solve
 
+# ==================================
+# Challenge Management (Admin)
+# ==================================
+
+def get_challenges(db: Session, skip: int = 0, limit: int = 100) -> List[models.Challenge]: return db.query(models.Challenge).order_by(models.Challenge.id).offset(skip).limit(limit).all()
+def get_challenge_by_id(db: Session, challenge_id: int) -> Optional[models.Challenge]: return db.query(models.Challenge).filter(models.Challenge.id == challenge_id).first()
+
+SCORING_FIELDS = {"points", "initial_points", "minimum_points", "decay_factor"}
+
+def _check_dependencies(db: Session, challenge_id: Optional[int], dependency_ids: List[int]) -> List[models.Challenge]:
+    """
+    Validates a new dependency list for a challenge against the current graph.
+    Raises ValueError for unknown ids and DependencyCycleError for cycles.
+    """
+    dependencies = db.query(models.Challenge).filter(models.Challenge.id.in_(dependency_ids)).all() if dependency_ids else []
+    missing = set(dependency_ids) - {d.id for d in dependencies}
+    if missing:
+        raise ValueError(f"Unknown dependency challenge ids: {sorted(missing)}")
+    if challenge_id is not None:
+        graph = load_dependencies(db)
+        graph[challenge_id] = set(dependency_ids)
+        topological_order(graph)
+    return dependencies
+
+def _get_tags(db: Session, tag_ids: List[int]) -> List[models.Tag]:
+    tags = db.query(models.Tag).filter(models.Tag.id.in_(tag_ids)).all() if tag_ids else []
+    missing = set(tag_ids) - {t.id for t in tags}
+    if missing:
+        raise ValueError(f"Unknown tag ids: {sorted(missing)}")
+    return tags
+
+def create_challenge(db: Session, challenge: schemas.ChallengeCreate) -> models.Challenge:
+    data = challenge.dict(exclude={"tags", "dependencies"})
+    db_challenge = models.Challenge(**data, static_points=data["points"])
+    # A brand-new challenge has no dependents, so it cannot close a cycle.
+    db_challenge.dependencies = _check_dependencies(db, None, challenge.dependencies)
+    db_challenge.tags = _get_tags(db, challenge.tags)
+    db.add(db_challenge); db.commit(); db.refresh(db_challenge)
+    invalidation_bus.publish("challenges")
+    return db_challenge
+
+def update_challenge(db: Session, db_challenge: models.Challenge, challenge_data: schemas.ChallengeUpdate) -> models.Challenge:
+    data = challenge_data.dict(exclude_unset=True)
+    if "dependencies" in data:
+        db_challenge.dependencies = _check_dependencies(db, db_challenge.id, data.pop("dependencies") or [])
+    if "tags" in data:
+        db_challenge.tags = _get_tags(db, data.pop("tags") or [])
+    rescore_needed = any(key in SCORING_FIELDS and getattr(db_challenge, key) != value for key, value in data.items())
+    if "points" in data:
+        data["static_points"] = data["points"]
+    for key, value in data.items():
+        setattr(db_challenge, key, value)
+    db.commit()
+    if rescore_needed:
+        scoring.rescore(db, get_cached_settings(db).scoring_mode)
+    db.refresh(db_challenge)
+    invalidation_bus.publish("challenges")
+    return db_challenge
+
+def delete_challenge(db: Session, db_challenge: models.Challenge):
+    db_challenge.dependencies = []
+    db_challenge.dependent_challenges = []
+    db_challenge.tags = []
+    db.delete(db_challenge); db.commit()
+    invalidation_bus.publish("challenges")
+
+# ==================================
+# Flag Submission Service
+# ==================================
+
+SUBMIT_NOT_FOUND = "not_found"
+SUBMIT_LOCKED = "locked"
+SUBMIT_ALREADY_SOLVED = "already_solved"
+SUBMIT_INCORRECT = "incorrect"
+SUBMIT_CORRECT = "correct"
+
+def _get_submission_state(db: Session, user_id: int, challenge_id: int):
+    """
+    Loads everything a submission needs to know about a challenge in a single SELECT:
+    the flag and points, whether the user already solved it, how many of its
+    dependencies the user has not solved yet, and whether anyone has solved it.
+    """
+    deps = models.challenge_dependencies
+    already_solved = exists().where(models.Solve.user_id == user_id, models.Solve.challenge_id == models.Challenge.id)
+    unmet_dependencies = select(func.count()).select_from(deps).where(
+        deps.c.challenge_id == models.Challenge.id,
+        ~exists().where(models.Solve.user_id == user_id, models.Solve.challenge_id == deps.c.dependency_id)
+    ).scalar_subquery()
+    has_solves = exists().where(models.Solve.challenge_id == models.Challenge.id)
+    return db.query(
+        models.Challenge.id, models.Challenge.name, models.Challenge.flag, models.Challenge.points,
+        models.Challenge.is_visible, models.Challenge.initial_points, models.Challenge.minimum_points,
+        models.Challenge.decay_factor, already_solved.label("already_solved"),
+        unmet_dependencies.label("unmet_dependencies"), has_solves.label("has_solves")
+    ).filter(models.Challenge.id == challenge_id).first()
+
+def submit_flag(db: Session, user: schemas.CurrentUser, challenge_id: int, flag: str) -> str:
+    """
+    Checks a flag submission and publishes a solve right away. Returns one of
+    the SUBMIT_* status strings.
+    """
+    result, solve = check_flag(db, user=user, challenge_id=challenge_id, flag=flag, scoring_mode=get_cached_settings(db).scoring_mode)
+    if solve is not None:
+        publish_solve(**solve)
+    return result
+
+def check_flag(db: Session, user: schemas.CurrentUser, challenge_id: int, flag: str, scoring_mode: str) -> Tuple[str, Optional[dict]]:
+    """
+    Checks a flag submission and, when correct, records the solve, bumps the user's
+    score, writes the audit row and awards First Blood in a single transaction.
+
+    Only touches the database, so async routes can run it with `run_sync`.
+    Returns one of the SUBMIT_* status strings and, for a correct flag, the
+    keyword arguments of publish_solve.
+    """
+    # Read these up front: commit() expires the instance.
+    user_id, username, team_id = user.id, user.username, user.team_id
+    state = _get_submission_state(db, user_id=user_id, challenge_id=challenge_id)
+    if state is None or not state.is_visible:
+        return SUBMIT_NOT_FOUND, None
+    if state.unmet_dependencies:
+        return SUBMIT_LOCKED, None
+    if state.already_solved:
+        return SUBMIT_ALREADY_SOLVED, None
+
+    if not security.compare_flags(flag, state.flag):
+        create_audit_log(db, action="flag_submit_incorrect", user_id=user_id, details={"challenge_id": challenge_id, "submission": flag})
+        return SUBMIT_INCORRECT, None
+
+    try:
+        db.add(models.Solve(user_id=user_id, challenge_id=challenge_id, team_id=team_id))
+        db.flush()
+    except IntegrityError:
+        # A concurrent request from the same user won the race on _user_challenge_uc.
+        db.rollback()
+        return SUBMIT_ALREADY_SOLVED, None
+    points, value_delta = state.points, 0
+    if scoring_mode == scoring.DYNAMIC and scoring.is_dynamic(state.initial_points, state.minimum_points, state.decay_factor):
+        points, value_delta = scoring.apply_dynamic_solve(db, challenge_id, user_id, state.initial_points, state.minimum_points, state.decay_factor)
+    db.query(models.User).filter(models.User.id == user_id).update(
+        {models.User.score: models.User.score + points}, synchronize_session=False
+    )
+    create_audit_log(db, action="flag_submit_correct", user_id=user_id, details={"challenge_id": challenge_id, "submission": flag}, commit=False)
+
+    badge_notification = None
+    if not state.has_solves:
+        first_blood_badge = get_badge_by_name(db, name="First Blood")
+        if first_blood_badge and not db.query(exists().where(models.UserBadge.user_id == user_id, models.UserBadge.badge_id == first_blood_badge.id)).scalar():
+            db.add(models.UserBadge(user_id=user_id, badge_id=first_blood_badge.id))
+            badge_notification = models.Notification(user_id=user_id, title="New Badge Earned!", body=f"You earned the '{first_blood_badge.name}' badge for '{state.name}'.")
+            db.add(badge_notification)
+    # Includes this challenge, whose solver list just grew.
+    solved_challenge_ids = get_user_solved_challenge_ids(db, user_id)
+    earlier_solvers = scoring.get_earlier_solvers(db, challenge_id, exclude_user_id=user_id) if value_delta else []
+    db.commit()
+    return SUBMIT_CORRECT, {
+        "user_id": user_id, "username": username, "team_id": team_id, "points": points, "challenge_id": challenge_id,
+        "solved_challenge_ids": solved_challenge_ids, "value_delta": value_delta, "earlier_solvers": earlier_solvers,
+        "notification": schemas.Notification.model_validate(badge_notification) if badge_notification is not None else None,
+    }
+
+def publish_solve(user_id: int, username: str, team_id: Optional[int], points: int, challenge_id: int, solved_challenge_ids: set,
+                  value_delta: int, earlier_solvers: list, notification: Optional[schemas.Notification]):
+    """
+    The Redis side of a committed solve: the leaderboard, the cache validators
+    and the badge notification. Blocking, so async routes run it in the threadpool.
+    """
+    if notification is not None:
+        publish_notification(notification)
+    leaderboard.record_solve(user_id, username, team_id, points, datetime.now(timezone.utc))
+    invalidation_bus.bump(solved_topic(user_id), *(challenge_solves_topic(solved_id) for solved_id in solved_challenge_ids))
+    if value_delta:
+        invalidation_bus.bump(scoring.CHALLENGE_POINTS_TOPIC)
+        scoring.publish_value_change(challenge_id, earlier_solvers, delta=value_delta)
+
 # ==================================
 # Badge & Notification CRUD
 # ==================================
@@ -187,16 +523,55 @@ def award_badge_to_user(db: Session, user: models.User, badge: models.Badge) ->
     if db.query(models.UserBadge).filter(models.UserBadge.user_id == user.id, models.UserBadge.badge_id == badge.id).first(): return None
     db_user_badge = models.UserBadge(user_id=user.id, badge_id=badge.id); db.add(db_user_badge); db.commit(); db.refresh(db_user_badge); return db_user_badge
 def create_notification(db: Session, user_id: int, title: str, body: str) -> models.Notification:
-    db_notification = models.Notification(user_id=user_id, title=title, body=body); db.add(db_notification); db.commit(); db.refresh(db_notification); return db_notification
-def get_notifications_for_user(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[models.Notification]: return db.query(models.Notification).filter(models.Notification.user_id == user_id).order_by(models.Notification.created_at.desc()).offset(skip).limit(limit).all()
+    db_notification = models.Notification(user_id=user_id, title=title, body=body); db.add(db_notification); db.commit(); db.refresh(db_notification)
+    publish_notification(db_notification); return db_notification
+def get_notifications_for_user(db: Session, user_id: int, skip: int = 0, limit: int = 100, cursor: Optional[str] = None) -> List[schemas.Notification]:
+    """
+    The user's own notifications merged with broadcasts, newest first.
+    Broadcasts are stored once; whether this user has read one comes from
+    the sparse broadcast_reads table. A cursor holds the last id taken from
+    each source, so both are read with an index range scan.
+    """
+    after = decode_cursor(cursor, n=int, b=int)
+    window = limit if after else skip + limit
+    personal = db.query(models.Notification).filter(models.Notification.user_id == user_id)
+    broadcasts = db.query(models.BroadcastNotification, models.BroadcastRead.user_id.isnot(None)).outerjoin(
+        models.BroadcastRead, (models.BroadcastRead.broadcast_id == models.BroadcastNotification.id) & (models.BroadcastRead.user_id == user_id)
+    )
+    if after:
+        personal = personal.filter(models.Notification.id < after["n"])
+        broadcasts = broadcasts.filter(models.BroadcastNotification.id < after["b"])
+    merged = heapq.merge(
+        (schemas.Notification.model_validate(n) for n in personal.order_by(models.Notification.id.desc()).limit(window)),
+        (broadcast_for_user(b, user_id, is_read) for b, is_read in broadcasts.order_by(models.BroadcastNotification.id.desc()).limit(window)),
+        key=lambda n: n.created_at, reverse=True,
+    )
+    return list(itertools.islice(merged, 0 if after else skip, window))
+def notifications_cursor(notifications: List[schemas.Notification], cursor: Optional[str] = None) -> dict:
+    after = decode_cursor(cursor, n=int, b=int) or {"n": 2**63 - 1, "b": 2**63 - 1}
+    for n in notifications:
+        key = "b" if n.kind == "broadcast" else "n"
+        after[key] = min(after[key], n.id)
+    return after
+def get_notifications_since(db: Session, user_id: int, after_id: int, limit: int = 100) -> List[models.Notification]: return db.query(models.Notification).filter(models.Notification.user_id == user_id, models.Notification.id > after_id).order_by(models.Notification.id).limit(limit).all()
+def get_latest_notification_id(db: Session, user_id: int) -> int: return db.query(func.max(models.Notification.id)).filter(models.Notification.user_id == user_id).scalar() or 0
+def broadcast_for_user(broadcast: models.BroadcastNotification, user_id: int, is_read: bool) -> schemas.Notification:
+    return schemas.Notification(id=broadcast.id, user_id=user_id, title=broadcast.title, body=broadcast.body, is_read=bool(is_read), created_at=broadcast.created_at, kind="broadcast")
+def create_broadcast(db: Session, broadcast: schemas.BroadcastCreate) -> models.BroadcastNotification:
+    db_broadcast = models.BroadcastNotification(**broadcast.model_dump()); db.add(db_broadcast); db.commit(); db.refresh(db_broadcast)
+    publish_broadcast(db_broadcast); return db_broadcast
+def get_broadcast(db: Session, broadcast_id: int) -> Optional[models.BroadcastNotification]: return db.query(models.BroadcastNotification).filter(models.BroadcastNotification.id == broadcast_id).first()
+def mark_broadcast_as_read(db: Session, broadcast_id: int, user_id: int) -> Optional[schemas.Notification]:
+    db_broadcast = get_broadcast(db, broadcast_id)
+    if db_broadcast is None: return None
+    if not db.query(exists().where(models.BroadcastRead.user_id == user_id, models.BroadcastRead.broadcast_id == broadcast_id)).scalar():
+        try:
+            db.add(models.BroadcastRead(user_id=user_id, broadcast_id=broadcast_id)); db.commit()
+        except IntegrityError:
+            db.rollback()
+    return broadcast_for_user(db_broadcast, user_id, True)
 def get_notification(db: Session, notification_id: int, user_id: int) -> Optional[models.Notification]: return db.query(models.Notification).filter(models.Notification.id == notification_id, models.Notification.user_id == user_id).first()
 def mark_notification_as_read(db: Session, notification_id: int, user_id: int) -> Optional[models.Notification]:
     db_notification = get_notification(db, notification_id, user_id)
     if db_notification: db_notification.is_read = True; db.commit(); db.refresh(db_notification)
     return db_notification
-
-# ==================================
-# Leaderboard CRUD
-# ==================================
-
-def get_leaderboard(db: Session): return db.query(models.Team.id, models.Team.name, func.sum(models.User.score).label("total_score"), func.max(models.Solve.created_at).label("last_submission")).join(models.User, models.Team.id == models.User.team_id).outerjoin(models.Solve, models.Team.id == models.Solve.team_id).group_by(models.Team.id).order_by(func.sum(models.User.score).desc(), func.max(models.Solve.created_at).asc()).all()
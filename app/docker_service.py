@@ -1,40 +1,128 @@
+import abc
 import secrets
-import random
+import threading
+import time
+from typing import Optional
 
 from . import models
+from .config import settings
+from .port_allocator import port_allocator
 
 # In a real implementation, this would interact with the Docker SDK.
-# For now, these are placeholder functions to simulate the behavior.
+# For now, the backends below simulate the behavior.
+
+class ContainerBackend(abc.ABC):
+    """
+    Interface for whatever runs dynamic challenge containers.
+    """
+
+    @abc.abstractmethod
+    def start(self, challenge_id: int, challenge_name: str, host: str, port: int) -> dict:
+        """
+        Starts a container published on host:port and returns
+        {"container_id": ..., "host": ..., "port": ...}.
+        """
+
+    @abc.abstractmethod
+    def stop(self, container_id: str):
+        pass
+
+
+class MockContainerBackend(ContainerBackend):
+    """
+    Placeholder backend that only logs what it would do.
+    """
+
+    def start(self, challenge_id: int, challenge_name: str, host: str, port: int) -> dict:
+        print(f"INFO: Simulating start of container for challenge: {challenge_name} on {host}:{port}")
+
+        # Generate mock data
+        mock_container_id = f"mock_container_{secrets.token_hex(8)}"
+
+        return {
+            "container_id": mock_container_id,
+            "host": host,
+            "port": port
+        }
+
+    def stop(self, container_id: str):
+        print(f"INFO: Simulating stop of container ID: {container_id}")
+
+
+class FakeContainerBackend(ContainerBackend):
+    """
+    In-process backend for tests and benchmarks. It keeps track of running
+    containers and can sleep to simulate slow container starts.
+    """
+
+    def __init__(self, start_delay: float = 0.0, stop_delay: float = 0.0):
+        self.start_delay = start_delay
+        self.stop_delay = stop_delay
+        self.running = {}
+        self.started = 0
+        self.stopped = 0
+        self._lock = threading.Lock()
+
+    def start(self, challenge_id: int, challenge_name: str, host: str, port: int) -> dict:
+        if self.start_delay:
+            time.sleep(self.start_delay)
+        container_id = f"fake_{secrets.token_hex(8)}"
+        with self._lock:
+            self.running[container_id] = challenge_id
+            self.started += 1
+        return {"container_id": container_id, "host": host, "port": port}
+
+    def stop(self, container_id: str):
+        if self.stop_delay:
+            time.sleep(self.stop_delay)
+        with self._lock:
+            self.running.pop(container_id, None)
+            self.stopped += 1
+
+
+BACKENDS = {"mock": MockContainerBackend, "fake": FakeContainerBackend}
+backend: ContainerBackend = BACKENDS[settings.CONTAINER_BACKEND]()
+
+
+def launch_container(challenge_id: int, challenge_name: str, container_backend: Optional[ContainerBackend] = None) -> dict:
+    """
+    Leases a free address and starts a container on it. The lease is given
+    back if the container fails to start.
+    """
+    host, port = port_allocator.lease()
+    try:
+        return (container_backend or backend).start(challenge_id, challenge_name, host, port)
+    except Exception:
+        port_allocator.release(host, port)
+        raise
+
+def teardown_container(container: dict, container_backend: Optional[ContainerBackend] = None):
+    """
+    Stops a container started by launch_container and releases its address.
+    """
+    (container_backend or backend).stop(container["container_id"])
+    port_allocator.release(container["host"], container["port"])
+
 
 def start_challenge_container(challenge: models.Challenge) -> dict:
     """
-    Placeholder for starting a Docker container for a challenge.
-    
+    Starts a container for a challenge on the configured backend.
+
     Args:
         challenge: The Challenge object for which to start a container.
-        
+
     Returns:
-        A dictionary with mock container details.
-    """
-    print(f"INFO: Simulating start of container for challenge: {challenge.name}")
-    
-    # Generate mock data
-    mock_container_id = f"mock_container_{secrets.token_hex(8)}"
-    mock_port = random.randint(10000, 20000)
-    
-    return {
-        "container_id": mock_container_id,
-        "port": mock_port
-    }
-
-def stop_challenge_container(container_id: str):
-    """
-    Placeholder for stopping a Docker container.
-    
+        A dictionary with the container id, host and port.
+    """
+    return launch_container(challenge.id, challenge.name)
+
+def stop_challenge_container(container_id: str, host: str, port: int):
+    """
+    Stops a container on the configured backend and frees its address.
+
     Args:
         container_id: The ID of the container to stop.
+        host: The host the container was published on.
+        port: The port the container was published on.
     """
-    print(f"INFO: Simulating stop of container ID: {container_id}")
-    # In a real implementation, you would use the container_id to find
-    # and stop the actual Docker container.
-    pass
+    teardown_container({"container_id": container_id, "host": host, "port": port})
@@ -1,7 +1,20 @@
+import asyncio
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.message import EmailMessage
+from typing import Dict, Iterator, List, Optional
+
+import aiosmtplib
+import redis
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
-from typing import List
+from sqlalchemy import func, select
 
+from . import models
+from .cache import get_redis
 from .config import settings
+from .database import SessionLocal
 
 conf = ConnectionConfig(
     MAIL_USERNAME=settings.MAIL_USERNAME,
@@ -12,7 +25,8 @@ conf = ConnectionConfig(
     MAIL_STARTTLS=settings.MAIL_STARTTLS,
     MAIL_SSL_TLS=settings.MAIL_SSL_TLS,
     USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True
+    VALIDATE_CERTS=True,
+    SUPPRESS_SEND=int(settings.MAIL_SUPPRESS_SEND)
 )
 
 async def send_verification_email(email_to: str, username: str, token: str):
@@ -46,3 +60,252 @@ async def send_verification_email(email_to: str, username: str, token: str):
     except Exception as e:
         # In a production environment, you would log this error.
         print(f"Failed to send email: {e}")
+
+
+# ==================================
+# Mass email
+# ==================================
+
+MAIL_JOB_KEY = "ctf:mail-job:{job_id}"
+MAIL_JOB_TTL = 7 * 24 * 3600
+
+
+class SMTPConnectionPool:
+    """
+    A fixed number of SMTP connections that are opened on first use and kept
+    open across messages. A connection that fails is dropped and reopened by
+    its next user.
+    """
+
+    def __init__(self, size: int, hostname: str, port: int, username: str = "", password: str = "", use_tls: bool = False, start_tls: bool = False, timeout: float = 30):
+        self.size = size
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.start_tls = start_tls
+        self.timeout = timeout
+        self._idle: asyncio.Queue = asyncio.Queue()
+        for _ in range(size):
+            self._idle.put_nowait(None)
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        client = aiosmtplib.SMTP(hostname=self.hostname, port=self.port, use_tls=self.use_tls, start_tls=self.start_tls, timeout=self.timeout)
+        await client.connect()
+        if self.username and client.supports_extension("auth"):
+            await client.login(self.username, self.password)
+        return client
+
+    @asynccontextmanager
+    async def connection(self):
+        client = await self._idle.get()
+        try:
+            if client is None or not client.is_connected:
+                client = await self._connect()
+            yield client
+        except (aiosmtplib.SMTPException, OSError):
+            if client is not None:
+                client.close()
+            client = None
+            raise
+        finally:
+            self._idle.put_nowait(client)
+
+    async def close(self):
+        for _ in range(self.size):
+            client = await self._idle.get()
+            if client is not None and client.is_connected:
+                try:
+                    await client.quit()
+                except (aiosmtplib.SMTPException, OSError):
+                    client.close()
+        for _ in range(self.size):
+            self._idle.put_nowait(None)
+
+
+def default_smtp_pool() -> SMTPConnectionPool:
+    return SMTPConnectionPool(
+        size=settings.MAIL_POOL_SIZE,
+        hostname=settings.MAIL_SERVER,
+        port=settings.MAIL_PORT,
+        username=settings.MAIL_USERNAME,
+        password=settings.MAIL_PASSWORD,
+        use_tls=settings.MAIL_SSL_TLS,
+        start_tls=settings.MAIL_STARTTLS,
+        timeout=settings.MAIL_TIMEOUT,
+    )
+
+
+class MassMailer:
+    """
+    Sends one message to every user in the background.
+
+    Recipient addresses are streamed from the database in batches of
+    `batch_size` with a column-only query (a server-side cursor on
+    PostgreSQL), so memory use does not grow with the number of users. Each
+    batch is one SMTP transaction with the recipients as envelope-only (Bcc)
+    addresses, sent over a pool of persistent connections; at most one batch
+    is in flight per connection. A batch that fails with a temporary error is
+    retried up to `max_retries` times with backoff. Progress is kept in Redis
+    so any worker can report it.
+    """
+
+    def __init__(self, pool_factory=default_smtp_pool, session_factory=SessionLocal, batch_size: int = 50, max_retries: int = 3, retry_delay: float = 1.0):
+        self.pool_factory = pool_factory
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._jobs: Dict[str, dict] = {}
+        self._tasks = set()
+
+    def _save_progress(self, job_id: str):
+        try:
+            key = MAIL_JOB_KEY.format(job_id=job_id)
+            client = get_redis()
+            client.hset(key, mapping={k: "" if v is None else v for k, v in self._jobs[job_id].items()})
+            client.expire(key, MAIL_JOB_TTL)
+        except redis.RedisError:
+            pass
+
+    def get_progress(self, job_id: str) -> Optional[dict]:
+        if job_id in self._jobs:
+            return dict(self._jobs[job_id])
+        try:
+            raw = get_redis().hgetall(MAIL_JOB_KEY.format(job_id=job_id))
+        except redis.RedisError:
+            return None
+        if not raw:
+            return None
+        progress = {k.decode(): v.decode() for k, v in raw.items()}
+        for name in ("total", "sent", "failed", "batches", "retries"):
+            progress[name] = int(progress.get(name) or 0)
+        return {k: (v if v != "" else None) for k, v in progress.items()}
+
+    def _recipient_batches(self) -> Iterator[List[str]]:
+        db = self.session_factory()
+        try:
+            result = db.execute(
+                select(models.User.email).order_by(models.User.id).execution_options(yield_per=self.batch_size)
+            )
+            for batch in result.scalars().partitions():
+                yield batch
+        finally:
+            db.close()
+
+    def count_recipients(self) -> int:
+        db = self.session_factory()
+        try:
+            return db.execute(select(func.count(models.User.id))).scalar()
+        finally:
+            db.close()
+
+    def _build_message(self, subject: str, body: str) -> EmailMessage:
+        message = EmailMessage()
+        message["From"] = settings.MAIL_FROM
+        message["To"] = settings.MAIL_FROM
+        message["Subject"] = subject
+        message.set_content(body, subtype="html")
+        return message
+
+    async def _send_batch(self, pool: SMTPConnectionPool, message: EmailMessage, batch: List[str], progress: dict):
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with pool.connection() as client:
+                    refused, _ = await client.send_message(message, recipients=batch)
+            except aiosmtplib.SMTPRecipientsRefused as e:
+                progress["failed"] += len(batch)
+                print(f"WARNING: Mass email batch refused by the server: {e}")
+                return
+            except (aiosmtplib.SMTPException, OSError) as e:
+                permanent = isinstance(e, aiosmtplib.SMTPResponseException) and e.code >= 500
+                if permanent or attempt == self.max_retries:
+                    progress["failed"] += len(batch)
+                    print(f"ERROR: Failed to send mass email batch of {len(batch)} recipients: {e}")
+                    return
+                progress["retries"] += 1
+                await asyncio.sleep(self.retry_delay * 2 ** attempt)
+            else:
+                progress["sent"] += len(batch) - len(refused)
+                progress["failed"] += len(refused)
+                progress["batches"] += 1
+                return
+
+    async def run(self, job_id: str, subject: str, body: str):
+        progress = self._jobs[job_id]
+        progress["status"] = "running"
+        self._save_progress(job_id)
+        message = self._build_message(subject, body)
+        pool = self.pool_factory()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=pool.size * 2)
+        last_saved = time.monotonic()
+
+        async def sender():
+            nonlocal last_saved
+            while True:
+                batch = await queue.get()
+                if batch is None:
+                    return
+                await self._send_batch(pool, message, batch, progress)
+                if time.monotonic() - last_saved > 0.5:
+                    last_saved = time.monotonic()
+                    self._save_progress(job_id)
+
+        senders = [asyncio.create_task(sender()) for _ in range(pool.size)]
+        batches = self._recipient_batches()
+        try:
+            while True:
+                batch = await asyncio.to_thread(next, batches, None)
+                if batch is None:
+                    break
+                await queue.put(batch)
+        except Exception as e:
+            progress["error"] = str(e)
+            print(f"ERROR: Mass email job {job_id} failed: {e}")
+        finally:
+            for _ in senders:
+                await queue.put(None)
+            await asyncio.gather(*senders, return_exceptions=True)
+            batches.close()
+            await pool.close()
+            progress["status"] = "failed" if progress["error"] else "completed"
+            progress["finished_at"] = datetime.now(timezone.utc).isoformat()
+            self._save_progress(job_id)
+
+    def start(self, subject: str, body: str, recipient_count: int) -> str:
+        """
+        Schedules a mass email on the running event loop and returns its job id.
+        """
+        job_id = uuid.uuid4().hex
+        self._jobs[job_id] = {
+            "job_id": job_id, "status": "pending", "subject": subject, "total": recipient_count,
+            "sent": 0, "failed": 0, "batches": 0, "retries": 0,
+            "started_at": datetime.now(timezone.utc).isoformat(), "finished_at": None, "error": None,
+        }
+        self._save_progress(job_id)
+        task = asyncio.create_task(self.run(job_id, subject, body))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job_id
+
+    async def wait(self):
+        """
+        Waits for every running job of this worker, e.g. on shutdown.
+        """
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+
+mass_mailer = MassMailer(batch_size=settings.MAIL_BATCH_SIZE, max_retries=settings.MAIL_MAX_RETRIES)
+
+
+async def send_mass_email(subject: str, body: str) -> dict:
+    """
+    Starts a background mass email to every user. Returns the job id and the
+    number of recipients.
+    """
+    recipient_count = await asyncio.to_thread(mass_mailer.count_recipients)
+    if not recipient_count:
+        return {"job_id": None, "recipient_count": 0}
+    return {"job_id": mass_mailer.start(subject, body, recipient_count), "recipient_count": recipient_count}
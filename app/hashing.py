@@ -0,0 +1,74 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+
+from . import security
+from .config import settings
+
+
+class HashingBusy(Exception):
+    """
+    Raised when the hashing queue is full; callers should retry later.
+    """
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a pool of worker processes so hashing neither blocks the
+    event loop nor eats the shared threadpool, and uses every core.
+
+    At most `max_pending` jobs may be queued or running; beyond that, calls
+    fail fast with HashingBusy instead of piling up. With `workers=0` hashing
+    runs inline, which is useful for tests and scripts.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Spawned, not forked: the parent has background threads running.
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _submit(self, fn, *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HashingBusy("Password hashing queue is full.")
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def hash(self, password: str) -> str:
+        if not self.workers:
+            return security.get_password_hash(password)
+        return await asyncio.wrap_future(self._submit(security.get_password_hash, password))
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        if not self.workers:
+            return security.verify_password(plain_password, hashed_password)
+        return await asyncio.wrap_future(self._submit(security.verify_password, plain_password, hashed_password))
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+# Every app worker has its own pool, so by default they share the cores instead of each taking all of them.
+_workers = settings.HASHING_WORKERS if settings.HASHING_WORKERS >= 0 else max(1, (os.cpu_count() or 1) // max(settings.WEB_CONCURRENCY, 1))
+password_hasher = PasswordHasher(workers=_workers, max_pending=settings.HASHING_MAX_PENDING or max(_workers, 1) * 16)
@@ -0,0 +1,304 @@
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, Optional, Set
+
+import redis
+from sqlalchemy import delete, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import crud, docker_service, metrics, models
+from .cache import get_async_redis, get_redis
+from .config import settings
+from .database import SessionLocal
+from .instance_pool import WarmPoolManager, warm_pool
+
+PENDING = "pending"
+RUNNING = "running"
+READY = "ready"
+FAILED = "failed"
+FINISHED = (READY, FAILED)
+
+START = "start"
+STOP = "stop"
+
+JOB_CHANNEL = "ctf:instance-job:{job_id}"
+# Queued for a stream instead of a state when it may have missed some; the stream re-reads the job.
+RESYNC = "resync"
+
+INSTANCE_LIFETIME = timedelta(hours=1)
+
+
+def job_payload(job: models.InstanceJob) -> dict:
+    return {"id": job.id, "action": job.action, "status": job.status, "challenge_id": job.challenge_id, "instance_id": job.instance_id, "error": job.error}
+
+
+class InstanceJobRunner:
+    """
+    Runs dynamic challenge start/stop requests in the background.
+
+    The API only records a pending job and returns; the container work happens
+    on a pool of `workers` threads, each with its own short-lived session.
+    Every status change (pending -> running -> ready/failed) is committed to
+    instance_jobs and announced on a per-job Redis channel, so clients can
+    poll the job from any worker or stream it through JobWatchHub.
+    """
+
+    def __init__(self, backend: docker_service.ContainerBackend, pool: WarmPoolManager = warm_pool, session_factory=SessionLocal, workers: int = 16):
+        self.backend = backend
+        self.pool = pool
+        self.session_factory = session_factory
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._stats = {"submitted": 0, "ready": 0, "failed": 0, "in_flight": 0}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="instance-jobs")
+            return self._executor
+
+    def submit(self, job: models.InstanceJob):
+        with self._lock:
+            self._stats["submitted"] += 1
+            self._stats["in_flight"] += 1
+        self._get_executor().submit(self._run, job.id)
+
+    def _publish(self, job: models.InstanceJob):
+        try:
+            get_redis().publish(JOB_CHANNEL.format(job_id=job.id), json.dumps(job_payload(job)))
+        except redis.RedisError:
+            # Watchers fall back to polling the table.
+            pass
+
+    def _set_status(self, db: Session, job: models.InstanceJob, status: str, **fields):
+        job.status = status
+        job.updated_at = datetime.utcnow()
+        for name, value in fields.items():
+            setattr(job, name, value)
+        db.commit()
+        self._publish(job)
+
+    def _run(self, job_id: int):
+        outcome = None
+        db = self.session_factory()
+        try:
+            job = crud.get_instance_job(db, job_id)
+            if job is None or job.status != PENDING:
+                return
+            self._set_status(db, job, RUNNING)
+            try:
+                if job.action == START:
+                    instance_id = self._start_instance(db, job)
+                else:
+                    instance_id = self._stop_instance(db, job)
+            except Exception as e:
+                db.rollback()
+                print(f"ERROR: Instance job {job_id} ({job.action}) failed: {e}")
+                self._set_status(db, job, FAILED, error=str(e) or type(e).__name__)
+                outcome = FAILED
+            else:
+                self._set_status(db, job, READY, instance_id=instance_id)
+                outcome = READY
+            metrics.INSTANCES.labels(job.action, "ok" if outcome == READY else "failed").inc()
+        finally:
+            db.close()
+            with self._lock:
+                self._stats["in_flight"] -= 1
+                if outcome is not None:
+                    self._stats[outcome] += 1
+
+    def _start_instance(self, db: Session, job: models.InstanceJob) -> int:
+        challenge = db.query(models.Challenge.id, models.Challenge.name).filter(models.Challenge.id == job.challenge_id).first()
+        if challenge is None:
+            raise LookupError("Challenge not found")
+        user_id, job_id = job.user_id, job.id
+        # Don't hold a pooled connection while the container starts.
+        db.commit()
+        container = self.pool.acquire(challenge.id) or docker_service.launch_container(challenge.id, challenge.name, self.backend)
+        try:
+            instance = crud.create_instance(
+                db=db,
+                user_id=user_id,
+                challenge_id=challenge.id,
+                container_id=container["container_id"],
+                ip_address=container["host"],
+                port=container["port"],
+                expires_at=datetime.utcnow() + INSTANCE_LIFETIME
+            )
+        except Exception:
+            db.rollback()
+            docker_service.teardown_container(container, self.backend)
+            raise
+        crud.create_audit_log(db, action="dynamic_challenge_start", user_id=user_id, details={"challenge_id": challenge.id, "instance_id": instance.id, "job_id": job_id})
+        return instance.id
+
+    def _stop_instance(self, db: Session, job: models.InstanceJob) -> int:
+        instance = crud.get_instance_by_id(db, instance_id=job.instance_id)
+        # Already gone, e.g. reaped after expiring: nothing left to stop.
+        if instance is not None:
+            container = {"container_id": instance.container_id, "host": instance.ip_address, "port": instance.port}
+            db.commit()
+            docker_service.teardown_container(container, self.backend)
+            crud.delete_instance(db, instance_id=job.instance_id)
+            crud.create_audit_log(db, action="dynamic_challenge_stop", user_id=job.user_id, details={"challenge_id": job.challenge_id, "instance_id": job.instance_id, "job_id": job.id})
+        return job.instance_id
+
+    def fail_stale(self, db: Session, timeout: float) -> int:
+        """
+        Marks jobs that have not moved for `timeout` seconds as failed, e.g.
+        jobs whose worker process died.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=timeout)
+        result = db.execute(
+            update(models.InstanceJob)
+            .where(models.InstanceJob.status.in_((PENDING, RUNNING)), models.InstanceJob.updated_at < cutoff)
+            .values(status=FAILED, error="Interrupted", updated_at=datetime.utcnow())
+        )
+        db.commit()
+        return result.rowcount
+
+    def purge(self, db: Session, retention: float) -> int:
+        """
+        Deletes finished jobs older than `retention` seconds. The caller commits.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=retention)
+        return db.execute(
+            delete(models.InstanceJob).where(models.InstanceJob.status.in_(FINISHED), models.InstanceJob.updated_at < cutoff)
+        ).rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"workers": self.workers, **self._stats}
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+def read_job(job_id: int) -> Optional[dict]:
+    db = SessionLocal()
+    try:
+        job = crud.get_instance_job(db, job_id)
+        return job_payload(job) if job else None
+    finally:
+        db.close()
+
+
+class JobWatchHub:
+    """
+    Fans job status messages out to the job streams open on this worker.
+
+    The worker holds one Redis pub/sub connection with a pattern subscription
+    to every job channel, so an open stream costs an asyncio queue instead of
+    a threadpool slot, a pub/sub connection and a query per second. Messages
+    only carry the new state; streams re-read the job from the table when the
+    subscription is (re)established, every `poll_interval` seconds while it is
+    down and every `resync_interval` seconds otherwise, in case a publish was lost.
+    """
+
+    def __init__(self, poll_interval: float = 1.0, resync_interval: float = 15.0):
+        self.poll_interval = poll_interval
+        self.resync_interval = resync_interval
+        self._listeners: Dict[int, Set[asyncio.Queue]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._subscribed = False
+
+    async def watch(self, job_id: int, timeout: float = 300) -> AsyncIterator[dict]:
+        """
+        Yields the job's state every time its status changes, until it
+        finishes or `timeout` seconds pass.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        self._listeners.setdefault(job_id, set()).add(queue)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        last_status = None
+        try:
+            # Read after listening, so a change in between is queued rather than missed.
+            payload = await run_in_threadpool(read_job, job_id)
+            while payload is not None:
+                if payload["status"] != last_status:
+                    last_status = payload["status"]
+                    yield payload
+                if last_status in FINISHED:
+                    return
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return
+                try:
+                    item = await asyncio.wait_for(queue.get(), min(remaining, self.resync_interval if self._subscribed else self.poll_interval))
+                except asyncio.TimeoutError:
+                    item = RESYNC
+                payload = await run_in_threadpool(read_job, job_id) if item == RESYNC else item
+        finally:
+            listeners = self._listeners.get(job_id)
+            if listeners is not None:
+                listeners.discard(queue)
+                if not listeners:
+                    del self._listeners[job_id]
+
+    def _deliver(self, job_id: int, item):
+        for queue in self._listeners.get(job_id, ()):
+            queue.put_nowait(item)
+
+    async def _run(self):
+        prefix = JOB_CHANNEL.format(job_id="")
+        while True:
+            pubsub = None
+            try:
+                pubsub = get_async_redis().pubsub(ignore_subscribe_messages=True)
+                await pubsub.psubscribe(JOB_CHANNEL.format(job_id="*"))
+                self._subscribed = True
+                # Anything published before the subscription was active was missed.
+                for job_id in list(self._listeners):
+                    self._deliver(job_id, RESYNC)
+                while True:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message is None or message["type"] != "pmessage":
+                        continue
+                    self._deliver(int(message["channel"][len(prefix):]), json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except (redis.RedisError, OSError) as e:
+                print(f"WARNING: Instance job subscriber disconnected: {e}")
+                self._subscribed = False
+                await asyncio.sleep(5)
+            finally:
+                self._subscribed = False
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except (redis.RedisError, OSError):
+                        pass
+
+    async def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def fail_stale_jobs():
+    db = SessionLocal()
+    try:
+        failed = job_runner.fail_stale(db, settings.INSTANCE_JOB_TIMEOUT_SECONDS)
+    finally:
+        db.close()
+    if failed:
+        print(f"WARNING: Marked {failed} interrupted instance jobs as failed")
+
+
+job_runner = InstanceJobRunner(docker_service.backend, workers=settings.INSTANCE_JOB_WORKERS)
+job_watch_hub = JobWatchHub()
@@ -0,0 +1,283 @@
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+import redis
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from . import docker_service, models
+from .cache import get_redis, invalidation_bus
+from .config import settings
+from .database import SessionLocal
+from .port_allocator import port_allocator
+
+
+SLOTS_KEY = "ctf:warm-pool:{challenge_id}:slots"
+HEARTBEAT_KEY = "ctf:warm-pool:worker:"
+HEARTBEAT_SECONDS = 20
+
+# Reserves up to the missing number of slots for ARGV[1] and returns how many.
+# KEYS[1] maps worker ids to the containers each holds (ready or starting);
+# workers whose heartbeat has expired are dropped from it first.
+_RESERVE_SCRIPT = """
+local total = 0
+local fields = redis.call('HGETALL', KEYS[1])
+for i = 1, #fields, 2 do
+    if fields[i] == ARGV[1] or redis.call('EXISTS', ARGV[5] .. fields[i]) == 1 then
+        total = total + tonumber(fields[i + 1])
+    else
+        redis.call('HDEL', KEYS[1], fields[i])
+    end
+end
+if ARGV[4] == '0' and total >= tonumber(ARGV[3]) then
+    return 0
+end
+local allowed = tonumber(ARGV[2]) - total
+if allowed <= 0 then
+    return 0
+end
+redis.call('HINCRBY', KEYS[1], ARGV[1], allowed)
+return allowed
+"""
+
+
+class _ChallengePool:
+    def __init__(self, challenge_id: int, name: str, low: int, high: int):
+        self.challenge_id = challenge_id
+        self.name = name
+        self.low = low
+        self.high = high
+        self.ready = deque()
+        self.starting = 0
+        self.handed_out = 0
+        self.misses = 0
+
+
+class WarmPoolManager:
+    """
+    Keeps pre-started containers for dynamic challenges so a player's "Start"
+    is served instantly instead of waiting for a container to boot.
+
+    Each configured challenge has a low and a high watermark. When handing out
+    an instance drops the number of ready containers below the low watermark,
+    the pool is refilled up to the high watermark in the background.
+
+    Every worker process runs a manager, but the watermarks apply to all of
+    them together: each container a worker holds (ready or starting) takes a
+    slot in a Redis hash per challenge, and a refill only starts as many
+    containers as there are free slots. The worker that hands a container out
+    refills, so containers end up where players start them. Slots of a
+    worker that stops sending heartbeats are freed. Without Redis each
+    worker falls back to the watermarks on its own.
+    """
+
+    def __init__(self, backend: docker_service.ContainerBackend, refill_workers: int = 4):
+        self.backend = backend
+        self.refill_workers = refill_workers
+        self.worker_id = uuid.uuid4().hex
+        self._pools: Dict[int, _ChallengePool] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._closed = False
+        self._stopping = threading.Event()
+        self._heartbeat_thread: Optional[threading.Thread] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.refill_workers, thread_name_prefix="warm-pool")
+        return self._executor
+
+    def configure(self, challenge_id: int, name: str, low: int, high: int):
+        """
+        Sets the watermarks of a challenge's pool. A high watermark of 0 removes
+        the pool and stops its ready containers.
+        """
+        drained = []
+        with self._lock:
+            pool = self._pools.get(challenge_id)
+            if high <= 0:
+                if pool:
+                    del self._pools[challenge_id]
+                    drained = list(pool.ready)
+            elif pool:
+                pool.name, pool.low, pool.high = name, min(low, high), high
+                while len(pool.ready) > high:
+                    drained.append(pool.ready.pop())
+            else:
+                self._pools[challenge_id] = _ChallengePool(challenge_id, name, min(low, high), high)
+        for container in drained:
+            self._get_executor().submit(docker_service.teardown_container, container, self.backend)
+        self._release_slots(challenge_id, len(drained))
+        if high > 0:
+            self._schedule_refill(challenge_id, force=True)
+
+    def load(self, db: Session):
+        """
+        (Re)configures every pool from the warm_pool_* columns of the challenges table.
+        """
+        rows = db.query(models.Challenge.id, models.Challenge.name, models.Challenge.warm_pool_low, models.Challenge.warm_pool_high).all()
+        configured = set()
+        for challenge_id, name, low, high in rows:
+            if high:
+                self.configure(challenge_id, name, low or 0, high)
+                configured.add(challenge_id)
+        for challenge_id in set(self._pools) - configured:
+            self.configure(challenge_id, "", 0, 0)
+
+    def acquire(self, challenge_id: int) -> Optional[dict]:
+        """
+        Hands out a ready container, or returns None if the pool is empty or
+        the challenge has no pool.
+        """
+        with self._lock:
+            pool = self._pools.get(challenge_id)
+            if pool is None:
+                return None
+            container = pool.ready.popleft() if pool.ready else None
+            if container is None:
+                pool.misses += 1
+            else:
+                pool.handed_out += 1
+        if container is not None:
+            self._release_slots(challenge_id, 1)
+        self._schedule_refill(challenge_id)
+        return container
+
+    def _reserve_slots(self, pool: _ChallengePool, local: int, force: bool) -> int:
+        """
+        How many containers to start for `pool`, counting every worker's
+        containers against the watermarks.
+        """
+        try:
+            return get_redis().eval(
+                _RESERVE_SCRIPT, 1, SLOTS_KEY.format(challenge_id=pool.challenge_id),
+                self.worker_id, pool.high, pool.low, int(force), HEARTBEAT_KEY,
+            )
+        except redis.RedisError as e:
+            print(f"WARNING: Could not reserve warm pool slots for challenge {pool.challenge_id}, using local watermarks: {e}")
+        if not force and local >= pool.low:
+            return 0
+        return max(pool.high - local, 0)
+
+    def _release_slots(self, challenge_id: int, count: int):
+        if count <= 0:
+            return
+        try:
+            get_redis().hincrby(SLOTS_KEY.format(challenge_id=challenge_id), self.worker_id, -count)
+        except redis.RedisError as e:
+            # The heartbeat expires with this worker; until then the slots stay taken.
+            print(f"WARNING: Could not release warm pool slots for challenge {challenge_id}: {e}")
+
+    def _schedule_refill(self, challenge_id: int, force: bool = False):
+        with self._lock:
+            pool = self._pools.get(challenge_id)
+            if pool is None or self._closed:
+                return
+            local = len(pool.ready) + pool.starting
+        missing = self._reserve_slots(pool, local, force)
+        with self._lock:
+            pool.starting += missing
+        for _ in range(missing):
+            self._get_executor().submit(self._start_one, pool)
+
+    def _start_one(self, pool: _ChallengePool):
+        try:
+            container = docker_service.launch_container(pool.challenge_id, pool.name, self.backend)
+        except Exception as e:
+            print(f"ERROR: Failed to pre-start container for challenge {pool.challenge_id}: {e}")
+            container = None
+        with self._lock:
+            pool.starting -= 1
+            keep = container is not None and not self._closed and self._pools.get(pool.challenge_id) is pool and len(pool.ready) < pool.high
+            if keep:
+                pool.ready.append(container)
+        if not keep:
+            self._release_slots(pool.challenge_id, 1)
+        if container is not None and not keep:
+            docker_service.teardown_container(container, self.backend)
+
+    def stats(self) -> list:
+        with self._lock:
+            return [
+                {"challenge_id": p.challenge_id, "ready": len(p.ready), "starting": p.starting, "low": p.low, "high": p.high, "handed_out": p.handed_out, "misses": p.misses}
+                for p in self._pools.values()
+            ]
+
+    def _heartbeat(self):
+        try:
+            get_redis().set(HEARTBEAT_KEY + self.worker_id, 1, ex=HEARTBEAT_SECONDS * 3)
+        except redis.RedisError as e:
+            print(f"WARNING: Could not send warm pool heartbeat: {e}")
+        # Ready containers have no instance row yet; keep port reconciliation off their leases.
+        with self._lock:
+            held = [(c["host"], c["port"]) for p in self._pools.values() for c in p.ready]
+        try:
+            port_allocator.touch_many(held)
+        except SQLAlchemyError as e:
+            print(f"WARNING: Could not renew warm pool port leases: {e}")
+
+    def _run_heartbeat(self):
+        while not self._stopping.wait(HEARTBEAT_SECONDS):
+            self._heartbeat()
+
+    def start(self, db: Session):
+        with self._lock:
+            self._closed = False
+        self._heartbeat()
+        if self._heartbeat_thread is None:
+            self._stopping.clear()
+            self._heartbeat_thread = threading.Thread(target=self._run_heartbeat, name="warm-pool-heartbeat", daemon=True)
+            self._heartbeat_thread.start()
+        self.load(db)
+
+    def shutdown(self):
+        """
+        Stops refilling and tears down every container that was never handed out.
+        """
+        with self._lock:
+            self._closed = True
+            leftovers = [c for p in self._pools.values() for c in p.ready]
+            challenge_ids = list(self._pools)
+            self._pools.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        for container in leftovers:
+            docker_service.teardown_container(container, self.backend)
+        self._stopping.set()
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join()
+            self._heartbeat_thread = None
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for challenge_id in challenge_ids:
+                pipe.hdel(SLOTS_KEY.format(challenge_id=challenge_id), self.worker_id)
+            pipe.delete(HEARTBEAT_KEY + self.worker_id)
+            pipe.execute()
+        except redis.RedisError as e:
+            print(f"WARNING: Could not release warm pool slots: {e}")
+
+
+warm_pool = WarmPoolManager(docker_service.backend, refill_workers=settings.WARM_POOL_REFILL_WORKERS)
+
+
+def reload_warm_pool(version: int = 0):
+    db = SessionLocal()
+    try:
+        warm_pool.load(db)
+    finally:
+        db.close()
+
+def start_warm_pool():
+    db = SessionLocal()
+    try:
+        warm_pool.start(db)
+    finally:
+        db.close()
+
+
+# Challenge edits can change the watermarks.
+invalidation_bus.subscribe("challenges", reload_warm_pool)
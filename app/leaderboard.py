@@ -0,0 +1,257 @@
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import redis
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import models, score_history
+from .cache import get_redis
+
+# Sorted-set scores combine points and last-solve time so that ZREVRANGE gives
+# "most points first, earliest last solve first" in a single ordering. Scores
+# are doubles, so points * TIME_SCALE must stay below 2**53 (~900k points).
+TIME_SCALE = 10_000_000_000
+
+_APPLY = """
+local function apply(board, points_key, last_key, names_key, member, delta, solved_at, name, scale)
+    local points = redis.call('HINCRBY', points_key, member, delta)
+    local last = tonumber(redis.call('HGET', last_key, member) or '0')
+    solved_at = tonumber(solved_at)
+    if solved_at > last then
+        last = solved_at
+        redis.call('HSET', last_key, member, last)
+    end
+    if name ~= '' then
+        redis.call('HSET', names_key, member, name)
+    end
+    local tiebreak = 0
+    if last > 0 then tiebreak = tonumber(scale) - 1 - last end
+    redis.call('ZADD', board, points * tonumber(scale) + tiebreak, member)
+    return points
+end
+"""
+
+# While a rebuild runs (KEYS[6] exists), updates are also journaled in KEYS[5],
+# four list items each, to be replayed onto the rebuilt ranking.
+_RECORD_SCRIPT = _APPLY + """
+if redis.call('EXISTS', KEYS[6]) == 1 then
+    redis.call('RPUSH', KEYS[5], ARGV[1], ARGV[2], ARGV[3], ARGV[4])
+end
+return apply(KEYS[1], KEYS[2], KEYS[3], KEYS[4], ARGV[1], ARGV[2], ARGV[3], ARGV[4], ARGV[5])
+"""
+
+# Swaps the staging keys (KEYS[5..8]) in for the live ones (KEYS[1..4]) and
+# replays the journal (KEYS[9]) onto them in the same step.
+_SWAP_SCRIPT = _APPLY + """
+for i = 1, 4 do
+    if redis.call('EXISTS', KEYS[i + 4]) == 1 then
+        redis.call('RENAME', KEYS[i + 4], KEYS[i])
+    else
+        redis.call('DEL', KEYS[i])
+    end
+end
+local journal = redis.call('LRANGE', KEYS[9], 0, -1)
+for i = 1, #journal, 4 do
+    apply(KEYS[1], KEYS[2], KEYS[3], KEYS[4], journal[i], journal[i + 1], journal[i + 2], journal[i + 3], ARGV[1])
+end
+redis.call('DEL', KEYS[9], KEYS[10])
+redis.call('SET', KEYS[11], 1)
+return #journal / 4
+"""
+
+# A rebuild that died without swapping stops journaling after this long.
+REBUILD_TIMEOUT_SECONDS = 600
+# How long a read waits for another worker's rebuild before serving what is there.
+REBUILD_WAIT_SECONDS = 5
+
+
+def _timestamp(value: Optional[datetime]) -> int:
+    if value is None:
+        return 0
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+class Ranking:
+    """
+    A leaderboard kept in a Redis sorted set, updated incrementally on each solve.
+
+    Points, last-solve timestamps and display names live in side hashes; the
+    sorted set holds the combined ranking score, so rank lookups are
+    O(log n) and pages are O(log n + limit).
+    """
+
+    def __init__(self, name: str):
+        self.key = f"ctf:leaderboard:{name}"
+        self.points_key = f"{self.key}:points"
+        self.last_solve_key = f"{self.key}:last_solve"
+        self.names_key = f"{self.key}:names"
+        self.ready_key = f"{self.key}:ready"
+        self.journal_key = f"{self.key}:journal"
+        self.rebuilding_key = f"{self.key}:rebuilding"
+
+    @property
+    def keys(self) -> List[str]:
+        return [self.key, self.points_key, self.last_solve_key, self.names_key]
+
+    def record(self, member_id: int, points: int, solved_at: Optional[datetime] = None, name: Optional[str] = None, client=None) -> int:
+        """
+        Adds `points` (may be negative or zero) to a member and moves its last-solve time forward.
+        """
+        client = client or get_redis()
+        return client.eval(_RECORD_SCRIPT, 6, *self.keys, self.journal_key, self.rebuilding_key, member_id, points, _timestamp(solved_at), name or "", TIME_SCALE)
+
+    def is_ready(self) -> bool:
+        return bool(get_redis().exists(self.ready_key))
+
+    def count(self) -> int:
+        return get_redis().zcard(self.key)
+
+    def _entries(self, member_ids: List[bytes]) -> List[dict]:
+        if not member_ids:
+            return []
+        pipe = get_redis().pipeline()
+        pipe.hmget(self.points_key, member_ids)
+        pipe.hmget(self.last_solve_key, member_ids)
+        pipe.hmget(self.names_key, member_ids)
+        points, last_solves, names = pipe.execute()
+        return [
+            {
+                "id": int(member_id),
+                "name": name.decode() if name else "",
+                "points": int(p or 0),
+                "last_solve": datetime.fromtimestamp(int(ts), tz=timezone.utc) if ts and int(ts) else None,
+            }
+            for member_id, p, ts, name in zip(member_ids, points, last_solves, names)
+        ]
+
+    def page(self, offset: int = 0, limit: int = 100) -> List[dict]:
+        member_ids = get_redis().zrevrange(self.key, offset, offset + limit - 1)
+        entries = self._entries(member_ids)
+        for i, entry in enumerate(entries):
+            entry["rank"] = offset + i + 1
+        return entries
+
+    def rank(self, member_id: int) -> Optional[dict]:
+        position = get_redis().zrevrank(self.key, member_id)
+        if position is None:
+            return None
+        entry = self._entries([str(member_id).encode()])[0]
+        entry["rank"] = position + 1
+        return entry
+
+    def rebuild(self, rows) -> int:
+        """
+        Replaces the ranking with `rows` of (id, name, points, last_solve) and
+        swaps it in atomically, so readers never see a half-built board.
+
+        `rows` must be a lazy query: updates recorded from the moment it runs
+        until the swap are journaled and replayed onto the new ranking, so
+        solves during a rebuild are not lost. A solve committed just before
+        the query whose update lands just after it is counted twice; the next
+        rebuild corrects that.
+        """
+        client = get_redis()
+        staging = [f"{key}:rebuild" for key in self.keys]
+        client.delete(*staging, self.journal_key)
+        client.set(self.rebuilding_key, 1, ex=REBUILD_TIMEOUT_SECONDS)
+        try:
+            pipe = client.pipeline(transaction=False)
+            count = 0
+            for member_id, name, points, last_solve in rows:
+                ts = _timestamp(last_solve)
+                pipe.zadd(staging[0], {member_id: (points or 0) * TIME_SCALE + (TIME_SCALE - 1 - ts if ts else 0)})
+                pipe.hset(staging[1], member_id, points or 0)
+                if ts:
+                    pipe.hset(staging[2], member_id, ts)
+                pipe.hset(staging[3], member_id, name)
+                count += 1
+                if count % 1000 == 0:
+                    pipe.execute()
+            pipe.execute()
+            client.eval(_SWAP_SCRIPT, 11, *self.keys, *staging, self.journal_key, self.rebuilding_key, self.ready_key, TIME_SCALE)
+        except BaseException:
+            client.delete(self.rebuilding_key, self.journal_key, *staging)
+            raise
+        return count
+
+
+teams = Ranking("teams")
+users = Ranking("users")
+
+
+def record_solve(user_id: int, username: str, team_id: Optional[int], points: int, solved_at: datetime):
+    """
+    Applies a solve to the user and team rankings. Redis errors are logged, not
+    raised: the solve is already committed and a rebuild will catch up.
+    """
+    try:
+        score_history.record("users", user_id, users.record(user_id, points, solved_at, name=username), solved_at)
+        if team_id is not None:
+            score_history.record("teams", team_id, teams.record(team_id, points, solved_at), solved_at)
+    except redis.RedisError as e:
+        print(f"WARNING: Failed to update leaderboard for user {user_id}: {e}")
+
+
+def move_user(user_id: int, from_team_id: Optional[int], to_team_id: Optional[int], team_name: Optional[str] = None):
+    """
+    Moves a user's points between teams when they join, create or leave one.
+    """
+    try:
+        entry = users.rank(user_id)
+        points = entry["points"] if entry else 0
+        last_solve = entry["last_solve"] if entry else None
+        now = datetime.now(timezone.utc)
+        if from_team_id is not None:
+            score_history.record("teams", from_team_id, teams.record(from_team_id, -points), now)
+        if to_team_id is not None:
+            score_history.record("teams", to_team_id, teams.record(to_team_id, points, last_solve, name=team_name), now)
+    except redis.RedisError as e:
+        print(f"WARNING: Failed to update leaderboard for user {user_id}: {e}")
+
+
+def rebuild(db: Session) -> dict:
+    """
+    Recomputes both rankings from the solves table.
+    """
+    user_points = db.query(
+        models.Solve.user_id.label("user_id"),
+        func.sum(models.Challenge.points).label("points"),
+        func.max(models.Solve.created_at).label("last_solve"),
+    ).join(models.Challenge, models.Challenge.id == models.Solve.challenge_id).group_by(models.Solve.user_id).subquery()
+
+    user_rows = db.query(models.User.id, models.User.username, user_points.c.points, user_points.c.last_solve).join(
+        user_points, user_points.c.user_id == models.User.id
+    ).yield_per(1000)
+    team_rows = db.query(
+        models.Team.id, models.Team.name, func.sum(user_points.c.points), func.max(user_points.c.last_solve)
+    ).outerjoin(models.User, models.User.team_id == models.Team.id).outerjoin(
+        user_points, user_points.c.user_id == models.User.id
+    ).group_by(models.Team.id, models.Team.name)
+    return {"users": users.rebuild(user_rows), "teams": teams.rebuild(team_rows)}
+
+
+def ensure_ready(db: Session):
+    """
+    Builds the rankings from the database the first time they are read, e.g.
+    after Redis was flushed. A short Redis lock stops workers racing each
+    other; the others wait up to REBUILD_WAIT_SECONDS for it to finish
+    instead of serving an empty board.
+    """
+    if teams.is_ready() and users.is_ready():
+        return
+    client = get_redis()
+    if client.set("ctf:leaderboard:rebuild_lock", 1, nx=True, ex=60):
+        try:
+            rebuild(db)
+        finally:
+            client.delete("ctf:leaderboard:rebuild_lock")
+        return
+    deadline = time.monotonic() + REBUILD_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        if teams.is_ready() and users.is_ready():
+            return
@@ -1,18 +1,57 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from starlette.middleware.sessions import SessionMiddleware
+from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
 
 from app.routers import (
     users, token, challenges, teams, leaderboard, settings, 
-    admin, notifications, auth as oauth_auth, dynamic_challenges
+    admin, notifications, auth as oauth_auth, dynamic_challenges, metrics as metrics_router
 )
+from . import metrics, profiling
+from .audit import audit_writer
+from .audit_archive import partition_scheduler
+from .cache import invalidation_bus
+from .email import mass_mailer
+from .hashing import HashingBusy, password_hasher
+from .instance_jobs import fail_stale_jobs, job_runner, job_watch_hub
+from .instance_pool import start_warm_pool, warm_pool
+from .notification_hub import notification_hub
+from .pagination import NEXT_CURSOR_HEADER, InvalidCursor
+from .port_allocator import reconcile_ports
+from .reaper import reaper
 from .config import settings as app_settings
 from .limiter import limiter
 
 app = FastAPI()
 
+@app.on_event("startup")
+def start_background_services():
+    invalidation_bus.start()
+    reconcile_ports()
+    fail_stale_jobs()
+    partition_scheduler.start()
+    start_warm_pool()
+    reaper.start()
+    if audit_writer is not None:
+        audit_writer.start()
+
+@app.on_event("shutdown")
+async def stop_background_services():
+    await mass_mailer.wait()
+    await notification_hub.shutdown()
+    await job_watch_hub.shutdown()
+    invalidation_bus.stop()
+    password_hasher.shutdown()
+    reaper.shutdown()
+    partition_scheduler.shutdown()
+    job_runner.shutdown()
+    warm_pool.shutdown()
+    if audit_writer is not None:
+        audit_writer.shutdown()
+
 # Add rate limiter state and middleware
 app.state.limiter = limiter
 app.add_middleware(SlowAPIMiddleware)
@@ -20,8 +59,16 @@ app.add_middleware(SlowAPIMiddleware)
 # Custom exception handler for rate limit exceeded
 @app.exception_handler(RateLimitExceeded)
 async def rate_limit_exceeded_handler(request, exc):
-    from slowapi import _rate_limit_exceeded_handler
-    return await _rate_limit_exceeded_handler(request, exc)
+    metrics.record_rate_limited(request, exc)
+    return _rate_limit_exceeded_handler(request, exc)
+
+@app.exception_handler(HashingBusy)
+async def hashing_busy_handler(request, exc):
+    return JSONResponse(status_code=503, content={"detail": "Server is busy, please try again shortly."}, headers={"Retry-After": "1"})
+
+@app.exception_handler(InvalidCursor)
+async def invalid_cursor_handler(request, exc):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
 
 # Add session middleware for OAuthlib's state management
 app.add_middleware(SessionMiddleware, secret_key=app_settings.SECRET_KEY)
@@ -34,8 +81,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, profiling.PROFILE_ID_HEADER],
 )
 
+# Added last so it is outermost and times the whole stack
+app.add_middleware(metrics.MetricsMiddleware)
+
+if app_settings.REQUEST_PROFILING:
+    profiling.enable(app)
+
 app.include_router(users.router, prefix="/users", tags=["users"])
 app.include_router(token.router, tags=["authentication"])
 app.include_router(oauth_auth.router, prefix="/auth", tags=["authentication"])
@@ -46,6 +100,7 @@ app.include_router(leaderboard.router, prefix="/leaderboard", tags=["leaderboard
 app.include_router(settings.router, tags=["settings"])
 app.include_router(admin.router, prefix="/admin", tags=["admin"])
 app.include_router(notifications.router, prefix="/notifications", tags=["notifications"])
+app.include_router(metrics_router.router, tags=["metrics"])
 
 @app.get("/")
 def read_root():
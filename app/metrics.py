@@ -0,0 +1,173 @@
+"""
+Prometheus metrics, served on /metrics.
+
+Per-request numbers (latency, status, SQL statements and time) are recorded
+by MetricsMiddleware; SQL is attributed to the request through a context
+variable that the engine events update. Pool numbers are read from the
+existing PoolStats when scraped, so they cost nothing per checkout.
+
+With several uvicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty
+directory so each scrape sums every worker; pool numbers are then the
+scraped worker's only.
+"""
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+
+from .database import async_engine, engine, pool_stats
+
+REQUEST_LATENCY = Histogram(
+    "ctf_http_request_duration_seconds", "Time until the response starts", ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS = Counter("ctf_http_requests_total", "Responses by route and status", ["method", "route", "status"])
+IN_PROGRESS = Gauge("ctf_http_requests_in_progress", "Requests being handled", ["method"], multiprocess_mode="livesum")
+REQUEST_STATEMENTS = Histogram("ctf_db_statements_per_request", "SQL statements per request", ["route"], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100))
+REQUEST_SQL_SECONDS = Histogram(
+    "ctf_db_seconds_per_request", "Time spent in SQL statements per request", ["route"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+STATEMENTS = Counter("ctf_db_statements_total", "SQL statements executed, in requests or not")
+RATE_LIMITED = Counter("ctf_rate_limit_rejections_total", "Requests rejected by a rate limit", ["limit", "route"])
+SUBMISSIONS = Counter("ctf_flag_submissions_total", "Flag submissions by result", ["result"])
+INSTANCES = Counter("ctf_dynamic_instances_total", "Dynamic challenge instance starts, stops and reaps", ["action", "result"])
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+class RequestStats:
+    __slots__ = ("statements", "seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+
+
+# Mutated in place, so statements run in the threadpool or in a middleware's
+# task still count towards the request that started them.
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    STATEMENTS.inc()
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.statements += 1
+        started = getattr(context, "_metrics_started", None)
+        if started is not None:
+            stats.seconds += time.perf_counter() - started
+
+
+def instrument_engine(target):
+    event.listen(target, "before_cursor_execute", _before_cursor_execute)
+    event.listen(target, "after_cursor_execute", _after_cursor_execute)
+
+
+def route_label(scope) -> str:
+    """
+    The matched route's template, e.g. /challenges/{challenge_id}/submit,
+    so the label set stays bounded. Rebuilt from the path parameters because
+    routes in included routers only know their path relative to the prefix.
+    """
+    if scope.get("route") is None:
+        return UNMATCHED_ROUTE
+    params = {str(value): name for name, value in scope.get("path_params", {}).items()}
+    if not params:
+        return scope["path"]
+    return "/".join(f"{{{params.pop(segment)}}}" if segment in params else segment for segment in scope["path"].split("/"))
+
+
+class MetricsMiddleware:
+    """
+    Records latency (to the start of the response, so streams aren't counted
+    for as long as they stay open), status and SQL per request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        start = time.perf_counter()
+        response = {"status": "500", "latency": None}
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                response["status"] = str(message["status"])
+                response["latency"] = time.perf_counter() - start
+            await send(message)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        in_progress = IN_PROGRESS.labels(method)
+        in_progress.inc()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            in_progress.dec()
+            _request_stats.reset(token)
+            route = route_label(scope)
+            latency = response["latency"] if response["latency"] is not None else time.perf_counter() - start
+            REQUEST_LATENCY.labels(method, route).observe(latency)
+            REQUESTS.labels(method, route, response["status"]).inc()
+            REQUEST_STATEMENTS.labels(route).observe(stats.statements)
+            REQUEST_SQL_SECONDS.labels(route).observe(stats.seconds)
+
+
+def record_rate_limited(request, exc):
+    limit = str(exc.limit.limit) if exc.limit is not None else "unknown"
+    RATE_LIMITED.labels(limit, route_label(request.scope)).inc()
+
+
+class PoolCollector:
+    """Connection pool gauges and checkout counters from database.pool_stats()."""
+
+    def collect(self):
+        checked_out = GaugeMetricFamily("ctf_db_pool_checked_out", "Connections checked out", labels=["pool"])
+        capacity = GaugeMetricFamily("ctf_db_pool_capacity", "pool_size + max_overflow", labels=["pool"])
+        saturation = GaugeMetricFamily("ctf_db_pool_saturation", "Share of the pool's capacity checked out", labels=["pool"])
+        max_wait = GaugeMetricFamily("ctf_db_pool_checkout_max_wait_seconds", "Longest checkout wait since start", labels=["pool"])
+        checkouts = CounterMetricFamily("ctf_db_pool_checkouts", "Connection checkouts", labels=["pool"])
+        timeouts = CounterMetricFamily("ctf_db_pool_checkout_timeouts", "Checkouts that timed out waiting", labels=["pool"])
+        wait = CounterMetricFamily("ctf_db_pool_checkout_wait_seconds", "Time spent waiting for a connection", labels=["pool"])
+        for name, stats in pool_stats().items():
+            total = stats["size"] + stats["max_overflow"]
+            checked_out.add_metric([name], stats["checked_out"])
+            capacity.add_metric([name], total)
+            saturation.add_metric([name], stats["checked_out"] / total if total else 0.0)
+            max_wait.add_metric([name], stats["max_wait_seconds"])
+            checkouts.add_metric([name], stats["checkouts"])
+            timeouts.add_metric([name], stats["timeouts"])
+            wait.add_metric([name], stats["total_wait_seconds"])
+        return [checked_out, capacity, saturation, max_wait, checkouts, timeouts, wait]
+
+
+pool_collector = PoolCollector()
+REGISTRY.register(pool_collector)
+
+instrument_engine(engine)
+if async_engine is not None:
+    instrument_engine(async_engine.sync_engine)
+
+
+def render() -> tuple:
+    """Returns (body, content type) for a scrape."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(pool_collector)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
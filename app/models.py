@@ -1,6 +1,6 @@
 from sqlalchemy import (
     Boolean, Column, ForeignKey, Integer, String, DateTime, Table,
-    UniqueConstraint, CheckConstraint, JSON
+    UniqueConstraint, CheckConstraint, JSON, Index
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -26,13 +26,16 @@ class User(Base):
     is_staff = Column(Boolean, default=False, nullable=False)
     is_active = Column(Boolean, default=False, nullable=False)
     verification_token = Column(String, unique=True, nullable=True)
-    team_id = Column(Integer, ForeignKey("teams.id"))
+    token_version = Column(Integer, default=0, server_default="0", nullable=False)
+    team_id = Column(Integer, ForeignKey("teams.id"), index=True)
     team = relationship("Team", back_populates="members")
     solves = relationship("Solve", back_populates="user")
     badges = relationship("UserBadge", back_populates="user")
     notifications = relationship("Notification", back_populates="user")
     audit_logs = relationship("AuditLog", back_populates="user")
     dynamic_instances = relationship("DynamicChallengeInstance", back_populates="user")
+    # Keyset pagination of pending (inactive) users.
+    __table_args__ = (Index('ix_users_is_active_id', 'is_active', 'id'),)
 
 class Team(Base):
     __tablename__ = "teams"
@@ -47,11 +50,15 @@ class Challenge(Base):
     name = Column(String, nullable=False)
     description = Column(String, nullable=False)
     points = Column(Integer, nullable=False)
+    # The value admins set; `points` holds the decayed value while dynamic scoring is on.
+    static_points = Column(Integer, nullable=True)
     flag = Column(String, nullable=False)
     is_visible = Column(Boolean, default=False, nullable=False)
     initial_points = Column(Integer, nullable=True)
     minimum_points = Column(Integer, nullable=True)
     decay_factor = Column(Integer, nullable=True)
+    warm_pool_low = Column(Integer, nullable=True)
+    warm_pool_high = Column(Integer, nullable=True)
     tags = relationship("Tag", secondary=challenge_tag_association, back_populates="challenges")
     solves = relationship("Solve", back_populates="challenge")
     dependencies = relationship("Challenge", secondary=challenge_dependencies,
@@ -70,8 +77,8 @@ class Solve(Base):
     __tablename__ = "solves"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    challenge_id = Column(Integer, ForeignKey("challenges.id"), nullable=False)
-    team_id = Column(Integer, ForeignKey("teams.id"), nullable=True)
+    challenge_id = Column(Integer, ForeignKey("challenges.id"), nullable=False, index=True)
+    team_id = Column(Integer, ForeignKey("teams.id"), nullable=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     user = relationship("User", back_populates="solves")
     challenge = relationship("Challenge", back_populates="solves")
@@ -116,8 +123,24 @@ class Notification(Base):
     is_read = Column(Boolean, default=False, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     user = relationship("User", back_populates="notifications")
+    __table_args__ = (Index('ix_notifications_user_id_id', 'user_id', 'id'),)
+
+class BroadcastNotification(Base):
+    __tablename__ = "broadcast_notifications"
+    id = Column(Integer, primary_key=True, index=True)
+    title = Column(String, nullable=False)
+    body = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+class BroadcastRead(Base):
+    # Only broadcasts a user has marked as read have a row here.
+    __tablename__ = "broadcast_reads"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    broadcast_id = Column(Integer, ForeignKey("broadcast_notifications.id", ondelete="CASCADE"), primary_key=True)
 
 class AuditLog(Base):
+    # On PostgreSQL this is partitioned by day with primary key (id, timestamp);
+    # see migration 20251029 and app/audit_archive.py.
     __tablename__ = "audit_logs"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -125,6 +148,12 @@ class AuditLog(Base):
     details = Column(JSON, nullable=True)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
     user = relationship("User", back_populates="audit_logs")
+    # Filtered lookups; PostgreSQL also has a GIN index on details::jsonb (migration 20251030).
+    __table_args__ = (
+        Index('ix_audit_logs_timestamp_id', 'timestamp', 'id'),
+        Index('ix_audit_logs_user_id_timestamp', 'user_id', 'timestamp'),
+        Index('ix_audit_logs_action_timestamp', 'action', 'timestamp'),
+    )
 
 class DynamicChallengeInstance(Base):
     __tablename__ = "dynamic_challenge_instances"
@@ -134,6 +163,25 @@ class DynamicChallengeInstance(Base):
     container_id = Column(String, nullable=False)
     ip_address = Column(String, nullable=False)
     port = Column(Integer, nullable=False)
-    expires_at = Column(DateTime(timezone=False), nullable=False) # Use timezone-naive for simplicity
+    expires_at = Column(DateTime(timezone=False), nullable=False, index=True) # Use timezone-naive for simplicity
     user = relationship("User", back_populates="dynamic_instances")
     challenge = relationship("Challenge", back_populates="dynamic_instances")
+
+class PortLease(Base):
+    __tablename__ = "port_leases"
+    host = Column(String, primary_key=True)
+    port = Column(Integer, primary_key=True)
+    leased_at = Column(DateTime(timezone=False), nullable=False)
+
+class InstanceJob(Base):
+    __tablename__ = "instance_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    challenge_id = Column(Integer, ForeignKey("challenges.id"), nullable=False)
+    # Not a foreign key: the instance row is deleted when it is stopped
+    instance_id = Column(Integer, nullable=True)
+    action = Column(String, nullable=False)
+    status = Column(String, nullable=False, index=True)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=False), nullable=False)
+    updated_at = Column(DateTime(timezone=False), nullable=False)
@@ -0,0 +1,165 @@
+import asyncio
+import json
+from typing import Dict, Optional, Set
+
+import redis
+
+from . import models, schemas
+from .cache import get_async_redis, get_redis
+
+CHANNEL_PREFIX = "ctf:notify:user:"
+BROADCAST_CHANNEL = "ctf:notify:broadcast"
+
+# Queued for a connection instead of a notification when it may have missed
+# some (Redis reconnect, slow client); the stream then catches up from the table.
+RESYNC = "resync"
+
+
+def channel_for(user_id: int) -> str:
+    return f"{CHANNEL_PREFIX}{user_id}"
+
+
+def publish_notification(notification: models.Notification):
+    """
+    Pushes a committed notification to its user's open streams on every worker.
+    """
+    payload = schemas.Notification.model_validate(notification).model_dump_json()
+    try:
+        get_redis().publish(channel_for(notification.user_id), payload)
+    except redis.RedisError as e:
+        # Open streams pick it up the next time they resync.
+        print(f"WARNING: Could not push notification {notification.id}: {e}")
+
+
+def publish_broadcast(broadcast: models.BroadcastNotification):
+    """
+    Pushes a committed broadcast to every open stream on every worker.
+    """
+    payload = {"id": broadcast.id, "title": broadcast.title, "body": broadcast.body, "created_at": broadcast.created_at.isoformat(), "kind": "broadcast"}
+    try:
+        get_redis().publish(BROADCAST_CHANNEL, json.dumps(payload))
+    except redis.RedisError as e:
+        print(f"WARNING: Could not push broadcast {broadcast.id}: {e}")
+
+
+class NotificationHub:
+    """
+    Fans notifications out to the streams open on this worker.
+
+    The worker holds a single Redis pub/sub connection and is subscribed to
+    the broadcast channel and to the channel of each user that has at least
+    one local stream, so idle streams cost an asyncio queue each and no
+    database or Redis round trips.
+    When the subscription is (re)established, or a stream's queue overflows,
+    the affected streams receive RESYNC and re-read what they missed from the
+    notifications table.
+    """
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._listeners: Dict[int, Set[asyncio.Queue]] = {}
+        self._pubsub = None
+        self._task: Optional[asyncio.Task] = None
+        # Serializes (un)subscribe commands on the shared pub/sub connection.
+        self._subscription_lock = asyncio.Lock()
+        self._stats = {"delivered": 0, "resyncs": 0, "reconnects": 0}
+
+    async def connect(self, user_id: int) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        listeners = self._listeners.setdefault(user_id, set())
+        listeners.add(queue)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        elif len(listeners) == 1:
+            await self._update_subscription("subscribe", user_id)
+        return queue
+
+    async def disconnect(self, user_id: int, queue: asyncio.Queue):
+        listeners = self._listeners.get(user_id)
+        if listeners is None:
+            return
+        listeners.discard(queue)
+        if not listeners:
+            del self._listeners[user_id]
+            await self._update_subscription("unsubscribe", user_id)
+
+    async def _update_subscription(self, command: str, *user_ids: int):
+        async with self._subscription_lock:
+            pubsub = self._pubsub
+            if pubsub is None:
+                # The listener subscribes every local user once it reconnects.
+                return
+            try:
+                await getattr(pubsub, command)(*(channel_for(user_id) for user_id in user_ids))
+            except redis.RedisError:
+                pass
+
+    def _deliver(self, user_id: int, item):
+        for queue in self._listeners.get(user_id, ()):
+            queued = item
+            if queue.full():
+                # A client that can't keep up catches up from the table instead.
+                while not queue.empty():
+                    queue.get_nowait()
+                queued = RESYNC
+            if queued == RESYNC:
+                self._stats["resyncs"] += 1
+            queue.put_nowait(queued)
+
+    async def _run(self):
+        while True:
+            pubsub = None
+            try:
+                pubsub = get_async_redis().pubsub(ignore_subscribe_messages=True)
+                async with self._subscription_lock:
+                    self._pubsub = pubsub
+                    await pubsub.subscribe(BROADCAST_CHANNEL, *(channel_for(user_id) for user_id in self._listeners))
+                # Anything published before the subscription was active was missed.
+                for user_id in list(self._listeners):
+                    self._deliver(user_id, RESYNC)
+                while True:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message is None or message["type"] != "message":
+                        continue
+                    payload = json.loads(message["data"])
+                    if message["channel"] == BROADCAST_CHANNEL.encode():
+                        user_ids = list(self._listeners)
+                    else:
+                        user_ids = [int(message["channel"][len(CHANNEL_PREFIX):])]
+                    for user_id in user_ids:
+                        self._stats["delivered"] += len(self._listeners.get(user_id, ()))
+                        self._deliver(user_id, payload)
+            except asyncio.CancelledError:
+                raise
+            except (redis.RedisError, OSError) as e:
+                self._pubsub = None
+                self._stats["reconnects"] += 1
+                print(f"WARNING: Notification subscriber disconnected: {e}")
+                await asyncio.sleep(5)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except (redis.RedisError, OSError):
+                        pass
+
+    async def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._pubsub = None
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._listeners),
+            "connections": sum(len(listeners) for listeners in self._listeners.values()),
+            "subscribed": self._pubsub is not None,
+            **self._stats,
+        }
+
+
+notification_hub = NotificationHub()
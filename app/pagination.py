@@ -0,0 +1,42 @@
+import base64
+import json
+from typing import Callable, Optional, Sequence
+
+from fastapi import Response
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(**values) -> str:
+    """
+    Packs the sort key of the last row on a page into an opaque token.
+    """
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":"), default=str).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], **fields: Callable) -> Optional[dict]:
+    """
+    Unpacks a token from encode_cursor, converting each of `fields` with the
+    given function. Raises InvalidCursor for anything a client could have
+    tampered with.
+    """
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return {name: convert(values[name]) for name, convert in fields.items()}
+    except (ValueError, TypeError, KeyError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+
+
+def set_next_cursor(response: Response, items: Sequence, limit: int, key: Callable[[Sequence], dict]):
+    """
+    Sets the X-Next-Cursor header when the page is full, i.e. there may be
+    more rows after it. Clients pass the header back as `cursor`.
+    """
+    if items and len(items) >= limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(**key(items))
@@ -0,0 +1,236 @@
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, delete, func, insert, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+from .database import SessionLocal
+
+
+class PortsExhausted(Exception):
+    pass
+
+
+class PortRange:
+    def __init__(self, host: str, start: int, end: int):
+        self.host = host
+        self.start = start
+        self.end = end
+        self.free = deque()
+
+    @property
+    def size(self) -> int:
+        return self.end - self.start + 1
+
+    def __contains__(self, address: Tuple[str, int]) -> bool:
+        host, port = address
+        return host == self.host and self.start <= port <= self.end
+
+
+def parse_ranges(spec: str) -> List[PortRange]:
+    """
+    Parses "host:start-end,host:start-end" into port ranges.
+    """
+    ranges = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        host, _, ports = item.rpartition(":")
+        start, _, end = ports.partition("-")
+        ranges.append(PortRange(host, int(start), int(end or start)))
+    if not ranges:
+        raise ValueError("At least one container port range must be configured")
+    return ranges
+
+
+class PortAllocator:
+    """
+    Hands out (host, port) pairs for dynamic challenge containers.
+
+    The port_leases table is the source of truth: a lease is a row, and its
+    (host, port) primary key makes two workers leasing the same port
+    impossible. Each worker keeps a free list per range so picking a candidate
+    is O(1); a candidate another worker has taken in the meantime fails the
+    insert and is simply dropped. When a worker's free lists run dry they are
+    rebuilt from the table, which also picks up ports released elsewhere.
+    New leases go to the range with the most free ports.
+    """
+
+    def __init__(self, ranges: List[PortRange], session_factory=SessionLocal, max_attempts: int = 64):
+        self.ranges = ranges
+        self.session_factory = session_factory
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _reload(self, db: Session):
+        # Queried without holding _lock, so other threads keep leasing from the old lists meanwhile.
+        leased = set(db.execute(select(models.PortLease.host, models.PortLease.port)).tuples())
+        free = [deque(p for p in range(r.start, r.end + 1) if (r.host, p) not in leased) for r in self.ranges]
+        with self._lock:
+            for port_range, ports in zip(self.ranges, free):
+                port_range.free = ports
+            self._loaded = True
+
+    def _next_candidate(self) -> Optional[Tuple[str, int]]:
+        with self._lock:
+            stale = not self._loaded or not any(r.free for r in self.ranges)
+        if stale:
+            db = self.session_factory()
+            try:
+                self._reload(db)
+            finally:
+                db.close()
+        with self._lock:
+            port_range = max(self.ranges, key=lambda r: len(r.free))
+            if not port_range.free:
+                return None
+            return port_range.host, port_range.free.popleft()
+
+    def lease(self) -> Tuple[str, int]:
+        """
+        Leases a free (host, port). Raises PortsExhausted if every range is full.
+        """
+        for _ in range(self.max_attempts):
+            candidate = self._next_candidate()
+            if candidate is None:
+                break
+            db = self.session_factory()
+            try:
+                db.execute(insert(models.PortLease).values(host=candidate[0], port=candidate[1], leased_at=datetime.utcnow()))
+                db.commit()
+                return candidate
+            except IntegrityError:
+                db.rollback()
+            finally:
+                db.close()
+        raise PortsExhausted("No free ports left for dynamic challenge instances")
+
+    def release_many(self, addresses: Iterable[Tuple[str, int]], db: Optional[Session] = None):
+        """
+        Deletes the leases of `addresses`. If `db` is given the delete joins the
+        caller's transaction, otherwise it is committed right away.
+        """
+        addresses = list(addresses)
+        if not addresses:
+            return
+        own_session = db is None
+        if own_session:
+            db = self.session_factory()
+        try:
+            db.execute(delete(models.PortLease).where(tuple_(models.PortLease.host, models.PortLease.port).in_(addresses)))
+            if own_session:
+                db.commit()
+        finally:
+            if own_session:
+                db.close()
+        with self._lock:
+            for address in addresses:
+                for port_range in self.ranges:
+                    if address in port_range:
+                        port_range.free.append(address[1])
+                        break
+
+    def touch_many(self, addresses: Iterable[Tuple[str, int]]):
+        """
+        Renews the leases of `addresses` so reconcile keeps treating them as held
+        by a live worker although no instance uses them yet.
+        """
+        addresses = list(addresses)
+        if not addresses:
+            return
+        db = self.session_factory()
+        try:
+            db.execute(update(models.PortLease).where(tuple_(models.PortLease.host, models.PortLease.port).in_(addresses)).values(leased_at=datetime.utcnow()))
+            db.commit()
+        finally:
+            db.close()
+
+    def release(self, host: str, port: int, db: Optional[Session] = None):
+        self.release_many([(host, port)], db=db)
+
+    def reconcile(self, db: Session, grace_seconds: float = 3600) -> dict:
+        """
+        Makes port_leases agree with dynamic_challenge_instances: live instances
+        without a lease get one, and leases older than `grace_seconds` that no
+        instance uses are freed. The grace period keeps ports of containers
+        that are starting from being reclaimed; warm pools renew the leases of
+        the containers they hold with touch_many, so those only expire once
+        their worker is gone.
+        """
+        instance = models.DynamicChallengeInstance
+        lease = models.PortLease
+        missing = db.execute(
+            select(instance.ip_address, instance.port).distinct()
+            .outerjoin(lease, and_(lease.host == instance.ip_address, lease.port == instance.port))
+            .where(lease.port.is_(None))
+        ).all()
+        restored = 0
+        if missing:
+            now = datetime.utcnow()
+            restored = _insert_missing(db, [{"host": host, "port": port, "leased_at": now} for host, port in missing])
+        cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+        in_use = select(instance.id).where(instance.ip_address == lease.host, instance.port == lease.port)
+        freed = db.execute(delete(lease).where(lease.leased_at < cutoff, ~in_use.exists())).rowcount
+        db.commit()
+        self._reload(db)
+        return {"restored": restored, "freed": freed}
+
+    def stats(self, db: Session) -> list:
+        """
+        Leased and free port counts per range, as recorded in port_leases.
+        """
+        result = []
+        for port_range in self.ranges:
+            leased = db.execute(
+                select(func.count()).select_from(models.PortLease)
+                .where(models.PortLease.host == port_range.host, models.PortLease.port.between(port_range.start, port_range.end))
+            ).scalar()
+            result.append({
+                "host": port_range.host,
+                "start": port_range.start,
+                "end": port_range.end,
+                "size": port_range.size,
+                "leased": leased,
+                "free": port_range.size - leased,
+                "utilization": round(leased / port_range.size, 4),
+            })
+        return result
+
+
+def _insert_missing(db: Session, rows: List[dict]) -> int:
+    """
+    Inserts leases, skipping any another worker has inserted concurrently
+    (e.g. a container starting on the port). Returns how many were inserted.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        return db.execute(dialect_insert(models.PortLease).values(rows).on_conflict_do_nothing()).rowcount
+    inserted = 0
+    for row in rows:
+        try:
+            with db.begin_nested():
+                db.execute(insert(models.PortLease).values(**row))
+            inserted += 1
+        except IntegrityError:
+            pass
+    return inserted
+
+
+port_allocator = PortAllocator(parse_ranges(settings.CONTAINER_PORT_RANGES))
+
+
+def reconcile_ports():
+    db = SessionLocal()
+    try:
+        result = port_allocator.reconcile(db, grace_seconds=settings.PORT_LEASE_GRACE_SECONDS)
+    finally:
+        db.close()
+    if result["restored"] or result["freed"]:
+        print(f"INFO: Reconciled port leases: {result['restored']} restored, {result['freed']} freed")
+    return result
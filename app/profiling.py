@@ -0,0 +1,230 @@
+"""
+Per-request SQL profiling, slow request log and an opt-in sampling profiler.
+
+Off unless REQUEST_PROFILING is set: only then does main.py call `enable`,
+which adds the middleware and the engine listeners, so a default deployment
+runs none of this code.
+"""
+import json
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+import redis
+from fastapi import HTTPException
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+
+from . import auth
+from .cache import get_redis
+from .config import settings
+from .database import SessionLocal, async_engine, engine
+
+PROFILE_HEADER = "X-Debug-Profile"
+PROFILE_ID_HEADER = "X-Debug-Profile-Id"
+PROFILE_KEY = "ctf:profile:{profile_id}"
+
+# Distinct statements kept per request; the rest are only counted.
+MAX_STATEMENTS = 200
+_WHITESPACE = re.compile(r"\s+")
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of the threads in `threads` every `interval` seconds
+    until stopped. The event loop thread is sampled from the start; threadpool
+    threads are added as they run the request's SQL, so other requests on the
+    same threads show up too: profile on a quiet worker where possible.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.threads = {threading.get_ident()}
+        self.samples = Counter()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> str:
+        """Returns the samples as collapsed stacks ("outer;inner count" per line), as flame graph tools read them."""
+        self._stopping.set()
+        self._thread.join()
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in list(self.threads):
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.samples[_collapse(frame)] += 1
+
+
+def _collapse(frame) -> str:
+    stack = []
+    while frame is not None:
+        stack.append(f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_qualname}")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+class RequestProfile:
+    """The statements one request ran, grouped by SQL text."""
+
+    def __init__(self, sampler: Optional[SamplingProfiler] = None):
+        self.sampler = sampler
+        self.statement_count = 0
+        self.sql_seconds = 0.0
+        self.statements = {}
+        self.dropped = 0
+
+    def record(self, statement: str, seconds: float):
+        self.statement_count += 1
+        self.sql_seconds += seconds
+        entry = self.statements.get(statement)
+        if entry is None:
+            if len(self.statements) >= MAX_STATEMENTS:
+                self.dropped += 1
+                return
+            entry = self.statements[statement] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+        if self.sampler is not None:
+            self.sampler.threads.add(threading.get_ident())
+
+    def slowest(self) -> list:
+        return [
+            {"statement": _WHITESPACE.sub(" ", statement).strip(), "count": count, "seconds": seconds}
+            for statement, (count, seconds) in sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)
+        ]
+
+
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current_profile.get() is not None:
+        context._profile_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile.get()
+    if profile is not None:
+        started = getattr(context, "_profile_started", None)
+        profile.record(statement, time.perf_counter() - started if started is not None else 0.0)
+
+
+def _is_admin(authorization: str) -> bool:
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    db = SessionLocal()
+    try:
+        user = auth.get_current_user(token=token, db=db)
+    except HTTPException:
+        return False
+    finally:
+        db.close()
+    return user.is_active and user.is_staff
+
+
+def save_profile(profile_id: str, data: dict):
+    try:
+        get_redis().set(PROFILE_KEY.format(profile_id=profile_id), json.dumps(data), ex=settings.PROFILE_TTL_SECONDS)
+    except redis.RedisError as e:
+        print(f"WARNING: Could not store request profile {profile_id}: {e}")
+
+
+def load_profile(profile_id: str) -> Optional[dict]:
+    data = get_redis().get(PROFILE_KEY.format(profile_id=profile_id))
+    return json.loads(data) if data else None
+
+
+class ProfilingMiddleware:
+    """
+    Records the SQL each request runs. Requests over `max_seconds` or
+    `max_statements` are logged with their statements, slowest first.
+    Requests from admins carrying PROFILE_HEADER are also sampled; the
+    response gets PROFILE_ID_HEADER and the profile is kept in Redis for
+    GET /admin/debug/profiles/{id}.
+    """
+
+    def __init__(self, app, max_seconds: float = 1.0, max_statements: int = 50, sample_interval: float = 0.005):
+        self.app = app
+        self.max_seconds = max_seconds
+        self.max_statements = max_statements
+        self.sample_interval = sample_interval
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        profile_id = None
+        sampler = None
+        if PROFILE_HEADER.lower().encode() in headers and await run_in_threadpool(_is_admin, headers.get(b"authorization", b"").decode("latin-1")):
+            profile_id = uuid.uuid4().hex
+            sampler = SamplingProfiler(self.sample_interval)
+        profile = RequestProfile(sampler)
+        status = {"code": 500}
+
+        async def send_with_profile(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if profile_id is not None:
+                    message["headers"] = [*message.get("headers", []), (PROFILE_ID_HEADER.lower().encode(), profile_id.encode())]
+            await send(message)
+
+        token = _current_profile.set(profile)
+        if sampler is not None:
+            sampler.start()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current_profile.reset(token)
+            cpu_profile = sampler.stop() if sampler is not None else None
+            request = f"{scope['method']} {scope['path']}"
+            if elapsed > self.max_seconds or profile.statement_count > self.max_statements:
+                self._log_slow(request, status["code"], elapsed, profile)
+            if profile_id is not None:
+                data = {
+                    "request": request, "status": status["code"], "seconds": elapsed,
+                    "statement_count": profile.statement_count, "sql_seconds": profile.sql_seconds,
+                    "statements": profile.slowest(), "cpu_profile": cpu_profile,
+                }
+                await run_in_threadpool(save_profile, profile_id, data)
+
+    def _log_slow(self, request: str, status: int, elapsed: float, profile: RequestProfile):
+        lines = [f"WARNING: Slow request {request} ({status}): {elapsed * 1000:.0f}ms, {profile.statement_count} statements, {profile.sql_seconds * 1000:.0f}ms in SQL"]
+        for entry in profile.slowest()[:20]:
+            lines.append(f"    {entry['seconds'] * 1000:8.1f}ms x{entry['count']:<4} {entry['statement'][:300]}")
+        if profile.dropped:
+            lines.append(f"    ... {profile.dropped} statements not kept")
+        print("\n".join(lines))
+
+
+def _instrument_engine(target):
+    event.listen(target, "before_cursor_execute", _before_cursor_execute)
+    event.listen(target, "after_cursor_execute", _after_cursor_execute)
+
+
+def enable(app):
+    _instrument_engine(engine)
+    if async_engine is not None:
+        _instrument_engine(async_engine.sync_engine)
+    app.add_middleware(
+        ProfilingMiddleware,
+        max_seconds=settings.SLOW_REQUEST_SECONDS,
+        max_statements=settings.SLOW_REQUEST_STATEMENTS,
+        sample_interval=settings.PROFILE_SAMPLE_INTERVAL,
+    )
+    print(f"INFO: Request profiling on (slow over {settings.SLOW_REQUEST_SECONDS}s or {settings.SLOW_REQUEST_STATEMENTS} statements)")
@@ -0,0 +1,193 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional
+
+import redis
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from . import docker_service, metrics, models
+from .cache import get_redis
+from .config import settings
+from .database import SessionLocal
+from .instance_jobs import job_runner
+from .port_allocator import PortAllocator, port_allocator
+
+LEASE_KEY = "ctf:reaper:lease"
+
+# Only the lease holder may renew or release it.
+_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class InstanceReaper:
+    """
+    Stops the containers of expired dynamic challenge instances and deletes
+    their rows.
+
+    Every worker runs a reaper, but a pass only proceeds while holding a
+    short Redis lease, so normally a single worker reaps at a time. Rows are
+    additionally claimed with FOR UPDATE SKIP LOCKED, which keeps concurrent
+    passes from stopping the same container if Redis is unavailable. Expired
+    rows are handled in batches of `batch_size`: containers are stopped with
+    at most `parallelism` concurrent stops, and the rows whose container
+    stopped are deleted, and their port leases released, with one statement
+    each. Failed stops stay in the table and are retried on the next pass.
+    Each pass also fails stale lifecycle jobs and purges old finished ones.
+    """
+
+    def __init__(self, backend: docker_service.ContainerBackend, allocator: PortAllocator = port_allocator, session_factory=SessionLocal, interval: float = 60, batch_size: int = 200, parallelism: int = 8, lease_seconds: float = 120):
+        self.backend = backend
+        self.allocator = allocator
+        self.session_factory = session_factory
+        self.interval = interval
+        self.batch_size = batch_size
+        self.parallelism = parallelism
+        self.lease_ms = int(lease_seconds * 1000)
+        self._token = uuid.uuid4().hex
+        self._run_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"runs": 0, "skipped": 0, "reaped": 0, "stop_errors": 0, "last_run_at": None, "last_reaped": 0, "last_run_seconds": 0.0, "max_run_seconds": 0.0}
+
+    def _acquire_lease(self) -> bool:
+        try:
+            return bool(get_redis().set(LEASE_KEY, self._token, nx=True, px=self.lease_ms))
+        except redis.RedisError as e:
+            print(f"WARNING: Reaper lease unavailable, relying on row locks: {e}")
+            return True
+
+    def _renew_lease(self):
+        try:
+            get_redis().eval(_RENEW_SCRIPT, 1, LEASE_KEY, self._token, self.lease_ms)
+        except redis.RedisError:
+            pass
+
+    def _release_lease(self):
+        try:
+            get_redis().eval(_RELEASE_SCRIPT, 1, LEASE_KEY, self._token)
+        except redis.RedisError:
+            pass
+
+    def _stop(self, container_id: str) -> bool:
+        try:
+            self.backend.stop(container_id)
+            return True
+        except Exception as e:
+            print(f"ERROR: Failed to stop expired container {container_id}: {e}")
+            return False
+
+    def _reap_batch(self, db: Session, executor: ThreadPoolExecutor, now: datetime, failed: set) -> tuple:
+        query = select(
+            models.DynamicChallengeInstance.id,
+            models.DynamicChallengeInstance.container_id,
+            models.DynamicChallengeInstance.ip_address,
+            models.DynamicChallengeInstance.port,
+        ).where(models.DynamicChallengeInstance.expires_at <= now)
+        if failed:
+            query = query.where(models.DynamicChallengeInstance.id.not_in(failed))
+        rows = db.execute(
+            query
+            .order_by(models.DynamicChallengeInstance.expires_at)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        stopped = list(executor.map(self._stop, [row.container_id for row in rows]))
+        reaped = [row for row, ok in zip(rows, stopped) if ok]
+        failed.update(row.id for row, ok in zip(rows, stopped) if not ok)
+        if reaped:
+            db.execute(delete(models.DynamicChallengeInstance).where(models.DynamicChallengeInstance.id.in_([row.id for row in reaped])))
+            self.allocator.release_many([(row.ip_address, row.port) for row in reaped], db=db)
+        db.commit()
+        return len(rows), len(reaped)
+
+    def run_once(self) -> dict:
+        """
+        Reaps every instance that has expired by now. Returns
+        {"reaped", "stop_errors", "jobs_failed", "jobs_purged", "seconds"}, or
+        {"skipped": True} if another worker holds the lease.
+        """
+        with self._run_lock:
+            if not self._acquire_lease():
+                self._stats["skipped"] += 1
+                return {"skipped": True}
+            start = time.perf_counter()
+            reaped = 0
+            failed = set()
+            db = self.session_factory()
+            try:
+                now = datetime.utcnow()
+                with ThreadPoolExecutor(max_workers=self.parallelism, thread_name_prefix="reaper") as executor:
+                    while not self._stopping.is_set():
+                        # Failed stops are excluded so the pass doesn't claim them again.
+                        claimed, batch_reaped = self._reap_batch(db, executor, now, failed)
+                        reaped += batch_reaped
+                        if claimed < self.batch_size:
+                            break
+                        self._renew_lease()
+                # Jobs whose worker process died mid-run would otherwise stay open and block new starts.
+                jobs_failed = job_runner.fail_stale(db, settings.INSTANCE_JOB_TIMEOUT_SECONDS)
+                purged = job_runner.purge(db, settings.INSTANCE_JOB_RETENTION_SECONDS)
+                db.commit()
+            finally:
+                db.close()
+                self._release_lease()
+            elapsed = time.perf_counter() - start
+            errors = len(failed)
+            self._stats["runs"] += 1
+            self._stats["reaped"] += reaped
+            self._stats["stop_errors"] += errors
+            self._stats["last_run_at"] = datetime.utcnow()
+            self._stats["last_reaped"] = reaped
+            self._stats["last_run_seconds"] = elapsed
+            self._stats["max_run_seconds"] = max(self._stats["max_run_seconds"], elapsed)
+            metrics.INSTANCES.labels("reap", "ok").inc(reaped)
+            metrics.INSTANCES.labels("reap", "failed").inc(errors)
+        if reaped or errors:
+            print(f"INFO: Reaped {reaped} expired dynamic challenge instances in {elapsed:.2f}s ({errors} failed to stop)")
+        if jobs_failed:
+            print(f"WARNING: Marked {jobs_failed} interrupted instance jobs as failed")
+        return {"reaped": reaped, "stop_errors": errors, "jobs_failed": jobs_failed, "jobs_purged": purged, "seconds": elapsed}
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"ERROR: Instance reaper pass failed: {e}")
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="instance-reaper", daemon=True)
+            self._thread.start()
+
+    def shutdown(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> dict:
+        return dict(self._stats)
+
+
+reaper = InstanceReaper(
+    docker_service.backend,
+    interval=settings.REAPER_INTERVAL_SECONDS,
+    batch_size=settings.REAPER_BATCH_SIZE,
+    parallelism=settings.REAPER_PARALLELISM,
+)
@@ -1,9 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Literal, Optional
 
-from .. import auth, crud, models, schemas, email
-from ..database import get_db
+from .. import auth, audit_archive, crud, models, profiling, schemas, email, leaderboard, scoring
+from ..audit import audit_writer
+from ..user_cache import user_cache
+from ..database import get_db, pool_stats
+from ..instance_pool import warm_pool
+from ..reaper import reaper
+from ..instance_jobs import job_runner
+from ..notification_hub import notification_hub
+from ..pagination import set_next_cursor
+from ..port_allocator import port_allocator
 
 router = APIRouter()
 
@@ -12,23 +21,127 @@ router = APIRouter()
 # ==================================
 
 @router.get("/settings/", response_model=schemas.CTFSetting)
-def read_settings(db: Session = Depends(get_db), current_admin: models.User = Depends(auth.get_current_admin_user)):
+def read_settings(db: Session = Depends(get_db), current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
     return crud.get_settings(db)
 
 @router.put("/settings/", response_model=schemas.CTFSetting)
 def update_settings(
     settings_data: schemas.CTFSettingUpdate, db: Session = Depends(get_db),
-    current_admin: models.User = Depends(auth.get_current_admin_user)
+    current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)
 ):
     crud.create_audit_log(db=db, action="admin_update_settings", user_id=current_admin.id, details={"changes": settings_data.dict(exclude_unset=True)})
     return crud.update_settings(db, settings_data)
 
+# ==================================
+# Challenge Management
+# ==================================
+
+@router.get("/challenges/", response_model=List[schemas.AdminChallenge])
+def read_challenges(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
+    return crud.get_challenges(db, skip=skip, limit=limit)
+
+@router.get("/challenges/{challenge_id}", response_model=schemas.AdminChallenge)
+def read_challenge(challenge_id: int, db: Session = Depends(get_db), current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
+    db_challenge = crud.get_challenge_by_id(db, challenge_id=challenge_id)
+    if not db_challenge: raise HTTPException(status_code=404, detail="Challenge not found")
+    return db_challenge
+
+@router.post("/challenges/", response_model=schemas.AdminChallenge, status_code=status.HTTP_201_CREATED)
+def create_challenge(challenge: schemas.ChallengeCreate, db: Session = Depends(get_db), current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
+    try:
+        new_challenge = crud.create_challenge(db=db, challenge=challenge)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    crud.create_audit_log(db=db, action="admin_create_challenge", user_id=current_admin.id, details={"challenge_id": new_challenge.id, "name": new_challenge.name})
+    return new_challenge
+
+@router.put("/challenges/{challenge_id}", response_model=schemas.AdminChallenge)
+def update_challenge(challenge_id: int, challenge: schemas.ChallengeUpdate, db: Session = Depends(get_db), current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
+    db_challenge = crud.get_challenge_by_id(db, challenge_id=challenge_id)
+    if not db_challenge: raise HTTPException(status_code=404, detail="Challenge not found")
+    try:
+        updated = crud.update_challenge(db=db, db_challenge=db_challenge, challenge_data=challenge)
+    except ValueError as e:
+        # Covers unknown tag/dependency ids and DependencyCycleError.
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    crud.create_audit_log(db=db, action="admin_update_challenge", user_id=current_admin.id, details={"challenge_id": challenge_id, "changes": challenge.dict(exclude_unset=True, exclude={"flag"})})
+    return updated
+
+@router.delete("/challenges/{challenge_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_challenge(challenge_id: int, db: Session = Depends(get_db), current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
+    db_challenge = crud.get_challenge_by_id(db, challenge_id=challenge_id)
+    if not db_challenge: raise HTTPException(status_code=404, detail="Challenge not found")
+    if crud.get_solve_count_for_challenge(db, challenge_id=challenge_id):
+        raise HTTPException(status_code=400, detail="Challenge has solves and cannot be deleted. Hide it instead.")
+    crud.create_audit_log(db=db, action="admin_delete_challenge", user_id=current_admin.id, details={"challenge_id": challenge_id, "name": db_challenge.name})
+    crud.delete_challenge(db, db_challenge=db_challenge)
+
+@router.get("/challenges/warm-pools/")
+def read_warm_pools(current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
+    """
+    Ready/starting containers per challenge warm pool on this worker.
+    """
+    return warm_pool.stats()
+
+@router.get("/challenges/ports/", response_model=List[schemas.PortRangeUsage])
+def read_port_usage(db: Session = Depends(get_db), current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
+    """
+    How full each configured container port range is.
+    """
+    return port_allocator.stats(db)
+
+@router.get("/challenges/jobs/", response_model=schemas.InstanceJobRunnerStats)
+def read_instance_job_stats(current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
+    """
+    Queued and finished instance start/stop jobs on this worker.
+    """
+    return job_runner.stats()
+
+@router.get("/challenges/reaper/", response_model=schemas.ReaperStats)
+def read_reaper_stats(current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
+    """
+    How many expired instances this worker's reaper has stopped, and how long it took.
+    """
+    return reaper.stats()
+
+@router.post("/challenges/reaper/run")
+def run_reaper(db: Session = Depends(get_db), current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
+    """
+    Reaps expired dynamic challenge instances now instead of waiting for the next pass.
+    """
+    result = reaper.run_once()
+    crud.create_audit_log(db=db, action="admin_reap_instances", user_id=current_admin.id, details=result)
+    return result
+
+# ==================================
+# Leaderboard Maintenance
+# ==================================
+
+@router.post("/leaderboard/rebuild")
+def rebuild_leaderboard(db: Session = Depends(get_db), current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
+    """
+    Recompute the team and user rankings from the solves table.
+    """
+    counts = leaderboard.rebuild(db)
+    crud.create_audit_log(db=db, action="admin_rebuild_leaderboard", user_id=current_admin.id, details=counts)
+    return counts
+
+@router.post("/scoring/rescore")
+def rescore(db: Session = Depends(get_db), current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
+    """
+    Recompute dynamic challenge values and every user's score, then rebuild the leaderboard.
+    """
+    counts = scoring.rescore(db, crud.get_cached_settings(db).scoring_mode)
+    crud.create_audit_log(db=db, action="admin_rescore", user_id=current_admin.id, details=counts)
+    return counts
+
 # ==================================
 # Badge Management
 # ==================================
 
 @router.post("/badges/", response_model=schemas.Badge, status_code=status.HTTP_201_CREATED)
-def create_badge(badge: schemas.BadgeCreate, db: Session = Depends(get_db), current_admin: models.User = Depends(auth.get_current_admin_user)):
+def create_badge(badge: schemas.BadgeCreate, db: Session = Depends(get_db), current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
     if crud.get_badge_by_name(db, name=badge.name):
         raise HTTPException(status_code=400, detail="Badge with this name already exists")
     new_badge = crud.create_badge(db=db, badge=badge)
@@ -36,17 +149,17 @@ def create_badge(badge: schemas.BadgeCreate, db: Session = Depends(get_db), curr
     return new_badge
 
 @router.get("/badges/", response_model=List[schemas.Badge])
-def read_badges(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_admin: models.User = Depends(auth.get_current_admin_user)):
+def read_badges(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
     return crud.get_badges(db, skip=skip, limit=limit)
 
 @router.put("/badges/{badge_id}", response_model=schemas.Badge)
-def update_badge(badge_id: int, badge: schemas.BadgeCreate, db: Session = Depends(get_db), current_admin: models.User = Depends(auth.get_current_admin_user)):
+def update_badge(badge_id: int, badge: schemas.BadgeCreate, db: Session = Depends(get_db), current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
     if not crud.get_badge(db, badge_id=badge_id): raise HTTPException(status_code=404, detail="Badge not found")
     crud.create_audit_log(db=db, action="admin_update_badge", user_id=current_admin.id, details={"badge_id": badge_id, "changes": badge.dict()})
     return crud.update_badge(db=db, badge_id=badge_id, badge_data=badge)
 
 @router.delete("/badges/{badge_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_badge(badge_id: int, db: Session = Depends(get_db), current_admin: models.User = Depends(auth.get_current_admin_user)):
+def delete_badge(badge_id: int, db: Session = Depends(get_db), current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
     db_badge = crud.get_badge(db, badge_id=badge_id)
     if not db_badge: raise HTTPException(status_code=404, detail="Badge not found")
     crud.create_audit_log(db=db, action="admin_delete_badge", user_id=current_admin.id, details={"badge_id": badge_id, "badge_name": db_badge.name})
@@ -57,11 +170,13 @@ def delete_badge(badge_id: int, db: Session = Depends(get_db), current_admin: mo
 # ==================================
 
 @router.get("/users/pending", response_model=List[schemas.User])
-def get_pending_verification_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_admin: models.User = Depends(auth.get_current_admin_user)):
-    return crud.get_pending_users(db, skip=skip, limit=limit)
+def get_pending_verification_users(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_db), current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
+    users = crud.get_pending_users(db, skip=skip, limit=limit, cursor=cursor)
+    set_next_cursor(response, users, limit, crud.id_cursor)
+    return users
 
 @router.post("/users/{user_id}/approve", response_model=schemas.User)
-def approve_user_registration(user_id: int, db: Session = Depends(get_db), current_admin: models.User = Depends(auth.get_current_admin_user)):
+def approve_user_registration(user_id: int, db: Session = Depends(get_db), current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
     db_user = crud.get_user(db, user_id=user_id)
     if not db_user: raise HTTPException(status_code=404, detail="User not found")
     if db_user.is_active: raise HTTPException(status_code=400, detail="User is already active")
@@ -69,40 +184,126 @@ def approve_user_registration(user_id: int, db: Session = Depends(get_db), curre
     crud.create_notification(db=db, user_id=db_user.id, title="Account Approved", body="Your account has been manually approved by an administrator.")
     return crud.approve_user(db=db, user=db_user)
 
-@router.post("/users/email")
+@router.post("/users/{user_id}/revoke-tokens", response_model=schemas.User)
+def revoke_user_tokens(user_id: int, db: Session = Depends(get_db), current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
+    db_user = crud.get_user(db, user_id=user_id)
+    if not db_user: raise HTTPException(status_code=404, detail="User not found")
+    crud.create_audit_log(db=db, action="admin_revoke_tokens", user_id=current_admin.id, details={"revoked_user_id": user_id})
+    return crud.revoke_user_tokens(db=db, user=db_user)
+
+@router.get("/users/cache", response_model=schemas.UserCacheStats)
+def get_user_cache_stats(current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
+    """
+    Hit/miss counters of this worker's authenticated-user cache.
+    """
+    return user_cache.stats()
+
+@router.post("/users/email", status_code=status.HTTP_202_ACCEPTED)
 async def send_bulk_email(
     email_data: schemas.AdminMassEmail,
     db: Session = Depends(get_db),
-    current_admin: models.User = Depends(auth.get_current_admin_user)
+    current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)
 ):
     """
-    Send a mass email to all registered users.
+    Send a mass email to all registered users. The email is sent in the
+    background; poll /admin/users/email/{job_id} for progress.
     """
-    users = crud.get_all_users(db)
-    recipient_emails = [user.email for user in users]
+    job = await email.send_mass_email(subject=email_data.subject, body=email_data.body)
 
-    if not recipient_emails:
+    if not job["recipient_count"]:
         return {"message": "No users to email."}
 
-    await email.send_mass_email(
-        email_to=recipient_emails,
-        subject=email_data.subject,
-        body=email_data.body
-    )
-
     crud.create_audit_log(
         db=db,
         action="admin_mass_email",
         user_id=current_admin.id,
-        details={"subject": email_data.subject, "recipient_count": len(recipient_emails)}
+        details={"subject": email_data.subject, "recipient_count": job["recipient_count"], "job_id": job["job_id"]}
     )
 
-    return {"message": f"Email sent to {len(recipient_emails)} users successfully."}
+    return {"message": f"Sending email to {job['recipient_count']} users.", **job}
+
+@router.get("/users/email/{job_id}", response_model=schemas.MassEmailProgress)
+def read_bulk_email_progress(job_id: str, current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
+    """
+    Progress of a mass email job.
+    """
+    progress = email.mass_mailer.get_progress(job_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Email job not found")
+    return progress
+
+@router.post("/notifications/broadcast", response_model=schemas.Notification)
+def send_broadcast(broadcast: schemas.BroadcastCreate, db: Session = Depends(get_db), current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
+    """
+    Send a notification to every user. It is stored once and merged into each
+    user's notification list when read.
+    """
+    db_broadcast = crud.create_broadcast(db, broadcast=broadcast)
+    crud.create_audit_log(db=db, action="admin_broadcast_notification", user_id=current_admin.id, details={"broadcast_id": db_broadcast.id, "title": db_broadcast.title})
+    return crud.broadcast_for_user(db_broadcast, current_admin.id, False)
+
+@router.get("/notifications/hub", response_model=schemas.NotificationHubStats)
+def read_notification_hub_stats(current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
+    """
+    Open notification streams and push counters on this worker.
+    """
+    return notification_hub.stats()
+
+# ==================================
+# Database Pool Telemetry
+# ==================================
+
+@router.get("/db/pool")
+def get_pool_stats(current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
+    """
+    Connection pool usage and checkout wait times for this worker.
+    """
+    return pool_stats()
+
+@router.get("/debug/profiles/{profile_id}")
+def get_request_profile(profile_id: str, fmt: Literal["json", "collapsed"] = Query("json", alias="format"), current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
+    """
+    A request profiled with the X-Debug-Profile header (REQUEST_PROFILING on):
+    its statements, slowest first, and CPU samples. format=collapsed returns
+    only the samples, for flame graph tools.
+    """
+    profile = profiling.load_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found or expired")
+    if fmt == "collapsed":
+        return Response(content=profile["cpu_profile"] or "", media_type="text/plain")
+    return profile
 
 # ==================================
 # Audit Log Viewer
 # ==================================
 
 @router.get("/logs/", response_model=List[schemas.AuditLog])
-def get_audit_logs(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_admin: models.User = Depends(auth.get_current_admin_user)):
-    return crud.get_audit_logs(db, skip=skip, limit=limit)
+def get_audit_logs(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, filters: schemas.AuditLogFilter = Depends(), db: Session = Depends(get_db), current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
+    """
+    Newest first, optionally filtered by action, user, challenge and time
+    range. Page with the X-Next-Cursor response header rather than `skip`,
+    which gets slower the deeper it goes.
+    """
+    logs = crud.get_audit_logs(db, skip=skip, limit=limit, cursor=cursor, filters=filters)
+    set_next_cursor(response, logs, limit, crud.audit_logs_cursor)
+    return logs
+
+@router.get("/logs/export")
+def export_audit_logs(fmt: Literal["ndjson", "csv"] = Query("ndjson", alias="format"), filters: schemas.AuditLogFilter = Depends(), db: Session = Depends(get_db), current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
+    """
+    Streams every matching audit log, oldest first, as NDJSON or CSV.
+    """
+    crud.create_audit_log(db=db, action="admin_export_audit_logs", user_id=current_admin.id, details={"format": fmt, "filters": filters.model_dump(mode="json", exclude_none=True)})
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="audit_logs.{fmt}"'}
+    return StreamingResponse(audit_archive.export_audit_logs(filters, fmt), media_type=media_type, headers=headers)
+
+@router.get("/logs/writer", response_model=schemas.AuditLogWriterStats)
+def get_audit_log_writer_stats(current_admin: schemas.CurrentUser = Depends(auth.get_current_admin_user)):
+    """
+    Buffer depth and flush latency of the write-behind audit log writer.
+    """
+    if audit_writer is None:
+        return schemas.AuditLogWriterStats(mode="sync")
+    return schemas.AuditLogWriterStats(mode="buffered", **audit_writer.stats())
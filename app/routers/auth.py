@@ -2,9 +2,8 @@ from fastapi import APIRouter, Depends, Request
 from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
 from authlib.integrations.starlette_client import OAuth
-from datetime import timedelta
 
-from .. import crud, security
+from .. import auth, crud
 from ..config import settings
 from ..database import get_db
 
@@ -46,10 +45,7 @@ async def callback_google(request: Request, db: Session = Depends(get_db)):
     )
     
     # Create a local JWT for the user
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = security.create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
+    access_token = auth.create_user_access_token(user)
     
     # Redirect to the frontend with the token
     # In a real app, this URL would come from your config
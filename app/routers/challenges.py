@@ -1,41 +1,80 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status, Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from datetime import datetime, timezone
 
-from .. import auth, crud, models, schemas, security
-from ..database import get_db
+from .. import auth, crud, metrics, schemas
+from ..cache import etag_matches, make_etag
+from ..database import SessionLocal, get_async_db, get_db
 from ..limiter import limiter
 
 router = APIRouter()
 
+SUBMISSION_ERRORS = {
+    crud.SUBMIT_NOT_FOUND: (status.HTTP_404_NOT_FOUND, "Challenge not found"),
+    crud.SUBMIT_LOCKED: (status.HTTP_403_FORBIDDEN, "Challenge is locked."),
+    crud.SUBMIT_ALREADY_SOLVED: (status.HTTP_400_BAD_REQUEST, "You have already solved this challenge."),
+    crud.SUBMIT_INCORRECT: (status.HTTP_400_BAD_REQUEST, "Incorrect flag."),
+}
+
+# Clients must revalidate, but may keep the body and send If-None-Match.
+CACHE_CONTROL = "private, no-cache"
+
+def _cached_settings() -> schemas.CTFSetting:
+    # A cold settings cache reads its version from Redis, so keep it off the event loop.
+    with SessionLocal() as db:
+        return crud.get_cached_settings(db)
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
 @router.get("/", response_model=List[schemas.ChallengeList])
-def read_challenges(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
+async def read_challenges(
+    if_none_match: Optional[str] = Header(None),
+    db = Depends(get_async_db),
+    current_user: schemas.CurrentUser = Depends(auth.get_current_active_user)
 ):
-    return crud.get_visible_challenges(db, user_id=current_user.id)
+    """
+    Sends an ETag derived from the challenge catalog's version and the user's
+    solves; a matching If-None-Match gets a 304 without touching the database.
+    """
+    versions = await run_in_threadpool(crud.challenge_list_versions, current_user.id)
+    etag = make_etag(versions, scope=f"u{current_user.id}-")
+    if etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    body = await db.run_sync(crud.get_challenge_list_body, user_id=current_user.id, catalog_version=versions and versions[:2])
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL} if etag else {}
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @router.get("/{challenge_id}", response_model=schemas.ChallengeDetail)
 def read_challenge_detail(
-    challenge_id: int, db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
+    challenge_id: int, response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    current_user: schemas.CurrentUser = Depends(auth.get_current_active_user)
 ):
+    etag = make_etag(crud.challenge_detail_versions(current_user.id, challenge_id), scope=f"u{current_user.id}-")
+    if etag_matches(if_none_match, etag):
+        return _not_modified(etag)
     challenge = crud.get_challenge(db, challenge_id=challenge_id, user_id=current_user.id)
     if challenge is None or not challenge.is_visible:
         raise HTTPException(status_code=404, detail="Challenge not found")
+    if etag:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = CACHE_CONTROL
     return challenge
 
 @router.post("/{challenge_id}/submit")
 @limiter.limit("20/minute")
-def submit_flag(
+async def submit_flag(
     request: Request,
     challenge_id: int, 
     submission: schemas.FlagSubmission, 
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
+    db = Depends(get_async_db),
+    current_user: schemas.CurrentUser = Depends(auth.get_current_active_user)
 ):
-    settings = crud.get_settings(db)
+    settings = await run_in_threadpool(_cached_settings)
     now = datetime.now(timezone.utc)
 
     if settings.event_start_time and now < settings.event_start_time:
@@ -43,25 +82,11 @@ def submit_flag(
     if settings.event_end_time and now > settings.event_end_time:
         raise HTTPException(status_code=403, detail="The event has ended.")
 
-    challenge = crud.get_challenge(db, challenge_id=challenge_id, user_id=current_user.id)
-    if challenge is None or not challenge.is_visible:
-        raise HTTPException(status_code=404, detail="Challenge not found")
-    if challenge.is_locked:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Challenge is locked.")
-    if crud.has_user_solved_challenge(db, user_id=current_user.id, challenge_id=challenge_id):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="You have already solved this challenge.")
-
-    if not security.compare_flags(submission.flag, challenge.flag):
-        crud.create_audit_log(db=db, action="flag_submit_incorrect", user_id=current_user.id, details={"challenge_id": challenge.id, "submission": submission.flag})
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Incorrect flag.")
-
-    crud.create_audit_log(db=db, action="flag_submit_correct", user_id=current_user.id, details={"challenge_id": challenge.id, "submission": submission.flag})
-    crud.create_solve(db=db, user=current_user, challenge=challenge)
-    crud.update_user_score(db=db, user=current_user, points=challenge.points)
-
-    solve_count = crud.get_solve_count_for_challenge(db, challenge_id=challenge_id)
-    if solve_count == 1:
-        first_blood_badge = crud.get_badge_by_name(db, name="First Blood")
-        if first_blood_badge and crud.award_badge_to_user(db=db, user=current_user, badge=first_blood_badge):
-            crud.create_notification(db=db, user_id=current_user.id, title="New Badge Earned!", body=f"You earned the '{first_blood_badge.name}' badge for '{challenge.name}'.")
+    result, solve = await db.run_sync(crud.check_flag, user=current_user, challenge_id=challenge_id, flag=submission.flag, scoring_mode=settings.scoring_mode)
+    if solve is not None:
+        await run_in_threadpool(crud.publish_solve, **solve)
+    metrics.SUBMISSIONS.labels(result).inc()
+    if result != crud.SUBMIT_CORRECT:
+        status_code, detail = SUBMISSION_ERRORS[result]
+        raise HTTPException(status_code=status_code, detail=detail)
     return {"message": "Correct flag!"}
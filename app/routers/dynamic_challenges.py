@@ -1,68 +1,70 @@
+import json
+
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
 
-from .. import auth, crud, models, schemas, docker_service
-from ..database import get_db
+from .. import auth, crud, instance_jobs, models, schemas
+from ..database import SessionLocal, get_db
+from ..instance_jobs import job_runner, job_watch_hub
 
 router = APIRouter()
 
-@router.post("/{challenge_id}/start", response_model=schemas.DynamicChallengeInstance)
+
+def _job_response(db: Session, job: models.InstanceJob) -> schemas.InstanceJob:
+    response = schemas.InstanceJob.model_validate(job)
+    if job.action == instance_jobs.START and job.status == instance_jobs.READY and job.instance_id:
+        instance = crud.get_instance_by_id(db, instance_id=job.instance_id)
+        if instance:
+            response.instance = schemas.DynamicChallengeInstance.model_validate(instance)
+    return response
+
+def _get_own_job(db: Session, job_id: int, user_id: int) -> models.InstanceJob:
+    job = crud.get_instance_job(db, job_id=job_id)
+    if not job or job.user_id != user_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+@router.post("/{challenge_id}/start", response_model=schemas.InstanceJob, status_code=status.HTTP_202_ACCEPTED)
 def start_challenge(
     challenge_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
+    current_user: schemas.CurrentUser = Depends(auth.get_current_active_user)
 ):
     """
-    Starts a new dynamic challenge instance for the user.
+    Queues the start of a dynamic challenge instance for the user. Poll
+    /jobs/{job_id} or stream /jobs/{job_id}/events until the job is ready;
+    the ready job carries the instance's connection details.
     """
-    # 1a. Check if the user already has an active instance
+    # 1a. Check if the user already has an active or starting instance
     active_instance = crud.get_active_instance_for_user(
         db, user_id=current_user.id, challenge_id=challenge_id
     )
-    if active_instance:
+    if active_instance or crud.get_open_instance_job(db, user_id=current_user.id, challenge_id=challenge_id, action=instance_jobs.START):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="You already have an active instance for this challenge."
         )
 
     # Check if the challenge exists
-    challenge = db.query(models.Challenge).filter(models.Challenge.id == challenge_id).first()
+    challenge = db.query(models.Challenge.id).filter(models.Challenge.id == challenge_id).first()
     if not challenge:
         raise HTTPException(status_code=404, detail="Challenge not found")
 
-    # 1b. Call the placeholder Docker service
-    container_details = docker_service.start_challenge_container(challenge)
-
-    # 1c. Save instance details to the database
-    expires_at = datetime.utcnow() + timedelta(hours=1)  # Instance is valid for 1 hour
-    
-    new_instance = crud.create_instance(
-        db=db,
-        user_id=current_user.id,
-        challenge_id=challenge_id,
-        container_id=container_details["container_id"],
-        ip_address="127.0.0.1",  # Placeholder IP
-        port=container_details["port"],
-        expires_at=expires_at
-    )
-    
-    crud.create_audit_log(
-        db, action="dynamic_challenge_start", user_id=current_user.id,
-        details={"challenge_id": challenge_id, "instance_id": new_instance.id}
-    )
+    # 1b. Hand the container work to the lifecycle job runner
+    job = crud.create_instance_job(db, user_id=current_user.id, challenge_id=challenge_id, action=instance_jobs.START)
+    job_runner.submit(job)
+    return job
 
-    # 1d. Return connection details
-    return new_instance
-
-@router.post("/stop/{instance_id}")
+@router.post("/stop/{instance_id}", response_model=schemas.InstanceJob, status_code=status.HTTP_202_ACCEPTED)
 def stop_challenge(
     instance_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
+    current_user: schemas.CurrentUser = Depends(auth.get_current_active_user)
 ):
     """
-    Stops a running dynamic challenge instance for the user.
+    Queues the stop of a running dynamic challenge instance for the user.
     """
     instance = crud.get_instance_by_id(db, instance_id=instance_id)
 
@@ -72,16 +74,47 @@ def stop_challenge(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Instance not found or you do not have permission to stop it."
         )
-    
-    # Call the placeholder service to stop the container
-    docker_service.stop_challenge_container(instance.container_id)
-    
-    # Delete the record from the database
-    crud.delete_instance(db, instance_id=instance_id)
-
-    crud.create_audit_log(
-        db, action="dynamic_challenge_stop", user_id=current_user.id,
-        details={"challenge_id": instance.challenge_id, "instance_id": instance_id}
-    )
 
-    return {"message": "Challenge instance stopped successfully."}
+    job = crud.create_instance_job(db, user_id=current_user.id, challenge_id=instance.challenge_id, action=instance_jobs.STOP, instance_id=instance_id)
+    job_runner.submit(job)
+    return job
+
+@router.get("/jobs/{job_id}", response_model=schemas.InstanceJob)
+def read_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: schemas.CurrentUser = Depends(auth.get_current_active_user)
+):
+    """
+    Current status of a start/stop job: pending, running, ready or failed.
+    """
+    return _job_response(db, _get_own_job(db, job_id, current_user.id))
+
+def _finished_job(job_id: int) -> dict:
+    db = SessionLocal()
+    try:
+        return _job_response(db, crud.get_instance_job(db, job_id=job_id)).model_dump(mode="json")
+    finally:
+        db.close()
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: schemas.CurrentUser = Depends(auth.get_current_active_user)
+):
+    """
+    Server-sent events with the job's status, one event per change, ending
+    once the job is ready or failed.
+    """
+    await run_in_threadpool(_get_own_job, db, job_id, current_user.id)
+    # Don't hold on to the request's session while the stream is open.
+    await run_in_threadpool(db.close)
+
+    async def events():
+        async for payload in job_watch_hub.watch(job_id):
+            if payload["status"] in instance_jobs.FINISHED:
+                payload = await run_in_threadpool(_finished_job, job_id)
+            yield f"event: status\ndata: {json.dumps(payload)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
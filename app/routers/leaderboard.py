@@ -1,30 +1,93 @@
-from typing import List
-from fastapi import APIRouter, Depends
+from typing import List, Literal
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
-from .. import auth, crud, schemas
-from ..database import get_db
+from .. import auth, leaderboard, schemas, score_history
+from ..database import SessionLocal, get_db
 
 router = APIRouter()
 
+def _team_entry(entry: dict) -> schemas.LeaderboardEntry:
+    return schemas.LeaderboardEntry(
+        rank=entry["rank"],
+        team_id=entry["id"],
+        team_name=entry["name"],
+        total_score=entry["points"],
+        last_submission=entry["last_solve"]
+    )
+
+def _read_team_page(offset: int, limit: int) -> List[dict]:
+    # Blocking Redis calls, and ensure_ready may wait for another worker's rebuild:
+    # runs in the threadpool, with a session of its own for a rebuild.
+    with SessionLocal() as db:
+        leaderboard.ensure_ready(db)
+    return leaderboard.teams.page(offset, limit)
+
 @router.get("/", response_model=List[schemas.LeaderboardEntry])
-def read_leaderboard(
+async def read_leaderboard(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    current_user: schemas.CurrentUser = Depends(auth.get_current_active_user)
+):
+    """
+    Retrieve a page of the team leaderboard.
+    """
+    return [_team_entry(entry) for entry in await run_in_threadpool(_read_team_page, offset, limit)]
+
+@router.get("/users", response_model=List[schemas.UserLeaderboardEntry])
+def read_user_leaderboard(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
     db: Session = Depends(get_db),
-    current_user: schemas.User = Depends(auth.get_current_active_user)
+    current_user: schemas.CurrentUser = Depends(auth.get_current_active_user)
 ):
     """
-    Retrieve the competition leaderboard.
-    """
-    board_data = crud.get_leaderboard(db)
-    leaderboard = []
-    for i, (team_id, team_name, total_score, last_submission) in enumerate(board_data):
-        leaderboard.append(
-            schemas.LeaderboardEntry(
-                rank=i + 1,
-                team_id=team_id,
-                team_name=team_name,
-                total_score=total_score or 0,
-                last_submission=last_submission
-            )
+    Retrieve a page of the individual leaderboard.
+    """
+    leaderboard.ensure_ready(db)
+    return [
+        schemas.UserLeaderboardEntry(
+            rank=entry["rank"],
+            user_id=entry["id"],
+            username=entry["name"],
+            score=entry["points"],
+            last_submission=entry["last_solve"]
         )
-    return leaderboard
+        for entry in leaderboard.users.page(offset, limit)
+    ]
+
+@router.get("/me", response_model=schemas.LeaderboardEntry)
+def read_my_team_rank(
+    db: Session = Depends(get_db),
+    current_user: schemas.CurrentUser = Depends(auth.get_current_active_user)
+):
+    """
+    Retrieve the current user's team standing.
+    """
+    if not current_user.team_id:
+        raise HTTPException(status_code=404, detail="You are not on a team.")
+    leaderboard.ensure_ready(db)
+    entry = leaderboard.teams.rank(current_user.team_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Your team is not ranked yet.")
+    return _team_entry(entry)
+
+@router.get("/history", response_model=List[schemas.ScoreSeries])
+def read_score_history(
+    kind: Literal["teams", "users"] = "teams",
+    top: int = Query(10, ge=1, le=50),
+    resolution: int = Query(60),
+    db: Session = Depends(get_db),
+    current_user: schemas.CurrentUser = Depends(auth.get_current_active_user)
+):
+    """
+    Retrieve pre-bucketed score-over-time series for the current top teams or users.
+    """
+    if resolution not in score_history.RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"Resolution must be one of {list(score_history.RESOLUTIONS)} seconds.")
+    leaderboard.ensure_ready(db)
+    ranking = leaderboard.teams if kind == "teams" else leaderboard.users
+    entries = ranking.page(0, top)
+    series = score_history.get_series(kind, [entry["id"] for entry in entries], resolution)
+    return [schemas.ScoreSeries(id=entry["id"], name=entry["name"], points=series[entry["id"]]) for entry in entries]
@@ -0,0 +1,19 @@
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Response, status
+
+from .. import metrics
+from ..config import settings
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+def read_metrics(authorization: Optional[str] = Header(None)):
+    """
+    Prometheus scrape endpoint.
+    """
+    if settings.METRICS_TOKEN and not hmac.compare_digest(authorization or "", f"Bearer {settings.METRICS_TOKEN}"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
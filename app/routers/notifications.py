@@ -1,29 +1,124 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+import json
+from collections import deque
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
-from .. import auth, crud, models, schemas
-from ..database import get_db
+from .. import auth, crud, schemas
+from ..database import SessionLocal, get_db
+from ..notification_hub import RESYNC, notification_hub
+from ..pagination import set_next_cursor
 
 router = APIRouter()
 
+KEEPALIVE_SECONDS = 25
+
+def _notifications_since(user_id: int, after_id: int) -> List[dict]:
+    db = SessionLocal()
+    try:
+        missed = []
+        while True:
+            batch = crud.get_notifications_since(db, user_id=user_id, after_id=after_id)
+            missed.extend(schemas.Notification.model_validate(n).model_dump(mode="json") for n in batch)
+            if len(batch) < 100:
+                return missed
+            after_id = batch[-1].id
+    finally:
+        db.close()
+
+@router.get("/stream")
+async def stream_notifications(
+    last_event_id: Optional[int] = Header(None),
+    after: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: schemas.CurrentUser = Depends(auth.get_current_active_user)
+):
+    """
+    Server-sent events with the user's notifications as they are created.
+    Reconnecting clients get everything after the Last-Event-ID header (or
+    the `after` query parameter) first. Broadcasts are pushed live only;
+    missed ones show up in GET /notifications/.
+    """
+    user_id = current_user.id
+    if last_event_id is None:
+        last_event_id = after
+    if last_event_id is None:
+        last_event_id = await run_in_threadpool(crud.get_latest_notification_id, db, user_id)
+    # The stream can stay open for hours, so don't hold on to the request's session.
+    await run_in_threadpool(db.close)
+    queue = await notification_hub.connect(user_id)
+
+    async def events():
+        last_id = last_event_id
+        # Pushed notifications can overlap with a catch-up read.
+        recent = deque(maxlen=256)
+        try:
+            pending = await run_in_threadpool(_notifications_since, user_id, last_id)
+            while True:
+                for notification in pending:
+                    if notification["id"] in recent:
+                        continue
+                    recent.append(notification["id"])
+                    last_id = max(last_id, notification["id"])
+                    yield f"id: {notification['id']}\nevent: notification\ndata: {json.dumps(notification)}\n\n"
+                try:
+                    item = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    pending = []
+                    continue
+                if item == RESYNC:
+                    pending = await run_in_threadpool(_notifications_since, user_id, last_id)
+                elif item.get("kind") == "broadcast":
+                    # No event id: broadcasts must not move the client's resume point.
+                    yield f"event: broadcast\ndata: {json.dumps({**item, 'user_id': user_id, 'is_read': False})}\n\n"
+                    pending = []
+                else:
+                    pending = [item]
+        finally:
+            await notification_hub.disconnect(user_id, queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @router.get("/", response_model=List[schemas.Notification])
 def get_user_notifications(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: schemas.CurrentUser = Depends(auth.get_current_active_user)
+):
+    """
+    Retrieve all notifications for the currently logged-in user. Pass the
+    X-Next-Cursor response header back as `cursor` to get the next page.
+    """
+    notifications = crud.get_notifications_for_user(db, user_id=current_user.id, skip=skip, limit=limit, cursor=cursor)
+    set_next_cursor(response, notifications, limit, lambda page: crud.notifications_cursor(page, cursor))
+    return notifications
+
+@router.post("/broadcasts/{broadcast_id}/read", response_model=schemas.Notification)
+def mark_broadcast_as_read(
+    broadcast_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
+    current_user: schemas.CurrentUser = Depends(auth.get_current_active_user)
 ):
     """
-    Retrieve all notifications for the currently logged-in user.
+    Mark a broadcast notification as read for the current user.
     """
-    return crud.get_notifications_for_user(db, user_id=current_user.id, skip=skip, limit=limit)
+    notification = crud.mark_broadcast_as_read(db, broadcast_id=broadcast_id, user_id=current_user.id)
+    if not notification:
+        raise HTTPException(status_code=404, detail="Notification not found")
+    return notification
 
 @router.post("/{notification_id}/read", response_model=schemas.Notification)
 def mark_as_read(
     notification_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
+    current_user: schemas.CurrentUser = Depends(auth.get_current_active_user)
 ):
     """
     Mark a specific notification as read.
@@ -11,4 +11,4 @@ def read_public_settings(db: Session = Depends(get_db)):
     """
     Retrieve the public CTF settings.
     """
-    return crud.get_settings(db)
+    return crud.get_cached_settings(db)
@@ -1,9 +1,10 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.orm import Session
 
 from .. import auth, crud, models, schemas
 from ..database import get_db
+from ..pagination import set_next_cursor
 
 router = APIRouter()
 
@@ -11,12 +12,12 @@ router = APIRouter()
 def create_team(
     team: schemas.TeamCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
+    current_user: models.User = Depends(auth.get_current_db_user)
 ):
     """
     Create a new team. The creator automatically joins the team.
     """
-    settings = crud.get_settings(db)
+    settings = crud.get_cached_settings(db)
     if not settings.allow_teams:
         raise HTTPException(status_code=403, detail="Team creation is currently disabled.")
 
@@ -35,24 +36,29 @@ def create_team(
     
     return crud.create_team(db=db, team=team, user=current_user)
 
-@router.get("/", response_model=List[schemas.Team])
+@router.get("/", response_model=List[schemas.TeamSummary])
 def read_teams(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
+    current_user: schemas.CurrentUser = Depends(auth.get_current_active_user)
 ):
     """
-    Retrieve all teams.
+    Retrieve all teams with member, solve and score totals; GET /teams/{id}
+    has the members and solves themselves. Pass the X-Next-Cursor response
+    header back as `cursor` to get the next page.
     """
-    teams = crud.get_teams(db, skip=skip, limit=limit)
+    teams = crud.get_team_summaries(db, skip=skip, limit=limit, cursor=cursor)
+    set_next_cursor(response, teams, limit, crud.id_cursor)
     return teams
 
 @router.get("/{team_id}", response_model=schemas.Team)
 def read_team(
     team_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
+    current_user: schemas.CurrentUser = Depends(auth.get_current_active_user)
 ):
     """
     Retrieve details for a specific team.
@@ -66,12 +72,12 @@ def read_team(
 def join_team(
     team_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
+    current_user: models.User = Depends(auth.get_current_db_user)
 ):
     """
     Join an existing team.
     """
-    settings = crud.get_settings(db)
+    settings = crud.get_cached_settings(db)
     if not settings.allow_teams:
         raise HTTPException(status_code=403, detail="Joining teams is currently disabled.")
 
@@ -81,16 +87,18 @@ def join_team(
             detail="You are already on a team. Leave your current team first."
         )
     
-    db_team = crud.get_team(db, team_id=team_id)
+    # Not get_team: its eager loads would run again when the commit below expires the team.
+    db_team = crud.get_team_by_id(db, team_id=team_id)
     if db_team is None:
         raise HTTPException(status_code=404, detail="Team not found")
         
-    return crud.add_user_to_team(db=db, user=current_user, team=db_team)
+    crud.add_user_to_team(db=db, user=current_user, team=db_team)
+    return crud.get_user_profile(db, user_id=current_user.id)
 
 @router.post("/leave", response_model=schemas.User)
 def leave_team(
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
+    current_user: models.User = Depends(auth.get_current_db_user)
 ):
     """
     Leave the current team.
@@ -101,4 +109,5 @@ def leave_team(
             detail="You are not on a team."
         )
     
-    return crud.remove_user_from_team(db=db, user=current_user)
+    crud.remove_user_from_team(db=db, user=current_user)
+    return crud.get_user_profile(db, user_id=current_user.id)
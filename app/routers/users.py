@@ -1,16 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
 from .. import auth, crud, models, schemas, email
 from ..database import get_db
+from ..hashing import password_hasher
 from ..limiter import limiter
 
 router = APIRouter()
 
-@router.post("/", response_model=schemas.User)
-@limiter.limit("5/hour")
-async def create_user(request: Request, user: schemas.UserCreate, db: Session = Depends(get_db)):
-    settings = crud.get_settings(db)
+def _check_registration(db: Session, user: schemas.UserCreate):
+    settings = crud.get_cached_settings(db)
     if not settings.allow_registrations:
         raise HTTPException(status_code=403, detail="Registrations are currently disabled.")
     if crud.get_user_by_email(db, email=user.email):
@@ -18,8 +18,20 @@ async def create_user(request: Request, user: schemas.UserCreate, db: Session =
     if crud.get_user_by_username(db, username=user.username):
         raise HTTPException(status_code=400, detail="Username already taken")
 
-    new_user = crud.create_user(db=db, user=user)
+def _register(db: Session, user: schemas.UserCreate, hashed_password: str) -> models.User:
+    new_user = crud.create_user(db=db, user=user, hashed_password=hashed_password)
     crud.create_audit_log(db=db, action="user_register", user_id=new_user.id, details={"username": new_user.username})
+    # Loaded here, so nothing lazy-loads on the event loop afterwards.
+    db.refresh(new_user)
+    return new_user
+
+@router.post("/", response_model=schemas.User)
+@limiter.limit("5/hour")
+async def create_user(request: Request, user: schemas.UserCreate, db: Session = Depends(get_db)):
+    # Only the hashing is awaited on the loop; the database work runs in the threadpool.
+    await run_in_threadpool(_check_registration, db, user)
+    hashed_password = await password_hasher.hash(user.password)
+    new_user = await run_in_threadpool(_register, db, user, hashed_password)
     await email.send_verification_email(email_to=new_user.email, username=new_user.username, token=new_user.verification_token)
     return new_user
 
@@ -29,12 +41,13 @@ def verify_user(token: str, db: Session = Depends(get_db)):
     if not db_user:
         raise HTTPException(status_code=404, detail="Verification token not found or invalid")
 
-    db_user.is_active = True
-    db_user.verification_token = None
-    db.commit()
+    crud.approve_user(db, user=db_user)
     crud.create_audit_log(db=db, action="user_verify_success", user_id=db_user.id)
     return {"message": "User verified successfully"}
 
 @router.get("/me", response_model=schemas.User)
-def read_users_me(current_user: models.User = Depends(auth.get_current_active_user)):
-    return current_user
+def read_users_me(db: Session = Depends(get_db), current_user: schemas.CurrentUser = Depends(auth.get_current_active_user)):
+    user = crud.get_user_profile(db, user_id=current_user.id)
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
+    return user
@@ -20,6 +20,8 @@ class ChallengeBase(BaseModel):
     minimum_points: Optional[int] = None
     decay_factor: Optional[int] = None
     is_visible: bool = False
+    warm_pool_low: Optional[int] = None
+    warm_pool_high: Optional[int] = None
 
 class SolveBase(BaseModel):
     user_id: int
@@ -56,10 +58,26 @@ class DynamicChallengeInstanceBase(BaseModel):
     port: int
     expires_at: datetime
 
+class BroadcastCreate(NotificationBase):
+    pass
+
 class AdminMassEmail(BaseModel):
     subject: str
     body: str
 
+class MassEmailProgress(BaseModel):
+    job_id: str
+    status: str
+    subject: str
+    total: int
+    sent: int
+    failed: int
+    batches: int
+    retries: int
+    started_at: str
+    finished_at: Optional[str] = None
+    error: Optional[str] = None
+
 # ==================================
 # Create & Update Schemas
 # ==================================
@@ -69,6 +87,22 @@ class TagCreate(TagBase):
 
 class ChallengeCreate(ChallengeBase):
     flag: str
+    tags: List[int] = []
+    dependencies: List[int] = []
+
+class ChallengeUpdate(BaseModel):
+    name: Optional[str] = None
+    description: Optional[str] = None
+    points: Optional[int] = None
+    flag: Optional[str] = None
+    initial_points: Optional[int] = None
+    minimum_points: Optional[int] = None
+    decay_factor: Optional[int] = None
+    is_visible: Optional[bool] = None
+    warm_pool_low: Optional[int] = None
+    warm_pool_high: Optional[int] = None
+    tags: Optional[List[int]] = None
+    dependencies: Optional[List[int]] = None
 
 class SolveCreate(SolveBase):
     pass
@@ -153,6 +187,20 @@ class ChallengeDetail(ChallengeBase):
     class Config:
         from_attributes = True
 
+class _ChallengeRef(BaseModel):
+    id: int
+    name: str
+    class Config:
+        from_attributes = True
+
+class AdminChallenge(ChallengeBase):
+    id: int
+    flag: str
+    tags: List[Tag] = []
+    dependencies: List[_ChallengeRef] = []
+    class Config:
+        from_attributes = True
+
 class Team(TeamBase):
     id: int
     members: List[_User] = []
@@ -160,6 +208,14 @@ class Team(TeamBase):
     class Config:
         from_attributes = True
 
+class TeamSummary(TeamBase):
+    id: int
+    member_count: int
+    score: int
+    solve_count: int
+    class Config:
+        from_attributes = True
+
 class User(UserBase):
     id: int
     score: int
@@ -171,6 +227,24 @@ class User(UserBase):
     class Config:
         from_attributes = True
 
+class CurrentUser(BaseModel):
+    """The authenticated principal, as cached by the auth layer."""
+    id: int
+    username: str
+    team_id: Optional[int] = None
+    is_active: bool
+    is_staff: bool
+    token_version: int = 0
+    class Config:
+        from_attributes = True
+
+class UserCacheStats(BaseModel):
+    size: int
+    max_size: int
+    hits: int
+    misses: int
+    hit_ratio: float
+
 class LeaderboardEntry(BaseModel):
     rank: int
     team_id: int
@@ -178,6 +252,22 @@ class LeaderboardEntry(BaseModel):
     total_score: int
     last_submission: Optional[datetime] = None
 
+class UserLeaderboardEntry(BaseModel):
+    rank: int
+    user_id: int
+    username: str
+    score: int
+    last_submission: Optional[datetime] = None
+
+class ScorePoint(BaseModel):
+    time: datetime
+    score: int
+
+class ScoreSeries(BaseModel):
+    id: int
+    name: str
+    points: List[ScorePoint] = []
+
 class CTFSetting(CTFSettingBase):
     id: int
     class Config:
@@ -196,9 +286,19 @@ class Notification(NotificationBase):
     user_id: int
     is_read: bool
     created_at: datetime
+    # "user" for notifications addressed to the user, "broadcast" for announcements to everyone
+    kind: str = "user"
     class Config:
         from_attributes = True
 
+class NotificationHubStats(BaseModel):
+    users: int
+    connections: int
+    subscribed: bool
+    delivered: int
+    resyncs: int
+    reconnects: int
+
 class _AuditLogUser(BaseModel):
     id: int
     username: str
@@ -214,6 +314,46 @@ class AuditLog(BaseModel):
     class Config:
         from_attributes = True
 
+class AuditLogFilter(BaseModel):
+    action: Optional[str] = None
+    user_id: Optional[int] = None
+    # Matched against details["challenge_id"]
+    challenge_id: Optional[int] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+
+class AuditLogWriterStats(BaseModel):
+    mode: str
+    buffer_depth: int = 0
+    retry_depth: int = 0
+    entries_written: int = 0
+    flushes: int = 0
+    flush_errors: int = 0
+    last_flush_seconds: float = 0.0
+    max_flush_seconds: float = 0.0
+    total_flush_seconds: float = 0.0
+    entries_dropped: int = 0
+    entries_dead_lettered: int = 0
+
+class PortRangeUsage(BaseModel):
+    host: str
+    start: int
+    end: int
+    size: int
+    leased: int
+    free: int
+    utilization: float
+
+class ReaperStats(BaseModel):
+    runs: int
+    skipped: int
+    reaped: int
+    stop_errors: int
+    last_run_at: Optional[datetime] = None
+    last_reaped: int
+    last_run_seconds: float
+    max_run_seconds: float
+
 class DynamicChallengeInstance(DynamicChallengeInstanceBase):
     id: int
     user_id: int
@@ -221,6 +361,26 @@ class DynamicChallengeInstance(DynamicChallengeInstanceBase):
     class Config:
         from_attributes = True
 
+class InstanceJob(BaseModel):
+    id: int
+    action: str
+    status: str
+    challenge_id: int
+    instance_id: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    instance: Optional[DynamicChallengeInstance] = None
+    class Config:
+        from_attributes = True
+
+class InstanceJobRunnerStats(BaseModel):
+    workers: int
+    submitted: int
+    ready: int
+    failed: int
+    in_flight: int
+
 # Update forward references
 Team.update_forward_refs()
 User.update_forward_refs()
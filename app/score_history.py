@@ -0,0 +1,128 @@
+import itertools
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from sqlalchemy.orm import Session
+
+from . import models
+from .cache import get_redis
+
+# Series are stored pre-bucketed at every supported resolution (in seconds).
+# Each bucket holds the cumulative score at the end of that bucket, so reading
+# a series costs the number of buckets, never the number of solves.
+RESOLUTIONS = (60, 300)
+KINDS = ("teams", "users")
+
+
+def _key(kind: str, member_id: int, resolution: int) -> str:
+    return f"ctf:history:{kind}:{resolution}:{member_id}"
+
+
+def _bucket(at: datetime, resolution: int) -> int:
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    ts = int(at.timestamp())
+    return ts - ts % resolution
+
+
+def record(kind: str, member_id: int, score: int, at: datetime, client=None):
+    """
+    Appends a point: `score` is the member's total after the change at `at`.
+    """
+    pipe = (client or get_redis()).pipeline(transaction=False)
+    queue(pipe, kind, member_id, score, at)
+    pipe.execute()
+
+
+def queue(pipe, kind: str, member_id: int, score: int, at: datetime):
+    """
+    Like `record`, but only adds the writes to `pipe`; the caller executes it.
+    """
+    for resolution in RESOLUTIONS:
+        pipe.hset(_key(kind, member_id, resolution), _bucket(at, resolution), score)
+
+
+def get_series(kind: str, member_ids: List[int], resolution: int) -> Dict[int, List[dict]]:
+    pipe = get_redis().pipeline(transaction=False)
+    for member_id in member_ids:
+        pipe.hgetall(_key(kind, member_id, resolution))
+    series = {}
+    for member_id, buckets in zip(member_ids, pipe.execute()):
+        series[member_id] = [
+            {"time": datetime.fromtimestamp(int(ts), tz=timezone.utc), "score": int(score)}
+            for ts, score in sorted(buckets.items(), key=lambda item: int(item[0]))
+        ]
+    return series
+
+
+def _staging_key(kind: str, member_id: int, resolution: int) -> str:
+    return f"ctf:history-staging:{kind}:{resolution}:{member_id}"
+
+
+# Replaces KEYS[1] with the rebuilt KEYS[2], keeping the buckets from ARGV[1]
+# on: those were recorded live while the backfill ran and are newer than it.
+_SWAP_SCRIPT = """
+local live = redis.call('HGETALL', KEYS[1])
+for i = 1, #live, 2 do
+    if tonumber(live[i]) >= tonumber(ARGV[1]) then
+        redis.call('HSET', KEYS[2], live[i], live[i + 1])
+    end
+end
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('RENAME', KEYS[2], KEYS[1])
+else
+    redis.call('DEL', KEYS[1])
+end
+"""
+
+
+def _swap(client, kind: str, member_id: int, buckets: Dict[int, dict], started: datetime):
+    pipe = client.pipeline(transaction=False)
+    for resolution in RESOLUTIONS:
+        staging = _staging_key(kind, member_id, resolution)
+        pipe.delete(staging)
+        if buckets.get(resolution):
+            pipe.hset(staging, mapping=buckets[resolution])
+        pipe.eval(_SWAP_SCRIPT, 2, _key(kind, member_id, resolution), staging, _bucket(started, resolution))
+    pipe.execute()
+
+
+def backfill(db: Session, batch_size: int = 1000) -> int:
+    """
+    Rebuilds every series from the solves table, one member at a time: each
+    member's buckets are written to staging keys and swapped in atomically, so
+    readers never see a missing series and points recorded while the backfill
+    runs survive it. Team series follow current team membership, like the
+    leaderboard. Returns the number of solves processed.
+    """
+    started = datetime.now(timezone.utc)
+    client = get_redis()
+    rebuilt = set()
+    processed = 0
+    for kind, member_column in (("users", models.Solve.user_id), ("teams", models.User.team_id)):
+        rows = db.query(member_column, models.Challenge.points, models.Solve.created_at).join(
+            models.User, models.User.id == models.Solve.user_id
+        ).join(models.Challenge, models.Challenge.id == models.Solve.challenge_id).filter(member_column.isnot(None)).order_by(
+            member_column, models.Solve.created_at, models.Solve.id
+        ).yield_per(batch_size)
+        for member_id, member_rows in itertools.groupby(rows, key=lambda row: row[0]):
+            total = 0
+            buckets = {resolution: {} for resolution in RESOLUTIONS}
+            for _, points, created_at in member_rows:
+                total += points
+                for resolution in RESOLUTIONS:
+                    buckets[resolution][_bucket(created_at, resolution)] = total
+                if kind == "users":
+                    processed += 1
+            _swap(client, kind, member_id, buckets, started)
+            rebuilt.update(_key(kind, member_id, resolution) for resolution in RESOLUTIONS)
+
+    # Series of members that no longer have solves (or a team) keep only their live points.
+    for key in client.scan_iter(match="ctf:history:*", count=1000):
+        key = key.decode() if isinstance(key, bytes) else key
+        if key in rebuilt:
+            continue
+        _, _, kind, resolution, member_id = key.split(":")
+        if kind in KINDS and int(resolution) in RESOLUTIONS:
+            _swap(client, kind, int(member_id), {}, started)
+    return processed
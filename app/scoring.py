@@ -0,0 +1,135 @@
+import math
+from datetime import datetime, timezone
+from typing import Optional
+
+import redis
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import leaderboard, models, score_history
+from .cache import get_redis, invalidation_bus
+
+DYNAMIC = "dynamic"
+# Version bumped whenever challenge values change; part of the challenge ETags.
+CHALLENGE_POINTS_TOPIC = "challenge-points"
+
+
+def is_dynamic(initial_points: Optional[int], minimum_points: Optional[int], decay_factor: Optional[int]) -> bool:
+    """
+    A challenge scores dynamically only when all of its decay parameters are set.
+    """
+    return initial_points is not None and minimum_points is not None and bool(decay_factor)
+
+
+def dynamic_value(initial_points: int, minimum_points: int, decay_factor: int, solve_count: int) -> int:
+    """
+    Quadratic decay: the first solver gets `initial_points` and the value reaches
+    `minimum_points` after `decay_factor` further solves.
+    """
+    if solve_count <= 1:
+        return initial_points
+    value = ((minimum_points - initial_points) / (decay_factor ** 2)) * ((solve_count - 1) ** 2) + initial_points
+    return max(minimum_points, math.ceil(value))
+
+
+def apply_dynamic_solve(db: Session, challenge_id: int, user_id: int, initial_points: int, minimum_points: int, decay_factor: int) -> tuple:
+    """
+    Re-values a challenge after a new solve has been flushed, inside the caller's
+    transaction. Every earlier solver's score moves by the change in value with
+    one UPDATE, however many solvers there are.
+
+    Returns (points for the new solver, change in value for earlier solvers).
+    """
+    # Serialises concurrent solves of the same challenge on PostgreSQL.
+    old_value = db.query(models.Challenge.points).filter(models.Challenge.id == challenge_id).with_for_update().scalar()
+    solve_count = db.query(func.count(models.Solve.id)).filter(models.Solve.challenge_id == challenge_id).scalar()
+    new_value = dynamic_value(initial_points, minimum_points, decay_factor, solve_count)
+    delta = new_value - old_value
+    if delta:
+        db.query(models.Challenge).filter(models.Challenge.id == challenge_id).update({models.Challenge.points: new_value}, synchronize_session=False)
+        earlier_solvers = select(models.Solve.user_id).where(models.Solve.challenge_id == challenge_id, models.Solve.user_id != user_id)
+        db.query(models.User).filter(models.User.id.in_(earlier_solvers)).update(
+            {models.User.score: models.User.score + delta}, synchronize_session=False
+        )
+    return new_value, delta
+
+
+def get_earlier_solvers(db: Session, challenge_id: int, exclude_user_id: int) -> list:
+    """
+    The (user_id, team_id) of everyone who solved a challenge besides `exclude_user_id`.
+    """
+    return [tuple(row) for row in db.query(models.Solve.user_id, models.User.team_id).join(
+        models.User, models.User.id == models.Solve.user_id
+    ).filter(models.Solve.challenge_id == challenge_id, models.Solve.user_id != exclude_user_id).all()]
+
+
+def publish_value_change(challenge_id: int, solvers: list, delta: int):
+    """
+    Moves every earlier solver (and their team) on the leaderboard after a
+    challenge changed value, and adds the new totals to their score history.
+    `solvers` comes from get_earlier_solvers. All ranking updates go out in one
+    Redis pipeline, the history points in a second one.
+    """
+    team_deltas = {}
+    for _, team_id in solvers:
+        if team_id is not None:
+            team_deltas[team_id] = team_deltas.get(team_id, 0) + delta
+    try:
+        client = get_redis()
+        pipe = client.pipeline(transaction=False)
+        for user_id, _ in solvers:
+            leaderboard.users.record(user_id, delta, client=pipe)
+        for team_id, team_delta in team_deltas.items():
+            leaderboard.teams.record(team_id, team_delta, client=pipe)
+        totals = pipe.execute()
+        now = datetime.now(timezone.utc)
+        members = [("users", user_id) for user_id, _ in solvers] + [("teams", team_id) for team_id in team_deltas]
+        pipe = client.pipeline(transaction=False)
+        for (kind, member_id), total in zip(members, totals):
+            score_history.queue(pipe, kind, member_id, total, now)
+        pipe.execute()
+    except redis.RedisError as e:
+        print(f"WARNING: Failed to apply value change of challenge {challenge_id} to the leaderboard: {e}")
+
+
+def rescore(db: Session, scoring_mode: str) -> dict:
+    """
+    Recomputes dynamic challenge values from their solve counts (or, in static
+    mode, puts back the values admins set), then every user's score from the
+    current challenge values, using set-based statements, and finally rebuilds
+    the leaderboard.
+    """
+    updated_challenges = 0
+    if scoring_mode == DYNAMIC:
+        solve_counts = select(models.Solve.challenge_id, func.count(models.Solve.id).label("solve_count")).group_by(models.Solve.challenge_id).subquery()
+        rows = db.query(
+            models.Challenge.id, models.Challenge.initial_points, models.Challenge.minimum_points,
+            models.Challenge.decay_factor, func.coalesce(solve_counts.c.solve_count, 0)
+        ).outerjoin(solve_counts, solve_counts.c.challenge_id == models.Challenge.id).all()
+        values = [
+            {"id": challenge_id, "points": dynamic_value(initial, minimum, decay, count)}
+            for challenge_id, initial, minimum, decay, count in rows
+            if is_dynamic(initial, minimum, decay)
+        ]
+        if values:
+            db.bulk_update_mappings(models.Challenge, values)
+        updated_challenges = len(values)
+    else:
+        updated_challenges = db.query(models.Challenge).filter(
+            models.Challenge.static_points.isnot(None), models.Challenge.points != models.Challenge.static_points
+        ).update({models.Challenge.points: models.Challenge.static_points}, synchronize_session=False)
+
+    solved_points = select(func.coalesce(func.sum(models.Challenge.points), 0)).select_from(models.Solve).join(
+        models.Challenge, models.Challenge.id == models.Solve.challenge_id
+    ).where(models.Solve.user_id == models.User.id).scalar_subquery()
+    updated_users = db.query(models.User).update({models.User.score: solved_points}, synchronize_session=False)
+    db.commit()
+    if updated_challenges:
+        invalidation_bus.bump(CHALLENGE_POINTS_TOPIC)
+    try:
+        counts = leaderboard.rebuild(db)
+    except redis.RedisError as e:
+        # The new scores are committed; the next rebuild catches the leaderboard up.
+        print(f"WARNING: Failed to rebuild the leaderboard after rescoring: {e}")
+        counts = None
+    return {"challenges": updated_challenges, "users": updated_users, "leaderboard": counts}
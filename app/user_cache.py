@@ -0,0 +1,68 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from . import schemas
+from .cache import invalidation_bus
+from .config import settings
+
+
+class UserCache:
+    """
+    Bounded LRU cache of resolved users with a TTL, so most authenticated
+    requests need no database query. Entries are dropped on every worker when
+    a user's team, activation or staff status changes (see invalidate_user).
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> Optional[schemas.CurrentUser]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, user: schemas.CurrentUser):
+        with self._lock:
+            self._entries[user.id] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        total = self.hits + self.misses
+        return {"size": size, "max_size": self.max_size, "hits": self.hits, "misses": self.misses, "hit_ratio": self.hits / total if total else 0.0}
+
+
+user_cache = UserCache(max_size=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL)
+invalidation_bus.subscribe_prefix("user:", lambda topic, version: user_cache.invalidate(int(topic.split(":", 1)[1])))
+# If pub/sub reconnects we may have missed invalidations, so start over.
+invalidation_bus.subscribe("reconnect", lambda version: user_cache.clear())
+
+
+def invalidate_user(user_id: int):
+    """
+    Drops a user's cached entry on every worker.
+    """
+    invalidation_bus.publish(f"user:{user_id}")
@@ -0,0 +1,52 @@
+"""
+Compares per-row audit log writes with the buffered AuditLogWriter.
+
+Usage: python -m benchmarks.bench_audit [--entries N]
+"""
+import argparse
+import time
+
+from benchmarks.common import SessionLocal, reset_schema
+from app import models
+from app.audit import AuditLogWriter
+
+
+def per_row(entries: int) -> float:
+    db = SessionLocal()
+    start = time.perf_counter()
+    for i in range(entries):
+        db.add(models.AuditLog(action="flag_submit_incorrect", user_id=None, details={"challenge_id": 1, "submission": f"flag{{{i}}}"}))
+        db.commit()
+    elapsed = time.perf_counter() - start
+    db.close()
+    return elapsed
+
+
+def buffered(entries: int, batch_size: int) -> tuple:
+    writer = AuditLogWriter(batch_size=batch_size, flush_interval=0.5)
+    start = time.perf_counter()
+    for i in range(entries):
+        writer.record("flag_submit_incorrect", details={"challenge_id": 1, "submission": f"flag{{{i}}}"})
+    enqueue = time.perf_counter() - start
+    writer.shutdown()
+    return enqueue, time.perf_counter() - start, writer.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    reset_schema()
+    elapsed = per_row(args.entries)
+    print(f"per-row commit   {args.entries / elapsed:>10.0f} entries/s")
+
+    reset_schema()
+    enqueue, total, stats = buffered(args.entries, args.batch_size)
+    print(f"buffered enqueue {args.entries / enqueue:>10.0f} entries/s")
+    print(f"buffered drained {args.entries / total:>10.0f} entries/s  flushes={stats['flushes']} max_flush={stats['max_flush_seconds'] * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
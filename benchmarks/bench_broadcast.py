@@ -0,0 +1,74 @@
+"""
+Cost of notifying every user: one notification row per user (fan-out on
+write) against a single stored broadcast (fan-out on read).
+
+Per-user rows are written for a sample of users and extrapolated to the full
+user count. Redis publishing is switched off so only database work is timed.
+
+Usage: python -m benchmarks.bench_broadcast [--users N] [--sample N] [--reads N]
+"""
+import argparse
+import random
+from unittest import mock
+
+from sqlalchemy import func, insert
+
+from benchmarks.common import SessionLocal, reset_schema, statement_counter, summarize, timed
+from app import crud, models, schemas
+
+
+def seed(count: int):
+    reset_schema()
+    db = SessionLocal()
+    rows = [{"username": f"bench{i}", "email": f"bench{i}@example.com", "hashed_password": "x"} for i in range(count)]
+    for i in range(0, count, 5000):
+        db.execute(insert(models.User), rows[i:i + 5000])
+    db.commit()
+    db.close()
+
+
+def row_count(db, model) -> int:
+    return db.query(func.count()).select_from(model).scalar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--sample", type=int, default=1000, help="users that get a per-user row")
+    parser.add_argument("--reads", type=int, default=500)
+    args = parser.parse_args()
+
+    seed(args.users)
+    db = SessionLocal()
+    user_ids = [user_id for (user_id,) in db.query(models.User.id)]
+    sample = user_ids[:args.sample]
+
+    with mock.patch.object(crud, "publish_notification"), mock.patch.object(crud, "publish_broadcast"):
+        with statement_counter.measure() as counter:
+            _, elapsed = timed(lambda: [crud.create_notification(db, user_id, "Maintenance", "Scoreboard freezes in 1h") for user_id in sample])
+        scale = len(user_ids) / len(sample)
+        print(f"{'per-user rows':<28} {len(sample)} users in {elapsed:.2f}s -> ~{elapsed * scale:.1f}s and ~{counter.count * scale:.0f} statements for {len(user_ids)} users")
+
+        with statement_counter.measure() as counter:
+            _, elapsed = timed(crud.create_broadcast, db, schemas.BroadcastCreate(title="Maintenance", body="Scoreboard freezes in 1h"))
+        print(f"{'broadcast':<28} {len(user_ids)} users in {elapsed * 1000:.1f}ms, {counter.count} statements")
+
+    # A few users mark the broadcast as read; the rest have no row at all.
+    broadcast_id = db.query(func.max(models.BroadcastNotification.id)).scalar()
+    for user_id in random.sample(user_ids, min(len(user_ids), 200)):
+        crud.mark_broadcast_as_read(db, broadcast_id, user_id)
+
+    for label, pool in (("read (has personal rows)", sample), ("read (broadcast only)", user_ids[args.sample:] or sample)):
+        samples = []
+        with statement_counter.measure() as counter:
+            for _ in range(args.reads):
+                _, elapsed = timed(crud.get_notifications_for_user, db, random.choice(pool))
+                samples.append(elapsed)
+        summarize(label, samples, counter.count / args.reads)
+
+    print(f"rows: notifications={row_count(db, models.Notification)} broadcast_notifications={row_count(db, models.BroadcastNotification)} broadcast_reads={row_count(db, models.BroadcastRead)}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Measures bcrypt verification throughput and event-loop stalls for logins run
+inline on the event loop versus in the PasswordHasher process pool.
+
+Usage: python -m benchmarks.bench_hashing [--logins N] [--workers N]
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from app import security
+from app.hashing import HashingBusy, PasswordHasher
+
+
+async def _measure_loop_lag(stop: asyncio.Event) -> float:
+    """Returns the worst delay seen by a 10ms ticker while the load runs."""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        worst = max(worst, time.perf_counter() - start - 0.01)
+    return worst
+
+
+async def run(label: str, verify, logins: int, hashed: str):
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(_measure_loop_lag(stop))
+    rejected = 0
+    start = time.perf_counter()
+
+    async def login():
+        nonlocal rejected
+        try:
+            assert await verify("correct horse", hashed)
+        except HashingBusy:
+            rejected += 1
+
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    lag = await lag_task
+    print(f"{label:<22} {(logins - rejected) / elapsed:>8.1f} logins/s  worst loop stall={lag * 1000:.0f}ms  rejected={rejected}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    hashed = security.get_password_hash("correct horse")
+
+    async def inline(plain, hashed_password):
+        return security.verify_password(plain, hashed_password)
+
+    await run("inline on event loop", inline, args.logins, hashed)
+
+    hasher = PasswordHasher(workers=args.workers, max_pending=args.logins)
+    await hasher.verify("warm up", hashed)  # start the worker processes outside the timing
+    await run(f"process pool ({args.workers})", hasher.verify, args.logins, hashed)
+
+    small = PasswordHasher(workers=args.workers, max_pending=args.workers * 2)
+    await small.verify("warm up", hashed)
+    await run("bounded queue (2x)", small.verify, args.logins, hashed)
+    hasher.shutdown()
+    small.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
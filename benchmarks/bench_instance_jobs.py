@@ -0,0 +1,100 @@
+"""
+Start throughput for a burst of simultaneous dynamic instance starts: the
+blocking start route (container started inside the request) versus queuing a
+lifecycle job and returning 202.
+
+Requests run on a thread pool the size of Starlette's default threadpool, as
+sync routes do. Container starts use the FakeContainerBackend with a delay.
+
+Usage: python -m benchmarks.bench_instance_jobs [--requests N] [--start-delay S] [--job-workers N]
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from benchmarks.common import SessionLocal, reset_schema, seed_users, summarize
+from app import crud, docker_service, instance_jobs, models
+from app.docker_service import FakeContainerBackend
+from app.instance_jobs import InstanceJobRunner
+from app.instance_pool import WarmPoolManager
+
+REQUEST_THREADS = 40
+
+
+def setup(count: int):
+    reset_schema()
+    db = SessionLocal()
+    challenge = models.Challenge(name="bench", description="d", points=100, flag="f", is_visible=True)
+    db.add(challenge)
+    db.commit()
+    user_ids = [user.id for user in seed_users(db, count)]
+    challenge_id = challenge.id
+    db.close()
+    return user_ids, challenge_id
+
+
+def burst(label: str, handle, user_ids: list) -> list:
+    """Fires one request per user at once. Returns per-request latencies."""
+    def timed_request(user_id):
+        start = time.perf_counter()
+        handle(user_id)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=REQUEST_THREADS) as requests:
+        latencies = list(requests.map(timed_request, user_ids))
+    summarize(f"{label} (response)", latencies, 0)
+    return latencies
+
+
+def blocking(user_ids: list, challenge_id: int, backend):
+    def handle(user_id):
+        db = SessionLocal()
+        try:
+            container = docker_service.launch_container(challenge_id, "bench", backend)
+            crud.create_instance(db, user_id=user_id, challenge_id=challenge_id, container_id=container["container_id"], ip_address=container["host"], port=container["port"], expires_at=datetime.utcnow() + instance_jobs.INSTANCE_LIFETIME)
+        finally:
+            db.close()
+
+    start = time.perf_counter()
+    burst("blocking start", handle, user_ids)
+    elapsed = time.perf_counter() - start
+    print(f"  all {len(user_ids)} instances running after {elapsed:.2f}s ({len(user_ids) / elapsed:.1f} starts/s)")
+
+
+def queued(user_ids: list, challenge_id: int, backend, workers: int):
+    runner = InstanceJobRunner(backend, pool=WarmPoolManager(backend), workers=workers)
+
+    def handle(user_id):
+        db = SessionLocal()
+        try:
+            runner.submit(crud.create_instance_job(db, user_id=user_id, challenge_id=challenge_id, action=instance_jobs.START))
+        finally:
+            db.close()
+
+    start = time.perf_counter()
+    burst("queued job", handle, user_ids)
+    runner.shutdown(wait=True)
+    elapsed = time.perf_counter() - start
+    db = SessionLocal()
+    ready = db.query(models.InstanceJob).filter(models.InstanceJob.status == instance_jobs.READY).count()
+    db.close()
+    print(f"  {ready}/{len(user_ids)} instances ready after {elapsed:.2f}s ({ready / elapsed:.1f} starts/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--start-delay", type=float, default=0.5)
+    parser.add_argument("--job-workers", type=int, default=64)
+    args = parser.parse_args()
+
+    user_ids, challenge_id = setup(args.requests)
+    blocking(user_ids, challenge_id, FakeContainerBackend(start_delay=args.start_delay))
+
+    user_ids, challenge_id = setup(args.requests)
+    queued(user_ids, challenge_id, FakeContainerBackend(start_delay=args.start_delay), args.job_workers)
+
+
+if __name__ == "__main__":
+    main()
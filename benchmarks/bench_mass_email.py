@@ -0,0 +1,90 @@
+"""
+Mass email throughput against a local SMTP sink (requires aiosmtpd).
+
+Compares one connection and one message per recipient (how the verification
+email is sent) with the MassMailer's pooled, batched sending.
+
+Usage: python -m benchmarks.bench_mass_email [--recipients N] [--baseline N]
+"""
+import argparse
+import asyncio
+import time
+
+from aiosmtpd.controller import Controller
+from sqlalchemy import insert
+
+from benchmarks.common import SessionLocal, reset_schema
+from app import models
+from app.email import MassMailer, SMTPConnectionPool
+
+HOST, PORT = "127.0.0.1", 8025
+
+
+class Sink:
+    def __init__(self):
+        self.recipients = 0
+        self.messages = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.recipients += len(envelope.rcpt_tos)
+        self.messages += 1
+        return "250 OK"
+
+
+def seed(count: int):
+    reset_schema()
+    db = SessionLocal()
+    rows = [{"username": f"bench{i}", "email": f"bench{i}@example.com", "hashed_password": "x"} for i in range(count)]
+    for i in range(0, count, 5000):
+        db.execute(insert(models.User), rows[i:i + 5000])
+    db.commit()
+    db.close()
+
+
+async def per_recipient(count: int, sink: Sink):
+    mailer = MassMailer()
+    message = mailer._build_message("Benchmark", "<p>hello</p>")
+    sink.recipients = 0
+    start = time.perf_counter()
+    for i in range(count):
+        pool = SMTPConnectionPool(1, HOST, PORT)
+        async with pool.connection() as client:
+            await client.send_message(message, recipients=[f"bench{i}@example.com"])
+        await pool.close()
+    elapsed = time.perf_counter() - start
+    print(f"{'connection per recipient':<32} {sink.recipients:>6} recipients in {elapsed:6.2f}s  {sink.recipients / elapsed:>8.0f}/s")
+
+
+async def pooled(label: str, sink: Sink, pool_size: int, batch_size: int):
+    mailer = MassMailer(pool_factory=lambda: SMTPConnectionPool(pool_size, HOST, PORT), batch_size=batch_size)
+    sink.recipients = sink.messages = 0
+    start = time.perf_counter()
+    job_id = mailer.start("Benchmark", "<p>hello</p>", mailer.count_recipients())
+    await mailer.wait()
+    elapsed = time.perf_counter() - start
+    progress = mailer.get_progress(job_id)
+    print(f"{label:<32} {progress['sent']:>6} recipients in {elapsed:6.2f}s  {progress['sent'] / elapsed:>8.0f}/s  ({sink.messages} SMTP transactions)")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recipients", type=int, default=50000)
+    parser.add_argument("--baseline", type=int, default=1000, help="recipients for the per-recipient baseline")
+    args = parser.parse_args()
+
+    seed(args.recipients)
+    sink = Sink()
+    controller = Controller(sink, hostname=HOST, port=PORT)
+    controller.start()
+    try:
+        await per_recipient(args.baseline, sink)
+        await pooled("pool=1 batch=1", sink, 1, 1)
+        await pooled("pool=4 batch=1", sink, 4, 1)
+        await pooled("pool=4 batch=50", sink, 4, 50)
+        await pooled("pool=8 batch=100", sink, 8, 100)
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
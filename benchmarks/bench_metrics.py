@@ -0,0 +1,103 @@
+"""
+Per-request cost of the Prometheus instrumentation.
+
+Times a bare ASGI endpoint with and without MetricsMiddleware, SQL statements
+on an in-memory SQLite engine with and without the metrics listeners, and a
+real request through app.main:app for scale. Needs no services.
+
+Usage: python -m benchmarks.bench_metrics [--requests N]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import create_engine, text
+
+import benchmarks.common  # noqa: F401 (falls back to SQLite)
+from app import metrics
+
+
+async def _endpoint(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def _receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def _send(message):
+    pass
+
+
+def time_asgi(app, requests: int) -> float:
+    """Mean seconds per request."""
+    scope = {"type": "http", "method": "POST", "path": "/challenges/7/submit", "route": object(), "path_params": {"challenge_id": 7}}
+
+    async def run():
+        start = time.perf_counter()
+        for _ in range(requests):
+            await app(dict(scope), _receive, _send)
+        return (time.perf_counter() - start) / requests
+
+    return asyncio.run(run())
+
+
+def time_statements(instrumented: bool, statements: int) -> float:
+    """Mean seconds per statement."""
+    engine = create_engine("sqlite://")
+    if instrumented:
+        metrics.instrument_engine(engine)
+    token = metrics._request_stats.set(metrics.RequestStats())
+    try:
+        with engine.connect() as conn:
+            query = text("SELECT 1")
+            start = time.perf_counter()
+            for _ in range(statements):
+                conn.execute(query)
+            return (time.perf_counter() - start) / statements
+    finally:
+        metrics._request_stats.reset(token)
+
+
+def time_app_request(requests: int) -> float:
+    """Median seconds for GET / (no database or Redis) through the whole app."""
+    import httpx
+    from app.main import app
+
+    async def run():
+        samples = []
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await client.get("/")
+            for _ in range(requests):
+                start = time.perf_counter()
+                await client.get("/")
+                samples.append(time.perf_counter() - start)
+        return statistics.median(samples)
+
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    bare = min(time_asgi(_endpoint, args.requests) for _ in range(3))
+    wrapped = min(time_asgi(metrics.MetricsMiddleware(_endpoint), args.requests) for _ in range(3))
+    plain_sql = min(time_statements(False, args.requests) for _ in range(3))
+    instrumented_sql = min(time_statements(True, args.requests) for _ in range(3))
+    request = time_app_request(min(args.requests, 2000))
+
+    middleware_cost = wrapped - bare
+    statement_cost = instrumented_sql - plain_sql
+    print(f"{'middleware':<24} {bare * 1e6:8.2f}us -> {wrapped * 1e6:8.2f}us per request (+{middleware_cost * 1e6:.2f}us)")
+    print(f"{'SQL listeners':<24} {plain_sql * 1e6:8.2f}us -> {instrumented_sql * 1e6:8.2f}us per statement (+{statement_cost * 1e6:.2f}us)")
+    print(f"{'GET /':<24} {request * 1e6:8.2f}us median through app.main:app")
+    print(f"{'overhead':<24} {middleware_cost / request:8.2%} of that request, plus {statement_cost * 1e6:.2f}us per statement")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+OFFSET pagination against keyset (cursor) pagination on audit_logs.
+
+Fetches one page at increasing depths both ways. OFFSET pages get slower the
+deeper they are, because the database still walks every skipped row; cursor
+pages should cost the same at any depth. The timings are for information:
+what is checked is the plan of the statement get_audit_logs sends for the
+deepest cursor page, which must be a range scan of the (timestamp, id) index
+(ix_audit_logs_timestamp_id, or its per-partition copies on PostgreSQL)
+without a sort or a full scan. Exits non-zero otherwise.
+
+Usage: python -m benchmarks.bench_pagination [--rows N] [--limit N] [--repeat N]
+"""
+import argparse
+import json
+import sys
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event, insert
+
+from benchmarks.common import SessionLocal, engine, reset_schema, statement_counter, summarize, timed
+from app import crud, models
+from app.pagination import encode_cursor
+
+INDEX = "ix_audit_logs_timestamp_id"
+
+
+def seed(count: int):
+    reset_schema()
+    db = SessionLocal()
+    start = datetime.now(timezone.utc) - timedelta(seconds=count)
+    rows = [{"action": "bench", "details": {"i": i}, "timestamp": start + timedelta(seconds=i)} for i in range(count)]
+    for i in range(0, count, 10000):
+        db.execute(insert(models.AuditLog), rows[i:i + 10000])
+    db.commit()
+    db.close()
+
+
+def cursor_at(db, depth: int) -> str:
+    # The cursor a client would hold after paging down to `depth` rows.
+    row = db.query(models.AuditLog).order_by(models.AuditLog.timestamp.desc(), models.AuditLog.id.desc()).offset(depth - 1).first()
+    return encode_cursor(**crud.audit_logs_cursor([row]))
+
+
+def measure(label: str, fn, repeat: int):
+    samples = []
+    with statement_counter.measure() as counter:
+        for _ in range(repeat):
+            _, elapsed = timed(fn)
+            samples.append(elapsed)
+    summarize(label, samples, counter.count / repeat)
+
+
+def last_statement(fn) -> tuple:
+    """Runs `fn` and returns the (statement, parameters) it sent last."""
+    sent = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        sent.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    return sent[-1]
+
+
+def _plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", ()):
+        yield from _plan_nodes(child)
+
+
+def check_plan(db, statement: str, parameters) -> tuple:
+    """
+    Returns (plan as text, whether it is an index range scan with no sort).
+    """
+    conn = db.connection()
+    if engine.dialect.name == "postgresql":
+        plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        nodes = list(_plan_nodes(plan[0]["Plan"]))
+        ok = (
+            any(node["Node Type"] in ("Index Scan", "Index Only Scan") and "Index Cond" in node for node in nodes)
+            and not any(node["Node Type"] in ("Seq Scan", "Sort") for node in nodes)
+        )
+        return json.dumps(plan, indent=2), ok
+    rows = [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+    # "SEARCH ... USING INDEX ix (timestamp<?)" is a range scan; "SCAN" walks the whole index or table.
+    ok = any(detail.startswith("SEARCH") and f"USING INDEX {INDEX} (" in detail for detail in rows) and not any(
+        detail.startswith("SCAN") or "TEMP B-TREE" in detail for detail in rows
+    )
+    return "\n".join(rows), ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    seed(args.rows)
+    db = SessionLocal()
+    depths = [d for d in (0, args.rows // 100, args.rows // 10, args.rows // 2, args.rows - args.limit) if d >= 0]
+    for depth in depths:
+        measure(f"offset depth={depth}", lambda: crud.get_audit_logs(db, skip=depth, limit=args.limit), args.repeat)
+        cursor = cursor_at(db, depth) if depth else None
+        measure(f"cursor depth={depth}", lambda: crud.get_audit_logs(db, limit=args.limit, cursor=cursor), args.repeat)
+
+    statement, parameters = last_statement(lambda: crud.get_audit_logs(db, limit=args.limit, cursor=cursor))
+    plan, ok = check_plan(db, statement, parameters)
+    db.close()
+    print(f"plan of the deepest cursor page:\n{plan}")
+    if not ok:
+        sys.exit(f"cursor pages are not served by a range scan of {INDEX}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Statements per request for the team and user endpoints.
+
+Sends real requests through app.main:app with a TestClient and counts every
+statement sent to the database while each is handled: authentication, the
+route's queries, lazy loads during serialization and any writes. Exits
+non-zero if any endpoint goes over its cap, so an N+1 regression fails loudly.
+The "lazy loading" rows serialize plain queries with the same response
+schemas, for comparison.
+
+Runs against DATABASE_URL or a throwaway SQLite file, with an in-process
+fakeredis (pip install fakeredis).
+
+Usage: python -m benchmarks.bench_queries [--teams N] [--members N]
+"""
+import argparse
+import sys
+from typing import List
+
+from pydantic import TypeAdapter
+
+from benchmarks.common import SessionLocal, reset_schema, statement_counter, use_fakeredis
+from app import crud, models, schemas
+
+# Statements allowed per request, independent of how many rows it returns.
+CAPS = {
+    "GET /teams/": 2,
+    "GET /teams/{id}": 6,
+    "GET /users/me": 7,
+    "GET /admin/users/pending": 7,
+    "POST /teams/{id}/join": 11,
+    "POST /teams/leave": 10,
+}
+
+
+def seed(team_count: int, members: int, challenge_count: int = 10) -> dict:
+    """Returns the ids of an admin, a player without a team and a team member."""
+    reset_schema()
+    db = SessionLocal()
+    crud.get_settings(db)
+    challenges = [models.Challenge(name=f"c{i}", description="d", points=100, flag="f", is_visible=True) for i in range(challenge_count)]
+    badge = models.Badge(name="First Blood", description="d")
+    admin = models.User(username="admin", email="admin@example.com", hashed_password="x", is_active=True, is_staff=True)
+    loner = models.User(username="loner", email="loner@example.com", hashed_password="x", is_active=True, score=300)
+    db.add_all(challenges + [badge, admin, loner])
+    db.flush()
+    db.add_all(models.Solve(user_id=loner.id, challenge_id=c.id) for c in challenges[:3])
+    member_id = None
+    for t in range(team_count):
+        team = models.Team(name=f"team{t}")
+        db.add(team)
+        db.flush()
+        for m in range(members):
+            user = models.User(username=f"u{t}-{m}", email=f"u{t}-{m}@example.com", hashed_password="x", is_active=(m > 0), team_id=team.id, score=300)
+            db.add(user)
+            db.flush()
+            db.add_all(models.Solve(user_id=user.id, challenge_id=c.id, team_id=team.id) for c in challenges[m:m + 3])
+            db.add(models.UserBadge(user_id=user.id, badge_id=badge.id))
+            if t == 0 and m == 1:
+                member_id = user.id
+    db.commit()
+    ids = {"admin": admin.id, "loner": loner.id, "member": member_id}
+    db.close()
+    return ids
+
+
+def headers(user_id: int) -> dict:
+    from app import auth
+
+    db = SessionLocal()
+    try:
+        token = auth.create_user_access_token(db.get(models.User, user_id))
+    finally:
+        db.close()
+    return {"Authorization": f"Bearer {token}"}
+
+
+def report(label: str, statements: int) -> bool:
+    cap = CAPS.get(label)
+    status = "(lazy loading)" if cap is None else f"cap={cap:<3} {'ok' if statements <= cap else 'OVER CAP'}"
+    print(f"{label:<36} statements={statements:<5} {status}")
+    return cap is None or statements <= cap
+
+
+def request(client, label: str, method: str, url: str, user_id: int) -> bool:
+    auth_headers = headers(user_id)
+    with statement_counter.measure() as counter:
+        response = client.request(method, url, headers=auth_headers)
+    if response.status_code != 200:
+        sys.exit(f"{label}: {response.status_code} {response.text}")
+    return report(label, counter.count)
+
+
+def lazy(label: str, load, schema):
+    db = SessionLocal()
+    try:
+        with statement_counter.measure() as counter:
+            TypeAdapter(schema).validate_python(load(db), from_attributes=True)
+    finally:
+        db.close()
+    report(label, counter.count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--teams", type=int, default=100)
+    parser.add_argument("--members", type=int, default=4)
+    args = parser.parse_args()
+
+    use_fakeredis()
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    ids = seed(args.teams, args.members)
+    lazy("GET /teams/ (before)", lambda db: db.query(models.Team).order_by(models.Team.id).limit(100).all(), List[schemas.Team])
+    lazy("GET /users/me (before)", lambda db: db.get(models.User, ids["member"]), schemas.User)
+    lazy("GET /admin/users/pending (before)", lambda db: db.query(models.User).filter(models.User.is_active == False).limit(100).all(), List[schemas.User])
+
+    with TestClient(app) as client:
+        # Warms the per-worker caches (settings, users) a live worker would already have.
+        client.get("/settings/public")
+        for user_id in ids.values():
+            client.get("/users/me", headers=headers(user_id))
+        results = [
+            request(client, "GET /teams/", "GET", "/teams/", ids["member"]),
+            request(client, "GET /teams/{id}", "GET", "/teams/1", ids["member"]),
+            request(client, "GET /users/me", "GET", "/users/me", ids["member"]),
+            request(client, "GET /admin/users/pending", "GET", "/admin/users/pending", ids["admin"]),
+            request(client, "POST /teams/{id}/join", "POST", "/teams/1/join", ids["loner"]),
+            request(client, "POST /teams/leave", "POST", "/teams/leave", ids["loner"]),
+        ]
+    if not all(results):
+        sys.exit("statement cap exceeded")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Times the set-based re-valuation of a dynamic challenge as its solver count grows.
+
+Usage: python -m benchmarks.bench_scoring [--solvers N]
+"""
+import argparse
+
+from benchmarks.common import SessionLocal, reset_schema, seed_users, statement_counter, summarize, timed
+from app import models, scoring
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--solvers", type=int, default=2000)
+    args = parser.parse_args()
+
+    reset_schema()
+    db = SessionLocal()
+    challenge = models.Challenge(name="dyn", description="d", points=500, flag="f", is_visible=True, initial_points=500, minimum_points=100, decay_factor=args.solvers)
+    db.add(challenge)
+    db.commit()
+    users = seed_users(db, args.solvers)
+
+    samples, statements, checkpoints = [], 0, {}
+    for i, user in enumerate(users, start=1):
+        db.add(models.Solve(user_id=user.id, challenge_id=challenge.id))
+        db.flush()
+        with statement_counter.measure() as counter:
+            _, elapsed = timed(scoring.apply_dynamic_solve, db, challenge.id, user.id, 500, 100, args.solvers)
+        db.commit()
+        statements += counter.count
+        samples.append(elapsed)
+        if i in (10, 100, 1000, args.solvers):
+            checkpoints[i] = elapsed
+    summarize("apply_dynamic_solve", samples, statements / len(samples))
+    for solvers, elapsed in checkpoints.items():
+        print(f"  solve #{solvers:<6} {elapsed * 1000:.3f}ms")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
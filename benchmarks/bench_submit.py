@@ -0,0 +1,72 @@
+"""
+Compares the legacy flag submission call sequence with crud.submit_flag.
+
+Usage: python -m benchmarks.bench_submit [--users N]
+"""
+import argparse
+
+from benchmarks.common import SessionLocal, reset_schema, seed_users, statement_counter, summarize, timed
+from app import crud, models, security
+
+
+def legacy_submit(db, user, challenge_id: int, flag: str) -> str:
+    """The call sequence submit_flag used before the single-transaction service."""
+    crud.get_settings(db)
+    challenge = crud.get_challenge(db, challenge_id=challenge_id, user_id=user.id)
+    if challenge is None or not challenge.is_visible:
+        return crud.SUBMIT_NOT_FOUND
+    if challenge.is_locked:
+        return crud.SUBMIT_LOCKED
+    if crud.has_user_solved_challenge(db, user_id=user.id, challenge_id=challenge_id):
+        return crud.SUBMIT_ALREADY_SOLVED
+    if not security.compare_flags(flag, challenge.flag):
+        crud.create_audit_log(db=db, action="flag_submit_incorrect", user_id=user.id, details={"challenge_id": challenge.id, "submission": flag})
+        return crud.SUBMIT_INCORRECT
+    crud.create_audit_log(db=db, action="flag_submit_correct", user_id=user.id, details={"challenge_id": challenge.id, "submission": flag})
+    crud.create_solve(db=db, user=user, challenge=challenge)
+    crud.update_user_score(db=db, user=user, points=challenge.points)
+    if crud.get_solve_count_for_challenge(db, challenge_id=challenge_id) == 1:
+        badge = crud.get_badge_by_name(db, name="First Blood")
+        if badge and crud.award_badge_to_user(db=db, user=user, badge=badge):
+            crud.create_notification(db=db, user_id=user.id, title="New Badge Earned!", body=f"You earned the '{badge.name}' badge for '{challenge.name}'.")
+    return crud.SUBMIT_CORRECT
+
+
+def run(name: str, submit, user_count: int):
+    reset_schema()
+    db = SessionLocal()
+    crud.get_settings(db)
+    db.add(models.Badge(name="First Blood", description="First solve of a challenge"))
+    base = models.Challenge(name="base", description="d", points=100, flag="flag{base}", is_visible=True)
+    target = models.Challenge(name="target", description="d", points=200, flag="flag{target}", is_visible=True, dependencies=[base])
+    db.add_all([base, target])
+    db.commit()
+    users = seed_users(db, user_count)
+    for user in users:
+        db.add(models.Solve(user_id=user.id, challenge_id=base.id))
+    db.commit()
+    target_id = target.id
+
+    for label, flag in (("incorrect", "flag{nope}"), ("correct", "flag{target}")):
+        samples, statements = [], 0
+        for user in users:
+            with statement_counter.measure() as counter:
+                result, elapsed = timed(submit, db, user, target_id, flag)
+            statements += counter.count
+            samples.append(elapsed)
+            expected = crud.SUBMIT_CORRECT if label == "correct" else crud.SUBMIT_INCORRECT
+            assert result == expected, result
+        summarize(f"{name} ({label})", samples, statements / len(users))
+    db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=500)
+    args = parser.parse_args()
+    run("legacy", legacy_submit, args.users)
+    run("crud.submit_flag", lambda db, user, cid, flag: crud.submit_flag(db, user=user, challenge_id=cid, flag=flag), args.users)
+
+
+if __name__ == "__main__":
+    main()
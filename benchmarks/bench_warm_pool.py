@@ -0,0 +1,50 @@
+"""
+Compares instance start latency with and without a warm pool, using the
+in-process FakeContainerBackend to simulate slow container starts.
+
+Usage: python -m benchmarks.bench_warm_pool [--starts N] [--start-delay S]
+"""
+import argparse
+import time
+
+from benchmarks.common import reset_schema, summarize
+from app.docker_service import FakeContainerBackend, launch_container
+from app.instance_pool import WarmPoolManager
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--starts", type=int, default=40)
+    parser.add_argument("--start-delay", type=float, default=0.2)
+    parser.add_argument("--low", type=int, default=5)
+    parser.add_argument("--high", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between player starts")
+    args = parser.parse_args()
+
+    reset_schema()
+    backend = FakeContainerBackend(start_delay=args.start_delay)
+    cold = []
+    for _ in range(args.starts // 4):
+        start = time.perf_counter()
+        launch_container(1, "bench", backend)
+        cold.append(time.perf_counter() - start)
+    summarize("cold start", cold, 0)
+
+    manager = WarmPoolManager(backend, refill_workers=8)
+    manager.configure(1, "bench", args.low, args.high)
+    while manager.stats()[0]["ready"] < args.high:
+        time.sleep(0.01)
+    warm = []
+    for _ in range(args.starts):
+        start = time.perf_counter()
+        container = manager.acquire(1) or launch_container(1, "bench", backend)
+        warm.append(time.perf_counter() - start)
+        time.sleep(args.interval)
+    summarize("warm pool", warm, 0)
+    stats = manager.stats()[0]
+    print(f"  handed out={stats['handed_out']} misses={stats['misses']} ready={stats['ready']}")
+    manager.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Benchmarks run against DATABASE_URL when it is set, otherwise against a
+throwaway SQLite file so they can be run without any services.
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+
+from sqlalchemy import event
+
+from app import models
+from app.database import Base, SessionLocal, engine
+
+
+def reset_schema():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+class StatementCounter:
+    """Counts statements sent to the database while active."""
+
+    def __init__(self):
+        self.count = 0
+        self.active = False
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.active:
+            self.count += 1
+
+    @contextmanager
+    def measure(self):
+        self.count = 0
+        self.active = True
+        try:
+            yield self
+        finally:
+            self.active = False
+
+
+statement_counter = StatementCounter()
+event.listen(engine, "before_cursor_execute", statement_counter._on_execute)
+
+
+def use_fakeredis():
+    """
+    Points the app at an in-process fakeredis (pip install fakeredis). Must run
+    before app.main is imported: the limiter reads REDIS_URL at import.
+    """
+    os.environ["REDIS_URL"] = "memory://"
+    try:
+        import fakeredis
+        import fakeredis.aioredis
+    except ImportError:
+        sys.exit("this benchmark needs fakeredis without Redis: pip install fakeredis")
+    from app import cache
+    server = fakeredis.FakeServer()
+    cache._redis_client = fakeredis.FakeRedis(server=server)
+    cache._async_redis_client = fakeredis.aioredis.FakeRedis(server=server)
+
+
+def seed_users(db, count: int, prefix: str = "bench") -> list:
+    users = [
+        models.User(username=f"{prefix}{i}", email=f"{prefix}{i}@example.com", hashed_password="x", is_active=True)
+        for i in range(count)
+    ]
+    db.add_all(users)
+    db.commit()
+    return users
+
+
+def percentile(sorted_samples: list, q: float) -> float:
+    return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * q))]
+
+
+def summarize(name: str, samples: list, statements: float):
+    samples = sorted(samples)
+    p99 = percentile(samples, 0.99)
+    print(
+        f"{name:<28} n={len(samples):<6} statements/op={statements:<6.1f} "
+        f"mean={statistics.mean(samples) * 1000:.3f}ms p50={statistics.median(samples) * 1000:.3f}ms "
+        f"p99={p99 * 1000:.3f}ms"
+    )
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
@@ -0,0 +1,16 @@
+"""
+The tests drive the app with the benchmarks' helpers, against DATABASE_URL or
+a throwaway SQLite file and an in-process fakeredis (pip install fakeredis).
+
+Run from the repository root: python -m pytest tests
+"""
+import os
+
+# The audit writer flushes on its own thread; keep it from adding statements to a counted request.
+os.environ.setdefault("AUDIT_LOG_FLUSH_INTERVAL", "3600")
+os.environ.setdefault("HASHING_WORKERS", "0")
+
+from benchmarks.common import use_fakeredis
+
+# Must run before app.main is imported.
+use_fakeredis()
@@ -0,0 +1,23 @@
+"""
+The deepest cursor page of the audit log must be a range scan of the
+(timestamp, id) index, without a sort or a full scan, as checked by
+benchmarks/bench_pagination.py.
+"""
+from benchmarks.bench_pagination import INDEX, check_plan, cursor_at, last_statement, seed
+from benchmarks.common import SessionLocal
+from app import crud
+
+ROWS = 5000
+LIMIT = 100
+
+
+def test_deepest_cursor_page_uses_index_range_scan():
+    seed(ROWS)
+    db = SessionLocal()
+    try:
+        cursor = cursor_at(db, ROWS - LIMIT)
+        statement, parameters = last_statement(lambda: crud.get_audit_logs(db, limit=LIMIT, cursor=cursor))
+        plan, ok = check_plan(db, statement, parameters)
+    finally:
+        db.close()
+    assert ok, f"cursor pages are not served by a range scan of {INDEX}:\n{plan}"
@@ -0,0 +1,41 @@
+"""
+Statement caps per request for the team and user endpoints, as reported by
+benchmarks/bench_queries.py, so an N+1 regression fails the suite.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks.bench_queries import CAPS, headers, seed
+from benchmarks.common import statement_counter
+from app.main import app
+
+# In order: the loner joins a team and then leaves it again.
+REQUESTS = [
+    ("GET /teams/", "GET", "/teams/", "member"),
+    ("GET /teams/{id}", "GET", "/teams/1", "member"),
+    ("GET /users/me", "GET", "/users/me", "member"),
+    ("GET /admin/users/pending", "GET", "/admin/users/pending", "admin"),
+    ("POST /teams/{id}/join", "POST", "/teams/1/join", "loner"),
+    ("POST /teams/leave", "POST", "/teams/leave", "loner"),
+]
+
+
+@pytest.fixture(scope="module")
+def client():
+    ids = seed(team_count=20, members=4)
+    with TestClient(app) as client:
+        # Warms the per-worker caches (settings, users) a live worker would already have.
+        client.get("/settings/public")
+        for user_id in ids.values():
+            client.get("/users/me", headers=headers(user_id))
+        client.ids = ids
+        yield client
+
+
+@pytest.mark.parametrize("label, method, url, user", REQUESTS, ids=[r[0] for r in REQUESTS])
+def test_statement_cap(client, label, method, url, user):
+    auth_headers = headers(client.ids[user])
+    with statement_counter.measure() as counter:
+        response = client.request(method, url, headers=auth_headers)
+    assert response.status_code == 200, response.text
+    assert counter.count <= CAPS[label], f"{label} sent {counter.count} statements (cap {CAPS[label]})"